@@ -0,0 +1,157 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from settings import Settings
+
+ASSET_ID = re.compile(r"^[0-9a-f]{32}(\.[a-z0-9]{1,8})?$")
+
+
+@dataclass
+class Asset:
+    id: str
+    path: str
+    size: int
+    media_type: str
+
+    @property
+    def etag(self) -> str:
+        # The id is the content hash, so the ETag is strong
+        return f'"{self.id.split(".")[0]}"'
+
+
+class AssetStore:
+    """
+    Content-addressed store for generated image and audio bytes.
+
+    Each asset is saved once under the BLAKE2b digest of its bytes, in
+    ``root/ab/cd/<digest>.<ext>`` shards so no directory grows unbounded.
+    The least recently used assets are deleted once the store exceeds
+    ``max_bytes``. The index is rebuilt from disk by ``load()``, oldest
+    files first, so assets survive restarts; the app loads it on startup,
+    and a store used before that loads itself on first access.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, Asset]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._loaded = False
+
+    def _path(self, asset_id: str) -> str:
+        return os.path.join(self.root, asset_id[:2], asset_id[2:4], asset_id)
+
+    def load(self) -> None:
+        """Create the store directory and index the assets already in it"""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if ASSET_ID.match(name):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+        for _, asset_id, size in sorted(found):
+            self._add(asset_id, size)
+
+    def _add(self, asset_id: str, size: int) -> Asset:
+        media_type = mimetypes.guess_type(asset_id)[0] or "application/octet-stream"
+        asset = Asset(asset_id, self._path(asset_id), size, media_type)
+        self._index[asset_id] = asset
+        self._bytes += size
+        return asset
+
+    def get(self, asset_id: str) -> Optional[Asset]:
+        if not self._loaded:
+            self.load()
+        asset = self._index.get(asset_id)
+        if asset is None:
+            self.misses += 1
+            return None
+        self._index.move_to_end(asset_id)
+        self.hits += 1
+        return asset
+
+    def __contains__(self, asset_id: str) -> bool:
+        if not self._loaded:
+            self.load()
+        return asset_id in self._index
+
+    async def put(self, data: bytes, media_type: Optional[str] = None) -> Optional[Asset]:
+        """Store bytes and return their asset; None if they can never fit"""
+        if not self._loaded:
+            self.load()
+        if len(data) > self.max_bytes:
+            return None
+        extension = mimetypes.guess_extension((media_type or "").split(";")[0].strip()) or ""
+        asset_id = hashlib.blake2b(data, digest_size=16).hexdigest() + extension
+        if asset_id in self._index:
+            return self.get(asset_id)
+
+        path = self._path(asset_id)
+
+        def write():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers never see a partially written file, and concurrent
+            # writers of the same bytes each use their own temporary file
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        await asyncio.to_thread(write)
+        if asset_id in self._index:
+            # A concurrent put of the same bytes finished first
+            return self.get(asset_id)
+        asset = self._add(asset_id, len(data))
+        await self._evict()
+        return asset
+
+    async def _evict(self) -> None:
+        doomed = []
+        while self._bytes > self.max_bytes and self._index:
+            _, asset = self._index.popitem(last=False)
+            self._bytes -= asset.size
+            self.evictions += 1
+            doomed.append(asset.path)
+        if doomed:
+            await asyncio.to_thread(self._remove_files, doomed)
+
+    @staticmethod
+    def _remove_files(paths) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        if not self._loaded:
+            self.load()
+        return {
+            "assets": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def create_asset_store(settings: Optional[Settings] = None) -> Optional[AssetStore]:
+    """Opt-in: keep generated bytes on disk only when ASSET_STORE_DIR is set"""
+    settings = settings or Settings()
+    root = settings.asset_store_dir
+    return AssetStore(root, settings.asset_store_max_bytes) if root else None
@@ -0,0 +1,71 @@
+"""
+Hit ratio of plain LRU vs TinyLFU admission on a replayed Zipfian trace.
+
+The trace mixes repeat traffic drawn from a Zipf distribution over a fixed
+set of prompts with one-off prompts that are never requested again, which
+is what our generation traffic looks like. Each lookup that misses inserts
+the key, as the generation endpoints do.
+
+    python benchmarks/cache_admission.py [--requests 200000] [--one-off 0.5] [--json]
+"""
+from itertools import accumulate
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import InMemoryCache  # noqa: E402
+
+
+def zipf_trace(requests: int, keys: int, skew: float, one_off: float, seed: int):
+    rng = random.Random(seed)
+    weights = list(accumulate(1 / rank ** skew for rank in range(1, keys + 1)))
+    trace = []
+    for i in range(requests):
+        if rng.random() < one_off:
+            trace.append(f"one-off:{i}")
+        else:
+            trace.append(f"hot:{rng.choices(range(keys), cum_weights=weights)[0]}")
+    return trace
+
+
+def replay(trace, capacity: int, admission: str) -> float:
+    cache = InMemoryCache(max_entries=capacity, max_bytes=1 << 40, admission=admission)
+    for key in trace:
+        if cache.get(key) is None:
+            cache.set(key, True)
+    return cache.stats()["hit_ratio"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=50_000, help="distinct repeatable prompts")
+    parser.add_argument("--skew", type=float, default=0.9, help="Zipf exponent")
+    parser.add_argument("--one-off", type=float, default=0.5, help="share of never-repeated prompts")
+    parser.add_argument("--capacities", default="500,1000,5000")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    trace = zipf_trace(args.requests, args.keys, args.skew, args.one_off, args.seed)
+    results = []
+    for capacity in map(int, args.capacities.split(",")):
+        lru = replay(trace, capacity, "lru")
+        tinylfu = replay(trace, capacity, "tinylfu")
+        results.append({"capacity": capacity, "lru": round(lru, 4), "tinylfu": round(tinylfu, 4)})
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}, indent=2))
+        return
+    print(f"{args.requests} requests, {args.keys} repeatable keys, skew {args.skew}, {args.one_off:.0%} one-off")
+    print(f"{'capacity':>10} {'LRU':>8} {'TinyLFU':>8}")
+    for row in results:
+        print(f"{row['capacity']:>10} {row['lru']:>8.2%} {row['tinylfu']:>8.2%}")
+
+
+if __name__ == "__main__":
+    main()
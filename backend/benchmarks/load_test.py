@@ -0,0 +1,252 @@
+"""
+Throughput and tail latency of the generation endpoints under concurrent
+load, against a local stand-in for the Pollinations services.
+
+Starts benchmarks/mock_pollinations.py and the backend (uvicorn, one
+worker) as subprocesses, then drives each scenario with --concurrency
+clients for --duration seconds. A share of prompts (--repeat) comes from a
+small hot set so the caches see realistic reuse. Reports RPS, latency
+percentiles, result-cache and response-cache hit ratios, and the server's
+RSS growth; --json/--output give machine-readable results for comparing
+runs.
+
+    python benchmarks/load_test.py [--scenarios image,text,audio,batch] [--concurrency 32]
+        [--duration 10] [--latency-ms 50] [--error-rate 0.01] [--json] [--output run.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("image", "text", "audio", "batch")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with {process.returncode}")
+            try:
+                await http.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+class Workload:
+    """Request bodies for a scenario, mixing hot (repeated) and unique prompts"""
+
+    def __init__(self, scenario: str, repeat: float, hot_prompts: int, batch_size: int, seed: int):
+        self.scenario = scenario
+        self.repeat = repeat
+        self.hot_prompts = hot_prompts
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.unique = 0
+
+    def prompt(self) -> str:
+        if self.rng.random() < self.repeat:
+            return f"a lighthouse at dusk, variation {self.rng.randrange(self.hot_prompts)}"
+        self.unique += 1
+        return f"a one-off scene number {self.unique} {self.rng.random()}"
+
+    def item(self, kind: str) -> Dict[str, Any]:
+        return {"prompt": self.prompt()} if kind != "text" else {"prompt": f"explain {self.prompt()}"}
+
+    def request(self):
+        if self.scenario == "batch":
+            kinds = ("image", "text", "audio")
+            items = [{"type": kinds[i % 3], **self.item(kinds[i % 3])} for i in range(self.batch_size)]
+            return "/api/batch", {"requests": items}
+        return f"/api/generate/{self.scenario}", self.item(self.scenario)
+
+
+async def drive(base_url: str, workload: Workload, concurrency: int, duration: float, headers: Dict[str, str]):
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(http: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            path, body = workload.request()
+            started = time.perf_counter()
+            try:
+                response = await http.post(path, json=body, headers=headers)
+                outcome = str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def cache_counts(health: Dict[str, Any]):
+    result = health["cache"]
+    responses = health["response_cache"]
+    return result["l1_hits"] + result["l2_hits"], result["misses"], responses["hits"], responses["misses"]
+
+
+def ratio(hits: int, misses: int) -> Optional[float]:
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+async def run_scenario(base_url: str, pid: int, scenario: str, args, headers: Dict[str, str]) -> Dict[str, Any]:
+    workload = Workload(scenario, args.repeat, args.hot_prompts, args.batch_size, args.seed)
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        before = cache_counts((await http.get("/health")).json())
+    rss_start = rss_kb(pid)
+
+    latencies, statuses, elapsed = await drive(base_url, workload, args.concurrency, args.duration, headers)
+
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        after = cache_counts((await http.get("/health")).json())
+    rss_end = rss_kb(pid)
+    delta = [b - a for a, b in zip(before, after)]
+    latencies.sort()
+    ok = statuses.get("200", 0)
+    return {
+        "scenario": scenario,
+        "requests": len(latencies),
+        "ok": ok,
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "cache_hit_ratio": ratio(delta[0], delta[1]),
+        "response_cache_hit_ratio": ratio(delta[2], delta[3]),
+        "rss_start_kb": rss_start,
+        "rss_end_kb": rss_end,
+        "rss_growth_kb": rss_end - rss_start if rss_start is not None and rss_end is not None else None,
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    mock_port, backend_port = free_port(), free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    base_url = f"http://127.0.0.1:{backend_port}"
+    env = {
+        **os.environ,
+        "POLLINATIONS_IMAGE_URL": mock_url,
+        "POLLINATIONS_TEXT_URL": mock_url,
+        # Measure the service, not the per-client limits
+        "RATE_LIMIT_ENABLED": "false",
+        "BACKEND_API_KEY": "",
+        "CACHE_REDIS_URL": "",
+        "RATE_LIMIT_REDIS_URL": "",
+    }
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "mock_pollinations.py"),
+        "--port", str(mock_port), "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--payload-bytes", str(args.payload_bytes),
+    ], env=env)
+    backend = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+        "--log-level", "warning", "--no-access-log",
+    ], cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        await wait_ready(f"{mock_url}/__stats", mock)
+        await wait_ready(f"{base_url}/health", backend)
+        results = []
+        for scenario in args.scenarios.split(","):
+            results.append(await run_scenario(base_url, backend.pid, scenario, args, {}))
+        async with httpx.AsyncClient() as http:
+            upstream = (await http.get(f"{mock_url}/__stats")).json()
+    finally:
+        for process in (backend, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return {"params": vars(args), "upstream": upstream, "scenarios": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--repeat", type=float, default=0.8, help="share of requests drawn from the hot prompt set")
+    parser.add_argument("--hot-prompts", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50, help="mock upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock upstream requests failing with 503")
+    parser.add_argument("--payload-bytes", type=int, default=64 * 1024, help="mock image/audio size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{args.concurrency} clients, {args.duration:g}s per scenario, upstream {args.latency_ms:g}ms "
+          f"+/-{args.jitter_ms:g}ms, {args.error_rate:.0%} errors, {args.repeat:.0%} repeated prompts")
+    print(f"{'scenario':>9} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'ok':>7} {'hit':>6} {'resp':>6} {'rss+':>8}")
+    for row in result["scenarios"]:
+        latency = row["latency_ms"]
+        hit = f"{row['cache_hit_ratio']:.0%}" if row["cache_hit_ratio"] is not None else "-"
+        resp = f"{row['response_cache_hit_ratio']:.0%}" if row["response_cache_hit_ratio"] is not None else "-"
+        growth = f"{row['rss_growth_kb']}K" if row["rss_growth_kb"] is not None else "-"
+        print(f"{row['scenario']:>9} {row['rps']:>8.1f} {latency['p50']:>7.1f}m {latency['p95']:>7.1f}m "
+              f"{latency['p99']:>7.1f}m {row['ok']:>7} {hit:>6} {resp:>6} {growth:>8}")
+
+
+if __name__ == "__main__":
+    main()
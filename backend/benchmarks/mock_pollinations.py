@@ -0,0 +1,96 @@
+"""
+Local stand-in for image.pollinations.ai and text.pollinations.ai with
+configurable latency, error rate and payload size, for load tests.
+
+Serves GET/HEAD /prompt/{prompt} (image bytes), GET /TextToSpeech (audio
+bytes) and GET /{prompt} (text; with stream=true an OpenAI-style event
+stream, one word per event). Point the backend at it with
+POLLINATIONS_IMAGE_URL and POLLINATIONS_TEXT_URL.
+
+    python benchmarks/mock_pollinations.py [--port 9100] [--latency-ms 50] [--error-rate 0.01]
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+def create_mock_app(latency_ms: float = 50, jitter_ms: float = 10, error_rate: float = 0.0,
+                    payload_bytes: int = 64 * 1024, seed: int = 1, token_delay_ms: float = 0) -> Starlette:
+    rng = random.Random(seed)
+    payload = bytes(rng.getrandbits(8) for _ in range(min(payload_bytes, 4096)))
+    payload = (payload * (payload_bytes // max(len(payload), 1) + 1))[:payload_bytes]
+    counts = {"requests": 0, "errors": 0}
+
+    async def upstream_delay() -> bool:
+        """Sleep like the real service; True when this request should fail"""
+        counts["requests"] += 1
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if rng.random() < error_rate:
+            counts["errors"] += 1
+            return True
+        return False
+
+    async def image(request: Request):
+        if await upstream_delay():
+            return PlainTextResponse("upstream overloaded", status_code=503)
+        body = b"" if request.method == "HEAD" else payload
+        return Response(body, media_type="image/jpeg", headers={"content-length": str(len(payload))})
+
+    async def speech(request: Request):
+        if await upstream_delay():
+            return PlainTextResponse("upstream overloaded", status_code=503)
+        return Response(payload, media_type="audio/mpeg")
+
+    async def text(request: Request):
+        if await upstream_delay():
+            return PlainTextResponse("upstream overloaded", status_code=503)
+        prompt = request.path_params["prompt"]
+        words = [f"{prompt}-{i}" for i in range(max(1, payload_bytes // 64))]
+        if request.query_params.get("stream") != "true":
+            return PlainTextResponse(" ".join(words))
+
+        async def events():
+            for i, word in enumerate(words):
+                chunk = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_delay_ms / 1000)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def stats(request: Request):
+        return JSONResponse(counts)
+
+    return Starlette(routes=[
+        Route("/__stats", stats),
+        Route("/prompt/{prompt:path}", image, methods=["GET", "HEAD"]),
+        Route("/TextToSpeech", speech),
+        Route("/{prompt:path}", text),
+    ])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--token-delay-ms", type=float, default=0, help="pause between streamed text tokens")
+    args = parser.parse_args()
+
+    app = create_mock_app(args.latency_ms, args.jitter_ms, args.error_rate, args.payload_bytes,
+                          token_delay_ms=args.token_delay_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
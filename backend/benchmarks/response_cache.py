@@ -0,0 +1,103 @@
+"""
+Per-request cost of a repeated /api/generate/text request, answered from
+the full-response cache versus today's path (validation, dependencies,
+endpoint and JSON encoding over a fresh result-cache hit).
+
+Requests are driven straight through the ASGI app, with no server or
+HTTP client in the way, so the numbers isolate the application's work.
+
+    python benchmarks/response_cache.py [--requests 20000] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.pop("BACKEND_API_KEY", None)
+# Text from the local templates: the benchmark must not depend on the network
+os.environ.setdefault("TEXT_UPSTREAM", "false")
+
+import main as api  # noqa: E402
+
+BODY = json.dumps({"prompt": "explain how response caching works", "model": "openai"}).encode()
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "POST",
+    "scheme": "http",
+    "path": "/api/generate/text",
+    "raw_path": b"/api/generate/text",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(BODY)).encode())],
+    "client": ("127.0.0.1", 50000),
+    "server": ("bench", 80),
+}
+
+
+async def request() -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": BODY, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await api.app(dict(SCOPE), receive, send)
+    return status
+
+
+async def measure(requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await request()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def run(requests: int):
+    api.app.state.response_cache.enabled = False
+    # Warm the result cache so every timed request is a fresh hit
+    for _ in range(2):
+        assert await request() == 200
+    endpoint = await measure(requests)
+
+    api.app.state.response_cache.enabled = True
+    for _ in range(2):
+        await request()
+    hits_before = api.app.state.response_cache.hits
+    cached = await measure(requests)
+    assert api.app.state.response_cache.hits - hits_before == requests, "response cache was not hit"
+    return {
+        "requests": requests,
+        "endpoint_us_per_request": round(endpoint, 1),
+        "response_cache_us_per_request": round(cached, 1),
+        "speedup": round(endpoint / cached, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['requests']} repeated /api/generate/text requests")
+    print(f"  endpoint path (result-cache hit): {result['endpoint_us_per_request']:>8.1f} us/request")
+    print(f"  response-cache hit:               {result['response_cache_us_per_request']:>8.1f} us/request")
+    print(f"  speedup:                          {result['speedup']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Encode time and payload size of an /api/batch response.
+
+"before" is FastAPI's previous default path for an untyped result
+(jsonable_encoder, then stdlib json through JSONResponse). "orjson" is the
+typed path the endpoint now takes (BatchResponse validation and dump, then
+ORJSONResponse); "msgpack" is the same with Accept: application/msgpack.
+
+    python benchmarks/serialization.py [--items 10,100,1000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import main as api  # noqa: E402
+from serialization import MsgPackResponse, ORJSONResponse  # noqa: E402
+
+
+def batch_payload(items: int):
+    timestamp = datetime.utcnow().isoformat()
+    shapes = [
+        {
+            "url": "https://image.pollinations.ai/prompt/a%20lighthouse%20at%20dusk?width=1024&height=1024&seed={i}",
+            "metadata": {"model": "flux", "dimensions": "1024x1024", "seed": None, "timestamp": timestamp},
+            "cache": "fresh",
+        },
+        {
+            "text": "Let me explain lighthouses in a clear and comprehensive way. " * 8,
+            "source": "enhanced_template",
+            "metadata": {"prompt_type": "explanation", "model": "openai", "timestamp": timestamp, "word_count": 80},
+            "cache": "miss",
+        },
+        {
+            "url": "/api/assets/{i}",
+            "asset_id": "{i}",
+            "metadata": {"voice": "alloy", "speed": 1.0, "format": "mp3", "text_length": 42, "timestamp": timestamp},
+            "cache": "stale",
+        },
+    ]
+    results = []
+    for i in range(items):
+        result = {k: v.format(i=i) if isinstance(v, str) else v for k, v in shapes[i % 3].items()}
+        results.append({"status": "success", "result": result})
+    return {"results": results}
+
+
+def time_per_call(encode, payload, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encode(payload)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def typed(payload):
+    return api.BatchResponse(**payload).model_dump(mode="json", exclude_unset=True)
+
+
+ENCODERS = {
+    "before": lambda payload: JSONResponse(jsonable_encoder(payload)).body,
+    "orjson": lambda payload: ORJSONResponse(typed(payload)).body,
+    "msgpack": lambda payload: MsgPackResponse(typed(payload)).body,
+}
+
+
+def run(sizes, budget: float):
+    results = []
+    for items in sizes:
+        payload = batch_payload(items)
+        # Same bytes before and after, so clients see no difference
+        assert json.loads(ENCODERS["before"](payload)) == json.loads(ENCODERS["orjson"](payload))
+        rounds = max(5, int(budget / max(items, 1)))
+        row = {"items": items}
+        for name, encode in ENCODERS.items():
+            row[f"{name}_us"] = round(time_per_call(encode, payload, rounds), 1)
+            row[f"{name}_bytes"] = len(encode(payload))
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", default="10,100,1000", help="batch sizes to encode")
+    parser.add_argument("--budget", type=float, default=20_000, help="items encoded per size and encoder")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run([int(n) for n in args.items.split(",")], args.budget)
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}, indent=2))
+        return
+    print(f"{'items':>6} {'before':>18} {'orjson':>18} {'msgpack':>18}")
+    for row in results:
+        cells = [f"{row[f'{name}_us']:>8.1f}us {row[f'{name}_bytes']:>7}B" for name in ENCODERS]
+        print(f"{row['items']:>6} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,452 @@
-from typing import Any, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
 import time
 
+from settings import Settings
+
+
+def _normalize(value: Any) -> Any:
+    """Normalize a parameter value so equivalent inputs hash identically"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_cache_key(modality: str, **params: Any) -> str:
+    """
+    Build a stable cache key for a generation request.
+
+    Parameters are normalized (None dropped, integral floats collapsed,
+    keys sorted) and digested with BLAKE2b, so the key is identical across
+    processes, restarts and workers. Callers apply their defaults first.
+    """
+    canonical = json.dumps(_normalize(params), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    digest = hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{modality}:{digest}"
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of recent key popularity for TinyLFU admission.
+
+    ``depth`` rows of counters saturating at 15 are indexed by double
+    hashing. Once ``sample_size`` accesses have been recorded every
+    counter is halved, so the estimates follow the recent workload instead
+    of all-time totals.
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, capacity: int, depth: int = 4):
+        self.width = 1 << max(4, (max(1, capacity) - 1).bit_length())
+        self.depth = depth
+        self.sample_size = 10 * self.width
+        self._table = bytearray(self.width * depth)
+        self._additions = 0
+        self.resets = 0
+
+    def _slots(self, key: str):
+        h = hash(key)
+        step = (h >> 32) | 1
+        mask = self.width - 1
+        return [row * self.width + ((h + row * step) & mask) for row in range(self.depth)]
+
+    def increment(self, key: str) -> None:
+        table = self._table
+        for slot in self._slots(key):
+            if table[slot] < self.MAX_COUNT:
+                table[slot] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._age()
+
+    def estimate(self, key: str) -> int:
+        table = self._table
+        return min(table[slot] for slot in self._slots(key))
+
+    def _age(self) -> None:
+        self._table = bytearray(count >> 1 for count in self._table)
+        self._additions //= 2
+        self.resets += 1
+
+
 class InMemoryCache:
-    def __init__(self):
-        self._cache = {}
-    
+    """
+    Bounded LRU cache with per-entry TTL.
+
+    Entries are evicted least-recently-used first once either the entry count
+    or the approximate byte budget is exceeded, and a background sweeper drops
+    expired entries that are never read again.
+
+    With ``admission="tinylfu"`` a full cache only admits a new key when a
+    frequency sketch estimates it to be more popular than the entry it would
+    evict, so one-off keys cannot flush out hot ones.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        sweep_interval: float = 60,
+        admission: str = "lru",
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.admission = admission.lower()
+        self._sketch = FrequencySketch(self.max_entries) if self.admission == "tinylfu" else None
+        # key -> (value, expiry, approximate size in bytes)
+        self._cache: "OrderedDict[str, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+
+    @staticmethod
+    def _estimate_size(key: str, value: Any) -> int:
+        """Approximate memory cost of an entry from its serialized form"""
+        try:
+            return len(key) + len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return len(key) + len(repr(value))
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+
     def get(self, key: str) -> Optional[Any]:
-        if key in self._cache:
-            value, expiry = self._cache[key]
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        entry = self._cache.get(key)
+        if entry is not None:
+            value, expiry, _ = entry
             if expiry is None or expiry > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
                 return value
-            del self._cache[key]
+            self._remove(key)
+            self.expirations += 1
+        self.misses += 1
         return None
-    
+
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        replacing = key in self._cache
+        if replacing:
+            self._remove(key)
+        size = self._estimate_size(key, value)
+        if size > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            return
+        if not replacing and not self._admit(key, size):
+            self.rejections += 1
+            return
         expiry = time.time() + ttl if ttl is not None else None
-        self._cache[key] = (value, expiry)
-    
+        self._cache[key] = (value, expiry, size)
+        self._bytes += size
+        while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._cache)))
+            self.evictions += 1
+
+    def _admit(self, key: str, size: int) -> bool:
+        """TinyLFU: a new key that would force an eviction must beat the LRU victim"""
+        if self._sketch is None or not self._cache:
+            return True
+        if len(self._cache) < self.max_entries and self._bytes + size <= self.max_bytes:
+            return True
+        victim = next(iter(self._cache))
+        return self._sketch.estimate(key) > self._sketch.estimate(victim)
+
     def delete(self, key: str) -> None:
         if key in self._cache:
-            del self._cache[key]
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry and return how many were removed"""
+        now = time.time()
+        expired = [key for key, (_, expiry, _) in self._cache.items() if expiry is not None and expiry <= now]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.purge_expired()
+
+    def start_sweeper(self) -> None:
+        """Start the periodic expiry sweep on the running event loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._cache
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "admission": self.admission,
+            "rejections": self.rejections,
+        }
+
+class CacheBackend(ABC):
+    """
+    Interface for a shared (L2) cache store.
+
+    Values must be JSON-serializable. TTLs are in seconds; ``get_many``
+    returns each found key with its remaining TTL (None for no expiry).
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: List[str]) -> Dict[str, Tuple[Any, Optional[float]]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisBackend(CacheBackend):
+    """L2 store speaking the Redis protocol (redis-py asyncio client or compatible)"""
+
+    def __init__(self, redis, prefix: str = "polycraft:cache:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBackend":
+        import redis.asyncio as aioredis
+
+        return cls(aioredis.from_url(url), **kwargs)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Tuple[Any, Optional[float]]]:
+        # One round trip for every value and its remaining TTL
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(self.prefix + key)
+            pipe.pttl(self.prefix + key)
+        replies = await pipe.execute()
+        found = {}
+        for key, raw, pttl in zip(keys, replies[::2], replies[1::2]):
+            if raw is not None:
+                found[key] = (json.loads(raw), pttl / 1000 if pttl is not None and pttl >= 0 else None)
+        return found
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await self.redis.set(self.prefix + key, json.dumps(value, default=str), ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(self.prefix + key)
+
+    async def aclose(self) -> None:
+        await self.redis.aclose()
+
+
+class TieredCache:
+    """
+    Small per-process L1 (InMemoryCache) in front of an optional shared L2.
+
+    L1 entries filled from or written through to L2 are kept at most
+    ``l1_ttl`` seconds so workers converge on the shared copy. L2 failures
+    are counted and degrade to L1-only instead of failing requests.
+    """
+
+    def __init__(self, l1: InMemoryCache, l2: Optional[CacheBackend] = None, l1_ttl: float = 60):
+        self.l1 = l1
+        self.l2 = l2
+        self.l1_ttl = l1_ttl
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.l2_errors = 0
+
+    def _l1_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        if self.l2 is None:
+            return ttl
+        return self.l1_ttl if ttl is None else min(ttl, self.l1_ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.l1.get(key)
+            if value is not None:
+                found[key] = value
+                self.l1_hits += 1
+            else:
+                missing.append(key)
+
+        if missing and self.l2 is not None:
+            try:
+                remote = await self.l2.get_many(missing)
+            except Exception:
+                self.l2_errors += 1
+                remote = {}
+            for key, (value, ttl) in remote.items():
+                self.l1.set(key, value, ttl=self._l1_ttl(ttl))
+                found[key] = value
+            self.l2_hits += len(remote)
+            self.misses += len(missing) - len(remote)
+        else:
+            self.misses += len(missing)
+        return found
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        self.l1.set(key, value, ttl=self._l1_ttl(ttl))
+        if self.l2 is not None:
+            try:
+                await self.l2.set(key, value, ttl=ttl)
+            except Exception:
+                self.l2_errors += 1
+
+    async def delete(self, key: str) -> None:
+        self.l1.delete(key)
+        if self.l2 is not None:
+            try:
+                await self.l2.delete(key)
+            except Exception:
+                self.l2_errors += 1
+
+    def start_sweeper(self) -> None:
+        self.l1.start_sweeper()
+
+    async def aclose(self) -> None:
+        await self.l1.stop_sweeper()
+        if self.l2 is not None:
+            await self.l2.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "l1": self.l1.stats(),
+            "l2": type(self.l2).__name__ if self.l2 is not None else None,
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "l2_errors": self.l2_errors,
+            "hit_ratio": (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+        }
+
+
+FRESH = "fresh"
+STALE = "stale"
+NEGATIVE = "negative"
+MISS = "miss"
+
+
+class CachePolicy:
+    """
+    How long one modality's results are served from cache.
+
+    Successful results are fresh for ``fresh_ttl`` seconds and may then be
+    served stale for ``stale_ttl`` more while they are refreshed in the
+    background. Upstream failures are remembered for ``negative_ttl``
+    seconds so a failing prompt is not retried on every request.
+    """
+
+    def __init__(self, fresh_ttl: float, stale_ttl: float = 0, negative_ttl: float = 0):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+
+    @classmethod
+    def from_settings(cls, settings: Settings, modality: str) -> "CachePolicy":
+        """Policy from the CACHE_TTL_*, CACHE_STALE_TTL_* and CACHE_NEGATIVE_TTL_* settings"""
+        return cls(
+            getattr(settings, f"cache_ttl_{modality}"),
+            getattr(settings, f"cache_stale_ttl_{modality}"),
+            getattr(settings, f"cache_negative_ttl_{modality}"),
+        )
+
+    def entry(self, value: Any, negative: bool = False) -> Tuple[Dict[str, Any], int]:
+        """Cache entry for a result and the hard TTL to store it with"""
+        ttl = self.negative_ttl if negative else self.fresh_ttl
+        # Wall-clock deadline so every worker sharing the L2 agrees on staleness
+        entry = {"value": value, "fresh_until": time.time() + ttl, "negative": negative}
+        return entry, int(ttl + (0 if negative else self.stale_ttl))
+
+    @staticmethod
+    def state(entry: Dict[str, Any]) -> str:
+        if entry.get("negative"):
+            return NEGATIVE
+        return FRESH if entry["fresh_until"] > time.time() else STALE
+
+
+MODALITIES = ("image", "text", "audio")
+
+
+def cache_policies(settings: Optional[Settings] = None) -> Dict[str, CachePolicy]:
+    """Cache policy for every modality"""
+    settings = settings or Settings()
+    return {modality: CachePolicy.from_settings(settings, modality) for modality in MODALITIES}
+
+
+def _shared_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    if not url:
+        return None
+    try:
+        return RedisBackend.from_url(url)
+    except ImportError:
+        logging.getLogger("polycraft.cache").warning(
+            "CACHE_REDIS_URL is set but 'redis' is not installed, using the in-memory cache only"
+        )
+        return None
+
 
-# Create a singleton instance
-cache = InMemoryCache()
+def create_cache(settings: Optional[Settings] = None) -> TieredCache:
+    """Local cache, backed by the shared tier when CACHE_REDIS_URL is set"""
+    settings = settings or Settings()
+    l1 = InMemoryCache(
+        max_entries=settings.cache_max_entries,
+        max_bytes=settings.cache_max_bytes,
+        sweep_interval=settings.cache_sweep_interval,
+        admission=settings.cache_admission,
+    )
+    return TieredCache(l1, _shared_backend(settings.cache_redis_url), l1_ttl=settings.cache_l1_ttl)
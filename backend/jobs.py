@@ -0,0 +1,271 @@
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+
+from settings import Settings
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+@dataclass
+class Job:
+    type: str
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.utcfromtimestamp(ts).isoformat() if ts is not None else None
+
+        return {
+            "job_id": self.id,
+            "type": self.type,
+            "status": self.status,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobStore:
+    """In-memory job records"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    async def load(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def prune(self, older_than: float) -> int:
+        """Forget finished jobs that completed before the given timestamp"""
+        expired = [job.id for job in self._jobs.values() if job.done and job.finished_at < older_than]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job records kept in memory and written through to SQLite, so queued
+    jobs and finished results survive a restart. Writes run in a worker
+    thread to keep the event loop free. The database is opened on first
+    use and closed by ``close()``.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, finished_at REAL, data TEXT NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    async def _execute(self, sql: str, args: tuple = ()) -> List[tuple]:
+        def run():
+            db = self._connect()
+            rows = db.execute(sql, args).fetchall()
+            db.commit()
+            return rows
+
+        async with self._lock:
+            return await asyncio.to_thread(run)
+
+    async def load(self) -> List[Job]:
+        for (data,) in await self._execute("SELECT data FROM jobs"):
+            job = Job(**json.loads(data))
+            self._jobs[job.id] = job
+        return list(self._jobs.values())
+
+    async def save(self, job: Job) -> None:
+        await super().save(job)
+        await self._execute(
+            "INSERT OR REPLACE INTO jobs (id, finished_at, data) VALUES (?, ?, ?)",
+            (job.id, job.finished_at, json.dumps(asdict(job), default=str)),
+        )
+
+    async def prune(self, older_than: float) -> int:
+        removed = await super().prune(older_than)
+        await self._execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (older_than,))
+        return removed
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._db is not None:
+                await asyncio.to_thread(self._db.close)
+                self._db = None
+
+
+class JobManager:
+    """
+    Bounded queue of generation jobs executed by a fixed pool of workers.
+
+    ``runner(type, params)`` performs the generation and returns its result;
+    exceptions mark the job failed. Finished jobs are kept for
+    ``result_ttl`` seconds for clients to collect.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+        store: Optional[JobStore] = None,
+        workers: int = 4,
+        max_queue: int = 1000,
+        result_ttl: float = 3600,
+    ):
+        self.runner = runner
+        self.store = store if store is not None else JobStore()
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._wait_times: deque = deque(maxlen=1000)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self) -> None:
+        # Unbounded so recovered jobs always fit; max_queue is enforced on submit
+        self._queue = asyncio.Queue()
+        # Jobs persisted before a restart are picked up again, even beyond
+        # max_queue; new submissions are refused until the backlog drains
+        for job in sorted(await self.store.load(), key=lambda job: job.created_at):
+            if not job.done:
+                job.status = QUEUED
+                self._enqueue(job, check_capacity=False)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._prune_loop()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.store.close()
+
+    def _enqueue(self, job: Job, check_capacity: bool = True) -> None:
+        if check_capacity and self._queue.qsize() >= self.max_queue:
+            raise QueueFullError(f"Job queue is full ({self.max_queue} jobs)")
+        self._queue.put_nowait(job)
+        self._done_events[job.id] = asyncio.Event()
+
+    async def submit(self, job_type: str, params: Dict[str, Any]) -> Job:
+        if self._queue is None:
+            raise RuntimeError("JobManager has not been started")
+        job = Job(type=job_type, params=params)
+        self._enqueue(job)
+        await self.store.save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Long-poll: return once the job finishes or the timeout passes"""
+        event = self._done_events.get(job_id)
+        if event is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.store.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._wait_times.append(job.started_at - job.created_at)
+            self.running += 1
+            await self.store.save(job)
+            try:
+                job.result = await self.runner(job.type, job.params)
+                job.status = SUCCEEDED
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = str(e)
+                job.status = FAILED
+                self.failed += 1
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+                self._queue.task_done()
+            await self.store.save(job)
+            event = self._done_events.pop(job.id, None)
+            if event is not None:
+                event.set()
+
+    async def _prune_loop(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.result_ttl, 60))
+            await self.store.prune(time.time() - self.result_ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "stored_jobs": len(self.store),
+            "wait_seconds": {
+                "avg": sum(waits) / len(waits) if waits else 0.0,
+                "p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "max": waits[-1] if waits else 0.0,
+            },
+        }
+
+
+def create_job_store(settings: Optional[Settings] = None) -> JobStore:
+    """Pick the job store from JOB_STORE (memory or sqlite)"""
+    settings = settings or Settings()
+    if settings.job_store == "sqlite":
+        return SQLiteJobStore(settings.job_sqlite_path)
+    return JobStore()
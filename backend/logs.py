@@ -0,0 +1,211 @@
+"""
+Structured JSON logging that never writes from the event loop.
+
+Loggers under "polycraft" hand records to a bounded queue; a QueueListener
+thread formats them and writes them to stdout (or LOG_FILE). A full queue
+drops records instead of blocking a request. AccessLogMiddleware logs one
+record per request, sampled per route, under a correlation id taken from
+X-Request-ID or generated.
+
+Overhead per request, measured against a bare ASGI endpoint (see the
+"logging.*" benchmarks in benchmarks/micro.py): about 25 us when the record
+is kept, formatting in the writer thread included, and 7 us when it is
+sampled out. That is roughly 30% of a response-cache hit (~75 us on the same
+machine) and under 5% of a result-cache hit, so sample hot, cheap routes
+down with LOG_SAMPLE_RATES.
+"""
+from contextvars import ContextVar
+from random import getrandbits, random
+from typing import Any, Dict, Optional
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import time
+import traceback
+
+import orjson
+
+# Correlation id of the request being handled, attached to every record
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+# Incoming X-Request-ID values are echoed into logs and headers, so only
+# short, plain ids are trusted
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+logger = logging.getLogger("polycraft")
+access_logger = logging.getLogger("polycraft.access")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, request_id and the record's fields"""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = "".join(traceback.format_exception(*record.exc_info))
+        return orjson.dumps(entry, default=str).decode()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that does no formatting on the calling thread and drops
+    records when the queue is full rather than waiting or raising.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener thread cannot see this context, so capture the id now
+        record.request_id = correlation_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that lets records accumulate between drains. Waking the
+    writer thread for every record costs the event loop a GIL handoff per
+    request; pausing while the queue is empty turns that into one per
+    flush interval.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, flush_interval: float = 0.05):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool):
+        if block and self.queue.empty():
+            time.sleep(self.flush_interval)
+        return super().dequeue(block)
+
+
+def _output_handler() -> logging.Handler:
+    path = os.getenv("LOG_FILE")
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+# Attached at import so records logged before startup wait in the queue
+queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10_000))))
+logger.addHandler(queue_handler)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+
+_listener: Optional[BatchingQueueListener] = None
+
+
+def start_logging() -> None:
+    """Start the writer thread; a no-op while it is running"""
+    global _listener
+    if _listener is None:
+        _listener = BatchingQueueListener(queue_handler.queue, _output_handler())
+        _listener.start()
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _log(target: logging.Logger, level: int, message: str, fields: Dict[str, Any]) -> None:
+    # Skips logger.info's caller lookup, a stack walk that is the costliest
+    # part of building a record
+    if target.isEnabledFor(level):
+        target.handle(target.makeRecord(target.name, level, "", 0, message, (), None, extra={"fields": fields}))
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Per-route rates from "path=rate,path=rate", e.g. "/health=0,/api/generate/image=0.1" """
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            path, rate = item.rsplit("=", 1)
+            rates[path.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class AccessLogMiddleware:
+    """
+    Pure ASGI middleware giving each request a correlation id (echoed in
+    X-Request-ID) and logging it as a JSON access record. Records are kept
+    at the route's sample rate (LOG_SAMPLE_RATES, else LOG_SAMPLE_RATE);
+    server errors and unhandled exceptions are always logged.
+    """
+
+    def __init__(self, app, sample_rate: Optional[float] = None, sample_rates: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+        self.sample_rates = sample_rates if sample_rates is not None else parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+    @staticmethod
+    def _request_id(scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID.fullmatch(candidate):
+                    return candidate
+                break
+        return f"{getrandbits(64):016x}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = self._request_id(scope)
+        token = correlation_id.set(request_id)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            logger.error("Unhandled error", exc_info=True, extra={"fields": {"path": scope["path"]}})
+            raise
+        finally:
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            rate = self.sample_rates.get(route, self.sample_rate)
+            if status_code >= 500 or (rate > 0 and (rate >= 1 or random() < rate)):
+                _log(access_logger, logging.INFO, "request", {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "client": scope["client"][0] if scope.get("client") else None,
+                })
+            correlation_id.reset(token)
@@ -1,75 +1,83 @@
-import os
 import time
-import json
 import httpx
-from fastapi import FastAPI, HTTPException, Depends, Request, status, Header
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Request, status, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional, List, Dict, Any, Annotated
+from typing import Optional, List, Dict, Any, Annotated, AsyncIterator, Tuple, Union
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-from cache import cache
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
+from assets import AssetStore, create_asset_store
+from cache import MISS, NEGATIVE, STALE, CachePolicy, TieredCache, cache_policies, create_cache, make_cache_key
+from jobs import JobManager, QueueFullError, create_job_store
+from logs import AccessLogMiddleware, logger, start_logging, stop_logging
+import metrics
+from ratelimit import create_rate_limiter
+from response_cache import ResponseCache, ResponseCacheMiddleware, note_result
+from serialization import MSGPACK_TYPES, MsgPackResponse, ORJSONResponse, dumps, negotiate, pack, wants_msgpack
+from resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, RetryPolicy
+from settings import Settings
+from starlette.background import BackgroundTask
+from tracing import Profiles, TracingMiddleware, create_span_exporter, span
+import hmac
 import random
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
+from urllib.parse import quote, urlencode, urlsplit
+import orjson
 
 # Load environment variables
 load_dotenv()
 
-# Rate limiting configuration
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(
-    title="PolyCraft API",
-    description="AI-Powered Multi-Modal Generation Platform",
-    version="1.0.0"
-)
-
-# Apply rate limiting middleware
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-app.add_middleware(SlowAPIMiddleware)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Settings of the module-level app; apps built by create_app() may be given their own
+settings = Settings()
+
+# Routes are collected here and mounted by create_app()
+router = APIRouter()
 
 # Security
 security = HTTPBearer(auto_error=False)
-API_KEY = os.getenv("BACKEND_API_KEY")
+
+def app_settings(request: Request) -> Settings:
+    return request.app.state.settings
 
 # Authentication dependency
-async def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+async def verify_api_key(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    x_api_key: Optional[str] = Header(None),
+):
     """
-    Verify API key if BACKEND_API_KEY is configured.
+    Verify API key (Bearer or X-API-Key) if BACKEND_API_KEY is configured;
+    BACKEND_API_KEY and the API_KEYS_PRO/API_KEYS_ENTERPRISE tier keys are accepted.
     If no API key is set in environment, allow open access.
     """
-    if not API_KEY:
+    backend_api_key = app_settings(request).backend_api_key
+    if not backend_api_key:
         # No API key configured, allow open access
         return True
     
-    if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key required",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    if credentials.credentials != API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API key",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
+    with span("auth"):
+        api_key = credentials.credentials if credentials else x_api_key
+        if not api_key:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="API key required",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        if not (
+            hmac.compare_digest(api_key.encode(), backend_api_key.encode())
+            or request.app.state.limiter.tier_key(api_key)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API key",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
     return True
 
 # Models
@@ -90,19 +98,123 @@ class AudioRequest(GenerationRequest):
 class BatchRequest(BaseModel):
     requests: List[Dict[str, Any]]
 
-# Rate limiting and caching
-def get_rate_limit_key(request: Request):
-    return get_remote_address(request)
+# Response models. Endpoints exclude unset fields, so optional keys such as
+# asset_id only appear when the result carries them.
+class ImageResult(BaseModel):
+    url: str
+    asset_id: Optional[str] = None
+    source_url: Optional[str] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    cache: Optional[str] = None
+
+class TextResult(BaseModel):
+    text: str
+    source: Optional[str] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    cache: Optional[str] = None
+
+class AudioResult(BaseModel):
+    url: str
+    asset_id: Optional[str] = None
+    source_url: Optional[str] = None
+    error: Optional[str] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    cache: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    status: str
+    # AudioResult comes before ImageResult so an audio fallback keeps its
+    # error field; Dict covers the invalid-type error item
+    result: Optional[Union[AudioResult, ImageResult, TextResult, Dict[str, Any]]] = None
+    error: Optional[str] = None
 
-def get_user_tier(user_id: str = None):
-    # In a real app, this would check the user's subscription tier
-    return "free"  # free, pro, enterprise
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+
+MSGPACK_RESPONSE = {200: {"content": {media_type: {} for media_type in MSGPACK_TYPES}}}
+
+# Rate limiting
+def rate_limit(scope: str):
+    """
+    Dependency charging one token from the caller's ``scope`` bucket
+    (image, text, audio or batch). Callers with a tier key (Bearer or
+    X-API-Key) are keyed by that key and its tier scales the limit; everyone
+    else, BACKEND_API_KEY callers included, is keyed by client IP.
+    """
+    async def check_rate_limit(
+        request: Request,
+        response: Response,
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+        x_api_key: Optional[str] = Header(None),
+    ):
+        limiter = request.app.state.limiter
+        if not limiter.enabled:
+            return
+        api_key = limiter.tier_key(credentials.credentials if credentials else x_api_key)
+        peer = request.client.host if request.client else None
+        with span("ratelimit"):
+            result = await limiter.check(scope, limiter.identity(request.headers, peer, api_key), limiter.tier_for(api_key))
+        headers = {"X-RateLimit-Limit": str(result.limit), "X-RateLimit-Remaining": str(result.remaining)}
+        if not result.allowed:
+            metrics.RATE_LIMITED.labels(metrics.route_name(request.scope)).inc()
+            headers["Retry-After"] = str(max(1, int(result.retry_after + 0.999)))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {result.limit} {scope} requests per minute",
+                headers=headers,
+            )
+        response.headers.update(headers)
+
+    return check_rate_limit
+
+class CachedUpstreamError(Exception):
+    """An upstream failure replayed from the negative cache"""
+
+class UpstreamRelay:
+    """
+    An upstream response whose body the caller relays. The upstream call
+    (breaker, concurrency limit and per-host slot) stays open until aclose(),
+    so relays still running count against the host and the limiter sees the
+    whole transfer rather than the time to headers.
+    """
+
+    def __init__(self, response: httpx.Response, upstream, call: Dict[str, Any]):
+        self.response = response
+        self._upstream = upstream
+        self._call = call
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+    def fail(self, error: BaseException) -> None:
+        """Record why the relay stopped early; passed on to the upstream call on close"""
+        if isinstance(error, httpx.HTTPError):
+            # Cut off mid-body: a failed call, as if the body had been read up front
+            self._call["status"] = "error"
+        self._error = error
+
+    async def aiter_raw(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self.response.aiter_raw():
+                yield chunk
+        except BaseException as error:
+            self.fail(error)
+            raise
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        error = self._error
+        await self.response.aclose()
+        await self._upstream.__aexit__(type(error) if error else None, error, error.__traceback__ if error else None)
 
 # Pollinations API client
 class PollinationsClient:
-    BASE_URL = "https://image.pollinations.ai"
-    TEXT_URL = "https://text.pollinations.ai"
-    AUDIO_URL = "https://text.pollinations.ai"
+    # Defaults applied before cache keys are built, so omitted and explicit
+    # default values share one cache entry
+    IMAGE_DEFAULTS = {"model": "flux", "width": 1024, "height": 1024, "nologo": False, "private": False}
+    TEXT_DEFAULTS = {"model": "openai"}
+    AUDIO_DEFAULTS = {"voice": "alloy", "speed": 1.0, "response_format": "mp3"}
     
     # Text generation templates for better responses
     RESPONSE_TEMPLATES = {
@@ -128,10 +240,412 @@ class PollinationsClient:
         ]
     }
     
-    def __init__(self):
-        self.client = httpx.AsyncClient()
+    def __init__(self, settings: Optional[Settings] = None, cache: Optional[TieredCache] = None,
+                 asset_store: Optional[AssetStore] = None, response_cache: Optional[ResponseCache] = None):
+        settings = settings if settings is not None else Settings()
+        # Result cache, asset store and response cache of the app this client
+        # serves; a client built on its own gets a cache of its own
+        self.cache = cache if cache is not None else create_cache(settings)
+        self.policies = cache_policies(settings)
+        self.asset_store = asset_store
+        self.response_cache = response_cache
+        self.asset_base_url = settings.asset_base_url
+
+        # Overridable so load tests can point the client at a local stand-in
+        self.image_url = settings.pollinations_image_url.rstrip("/")
+        self.text_url = settings.pollinations_text_url.rstrip("/")
+        self.audio_url = (settings.pollinations_audio_url or self.text_url).rstrip("/")
+
+        # One pooled client for every upstream call so TCP/TLS connections to
+        # image.pollinations.ai and text.pollinations.ai are reused.
+        self.max_connections = settings.upstream_max_connections
+        self.max_keepalive = settings.upstream_max_keepalive
+        self.keepalive_expiry = settings.upstream_keepalive_expiry
+        self.max_per_host = settings.upstream_max_per_host
+        self.http2 = settings.upstream_http2
+        self.connect_timeout = settings.upstream_connect_timeout
+        self.read_timeout = settings.upstream_read_timeout
+        # "stream" follows redirects and drops the connection once headers
+        # arrive; "head" asks with HEAD first and falls back to "stream".
+        self.resolve_mode = settings.upstream_resolve_mode
+        # Generate text with text.pollinations.ai; "false" answers from the
+        # local templates only, which otherwise serve as the fallback
+        self.text_upstream = settings.text_upstream
+        # Seconds text.pollinations.ai may go silent (before its first byte or
+        # between chunks) before the templates answer instead; kept short and
+        # not retried so the fallback stays fast
+        self.text_timeout = settings.text_upstream_timeout
+
+        # Built on first use: creating the TLS context costs ~100ms at import
+        self._client: Optional[httpx.AsyncClient] = None
         self.rate_limits = {}
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_in_flight: Dict[str, int] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.breaker_threshold = settings.breaker_failure_threshold
+        self.breaker_recovery = settings.breaker_recovery_timeout
+        self.retry_policy = RetryPolicy(
+            settings.upstream_retries, settings.upstream_retry_base_delay, settings.upstream_retry_max_delay
+        )
+        # Adaptive (AIMD) per-host concurrency, bounded above by UPSTREAM_MAX_PER_HOST
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self.limit_initial = settings.upstream_limit_initial
+        self.limit_min = settings.upstream_limit_min
+        self.latency_tolerance = settings.upstream_latency_tolerance
+        # cache key -> upstream call shared by identical concurrent requests
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+        # stale cache entries refreshed in the background
+        self.revalidations = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2 and self._http2_available(),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        return self._client
+
+    @client.setter
+    def client(self, value: httpx.AsyncClient) -> None:
+        self._client = value
+
+    @client.deleter
+    def client(self) -> None:
+        self._client = None
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 without it"""
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("UPSTREAM_HTTP2 requested but 'h2' is not installed, using HTTP/1.1")
+            return False
+        return True
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str):
+        """Cap concurrent requests per upstream host within the shared pool"""
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        async with slot:
+            self._host_in_flight[host] = self._host_in_flight.get(host, 0) + 1
+            try:
+                yield
+            finally:
+                self._host_in_flight[host] -= 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Snapshot of connection pool occupancy for sizing under load"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "queued": sum(1 for req in getattr(pool, "_requests", []) if getattr(req, "connection", None) is None),
+            "in_flight_by_host": {host: count for host, count in self._host_in_flight.items() if count},
+            "limits": {
+                "max_connections": self.max_connections,
+                "max_keepalive": self.max_keepalive,
+                "keepalive_expiry": self.keepalive_expiry,
+                "max_per_host": self.max_per_host,
+                "http2": self.http2,
+            },
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # Upstream answers worth retrying and counted against the circuit breaker
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host, self.breaker_threshold, self.breaker_recovery)
+        return breaker
+
+    def limiter(self, host: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = AdaptiveLimiter(
+                host, initial=self.limit_initial, min_limit=self.limit_min, max_limit=self.max_per_host,
+                tolerance=self.latency_tolerance,
+            )
+        return limiter
+
+    def limiter_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {host: limiter.stats() for host, limiter in self._limiters.items()}
+
+    def breaker_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {host: breaker.stats() for host, breaker in self._breakers.items()}
+
+    def service_status(self, base_url: str) -> str:
+        breaker = self._breakers.get(urlsplit(base_url).netloc)
+        return "degraded" if breaker is not None and breaker.state != "closed" else "operational"
+
+    def _is_transient(self, error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.RETRYABLE_STATUSES
+        return isinstance(error, httpx.TransportError)
+
+    async def _with_retries(self, url: str, attempt, is_transient=None):
+        """Retry transient upstream failures with jittered exponential backoff"""
+        host = urlsplit(url).netloc
+        return await self.retry_policy.run(
+            attempt,
+            is_transient or self._is_transient,
+            on_retry=lambda error: metrics.UPSTREAM_RETRIES.labels(host).inc(),
+        )
+
+    @asynccontextmanager
+    async def _upstream_call(self, url: str):
+        """
+        Circuit breaker, adaptive concurrency limit, per-host slot and
+        latency/status metrics around one upstream call. The caller records
+        the final status code on the yielded dict. Fails fast with
+        CircuitOpenError while the host is down.
+        """
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        breaker.before_call()
+        limiter = self.limiter(host)
+        try:
+            await limiter.acquire()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        call = {"status": "error"}
+        started = time.perf_counter()
+        outcome = "done"
+        upstream_span = span("upstream", host=host).__enter__()
+        try:
+            async with self._host_slot(url):
+                yield call
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            upstream_span.attributes["status"] = call["status"]
+            upstream_span.__exit__(None, None, None)
+            elapsed = time.perf_counter() - started
+            metrics.observe_upstream(host, call["status"], elapsed)
+            if outcome == "cancelled":
+                breaker.release()
+                limiter.release()
+            else:
+                if call["status"] == "error" or call["status"] in self.RETRYABLE_STATUSES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if outcome == "timeout" or call["status"] in (429, 503):
+                    # Timeouts and throttling shrink the limit
+                    limiter.release(elapsed, dropped=True)
+                elif call["status"] == "error" or call["status"] >= 400:
+                    # A fast failure says nothing about healthy latency, so it
+                    # neither grows the limit nor moves the baseline
+                    limiter.release()
+                else:
+                    limiter.release(elapsed)
+
+    async def _resolve_url(self, url: str, params: Dict[str, Any]) -> str:
+        """Follow redirects to the final asset URL without downloading the body"""
+        return await self._with_retries(url, lambda: self._resolve_url_once(url, params))
+
+    async def _resolve_url_once(self, url: str, params: Dict[str, Any]) -> str:
+        async with self._upstream_call(url) as call:
+            if self.resolve_mode == "head":
+                response = await self.client.head(url, params=params, follow_redirects=True)
+                call["status"] = response.status_code
+                if response.status_code not in (405, 501):
+                    response.raise_for_status()
+                    return str(response.url)
+
+            async with self.client.stream("GET", url, params=params, follow_redirects=True) as response:
+                call["status"] = response.status_code
+                if response.is_error:
+                    # Error bodies are small and needed for the error message
+                    await response.aread()
+                response.raise_for_status()
+                return str(response.url)
+
+    async def _locate_asset(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Where clients can fetch a generated asset. With the asset store enabled
+        the bytes are downloaded once and a local URL is returned; otherwise
+        this is the upstream URL after redirects.
+        """
+        if self.asset_store is None:
+            return {"url": await self._resolve_url(url, params)}
+        data, media_type, source_url = await self._with_retries(url, lambda: self._download_once(url, params))
+        asset = await self.asset_store.put(data, media_type)
+        if asset is None:
+            return {"url": source_url}
+        return {"url": f"{self.asset_base_url}/{asset.id}", "asset_id": asset.id, "source_url": source_url}
+
+    async def _download_once(self, url: str, params: Dict[str, Any]):
+        async with self._upstream_call(url) as call:
+            response = await self.client.get(url, params=params, follow_redirects=True)
+            call["status"] = response.status_code
+            response.raise_for_status()
+            return response.content, response.headers.get("content-type"), str(response.url)
+
+    def _asset_held(self, result: Dict[str, Any]) -> bool:
+        """False for a cached result whose local asset has since been evicted"""
+        asset_id = result.get("asset_id")
+        return asset_id is None or (self.asset_store is not None and asset_id in self.asset_store)
+
+    def _image_request(self, prompt: str, params: Dict[str, Any]):
+        """Build the upstream image URL and query params with defaults applied"""
+        # Construct the URL with prompt as a path parameter and other params as query params
+        url = f"{self.image_url}/prompt/{prompt}"
+        
+        # Add default parameters if not provided
+        params = {**self.IMAGE_DEFAULTS, **{k: v for k, v in params.items() if v is not None}}
+        return url, params
+
+    def cache_key(self, kind: str, **request) -> str:
+        """Canonical cache key for a generation request, with defaults applied"""
+        if kind == "image":
+            prompt = request.pop("prompt")
+            _, params = self._image_request(prompt, request)
+            return make_cache_key("image", prompt=prompt, **params)
+        if kind == "text":
+            return make_cache_key(
+                "text",
+                prompt=request["prompt"],
+                model=request.get("model") or self.TEXT_DEFAULTS["model"],
+                seed=request.get("seed"),
+            )
+        if kind == "audio":
+            text = request.pop("text")
+            params = {**self.AUDIO_DEFAULTS, **{k: v for k, v in request.items() if v is not None}}
+            return make_cache_key("audio", text=text, **params)
+        raise ValueError(f"Unknown generation type: {kind}")
+
+    async def prefetch(self, requests: List[Dict[str, Any]]) -> None:
+        """Warm the local cache for a batch with one multi-get against the shared tier"""
+        keys = []
+        for req in requests:
+            try:
+                keys.append(self.cache_key(req.get("type"), **{k: v for k, v in req.items() if k != "type"}))
+            except Exception:
+                # Invalid items are reported per item when the batch runs
+                continue
+        if keys:
+            await self.cache.get_many(keys)
+
+    async def stream_image(self, prompt: str, **params) -> UpstreamRelay:
+        """
+        Open the upstream image response without reading its body.
+        The caller must close the returned relay once the bytes are relayed.
+        """
+        params.pop("prompt", None)
+        url, params = self._image_request(prompt, params)
+        return await self._with_retries(
+            url, lambda: self._open_stream(url, self.client.build_request("GET", url, params=params))
+        )
+
+    async def _open_stream(self, url: str, request: httpx.Request) -> UpstreamRelay:
+        """
+        Send a request whose body is read later. The upstream slot is held
+        until the relay is closed, not just until headers arrive; error
+        answers are read, released and raised.
+        """
+        upstream = self._upstream_call(url)
+        call = await upstream.__aenter__()
+        response = None
+        try:
+            response = await self.client.send(request, stream=True, follow_redirects=True)
+            call["status"] = response.status_code
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+        except BaseException as error:
+            if response is not None:
+                await response.aclose()
+            await upstream.__aexit__(type(error), error, error.__traceback__)
+            raise
+        return UpstreamRelay(response, upstream, call)
     
+    async def _single_flight(self, key: str, fetch):
+        """
+        Run fetch() once per key among concurrent callers.
+        Followers await the leader's task, so its result or exception reaches
+        every caller; shield() keeps one cancelled caller from cancelling the
+        shared call for the others.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._start_flight(key, fetch)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _start_flight(self, key: str, fetch) -> asyncio.Future:
+        task = asyncio.ensure_future(fetch())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish_flight(key, done))
+        return task
+
+    def _revalidate(self, key: str, fetch) -> None:
+        """Refresh a stale entry in the background unless a fetch for it is already running"""
+        if key not in self._in_flight:
+            self.revalidations += 1
+            self._start_flight(key, lambda: fetch(refresh=True))
+
+    async def _cached(self, kind: str, key: str, fetch) -> Dict[str, Any]:
+        """
+        Serve a generation through the modality's cache policy: fresh entries
+        as they are, stale ones while a background refresh runs, remembered
+        failures without calling upstream, and misses through one shared
+        upstream call. ``fetch(refresh=False)`` generates and stores the
+        result. The returned result says which of these it was under "cache".
+        """
+        with span("cache", kind=kind):
+            entry = await self.cache.get(key)
+        if entry is not None and self._asset_held(entry["value"]):
+            state = CachePolicy.state(entry)
+            note_result(key, state, entry["fresh_until"])
+            if state == STALE:
+                self._revalidate(key, fetch)
+            elif state == NEGATIVE and "failure" in entry["value"]:
+                raise CachedUpstreamError(entry["value"]["failure"])
+            return {**entry["value"], "cache": state}
+        note_result(key, MISS, None)
+        return {**await self._single_flight(key, fetch), "cache": MISS}
+
+    async def _store(self, kind: str, key: str, value: Dict[str, Any], negative: bool = False) -> None:
+        entry, ttl = self.policies[kind].entry(value, negative)
+        if ttl > 0:
+            await self.cache.set(key, entry, ttl=ttl)
+        # Stored responses never outlive the result they were built from
+        if self.response_cache is not None:
+            self.response_cache.invalidate(key)
+
+    def _finish_flight(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
     def _classify_prompt(self, prompt: str) -> str:
         """Classify the prompt to choose appropriate response template"""
         prompt_lower = prompt.lower()
@@ -155,84 +669,222 @@ class PollinationsClient:
     async def generate_image(self, prompt: str, **params):
         # Remove prompt from params to avoid duplication
         params.pop("prompt", None)
-        cache_key = f"image:{hash(frozenset({**params, 'prompt': prompt}.items()))}"
-        
-        # Check cache
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
+        url, params = self._image_request(prompt, params)
+        cache_key = self.cache_key("image", prompt=prompt, **params)
         
+        # Identical concurrent requests share one upstream call
+        return await self._cached(
+            "image", cache_key, lambda refresh=False: self._fetch_image(cache_key, url, params, refresh)
+        )
+    
+    async def _fetch_image(self, cache_key: str, url: str, params: Dict[str, Any], refresh: bool = False):
         try:
-            # Construct the URL with prompt as a path parameter and other params as query params
-            url = f"{self.BASE_URL}/prompt/{prompt}"
-            
-            # Add default parameters if not provided
-            if 'model' not in params:
-                params['model'] = 'flux'
-            if 'width' not in params:
-                params['width'] = 1024
-            if 'height' not in params:
-                params['height'] = 1024
+            # The actual image URL is the final URL after following redirects
+            location = await self._locate_asset(url, params)
             
-            # Make the request with a timeout
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, params=params, follow_redirects=True)
-                response.raise_for_status()
-                
-                # The actual image URL is the final URL after following redirects
-                image_url = str(response.url)
-                
-                # Cache the result for 1 hour
-                result = {
-                    "url": image_url,
-                    "metadata": {
-                        "model": params.get('model', 'flux'),
-                        "dimensions": f"{params.get('width', 1024)}x{params.get('height', 1024)}",
-                        "seed": params.get('seed'),
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
+            result = {
+                **location,
+                "metadata": {
+                    "model": params.get('model', 'flux'),
+                    "dimensions": f"{params.get('width', 1024)}x{params.get('height', 1024)}",
+                    "seed": params.get('seed'),
+                    "timestamp": datetime.utcnow().isoformat()
                 }
-                cache.set(cache_key, result, ttl=3600)
-                return result
+            }
+            await self._store("image", cache_key, result)
+            return result
                 
+        except CircuitOpenError:
+            raise
         except httpx.HTTPStatusError as e:
-            raise Exception(f"Failed to generate image: {e.response.status_code} {e.response.text}")
+            failure = f"Failed to generate image: {e.response.status_code} {e.response.text}"
+            if not refresh:
+                # A refresh failure keeps serving the stale result instead
+                await self._store("image", cache_key, {"failure": failure}, negative=True)
+            raise Exception(failure)
         except Exception as e:
             raise Exception(f"Failed to generate image: {str(e)}")
     
-    async def generate_text(self, prompt: str, model: str = "openai"):
-        cache_key = f"text:{model}:{hash(prompt)}"
-        
-        # Check cache
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
-        # Enhanced text generation with better templates
+    async def generate_text(self, prompt: str, model: str = "openai", seed: Optional[int] = None):
+        model = model or self.TEXT_DEFAULTS["model"]
+        cache_key = self.cache_key("text", prompt=prompt, model=model, seed=seed)
+        return await self._cached(
+            "text", cache_key, lambda refresh=False: self._fetch_text(cache_key, prompt, model, seed, refresh)
+        )
+
+    async def _fetch_text(self, cache_key: str, prompt: str, model: str, seed: Optional[int] = None, refresh: bool = False):
+        """Generate text upstream, falling back to the templates when text.pollinations.ai is unavailable"""
+        if not self.text_upstream:
+            return await self._compose_text(cache_key, prompt, model, seed, refresh)
+        started = time.perf_counter()
         try:
-            prompt_type = self._classify_prompt(prompt)
-            topic = self._extract_topic(prompt)
-            
-            # Select a random template based on prompt classification
-            templates = self.RESPONSE_TEMPLATES.get(prompt_type, self.RESPONSE_TEMPLATES['default'])
-            template = random.choice(templates)
-            
-            # Generate response using template
-            base_response = template.format(prompt_topic=topic)
-            
-            # Add additional context based on prompt type
-            if prompt_type == 'story':
-                additional = f"\n\nThe story continues as our protagonist faces challenges related to {topic}, learning valuable lessons along the way. Each step of their journey reveals new aspects of this fascinating world, leading to a conclusion that ties together all the elements introduced at the beginning."
-            elif prompt_type == 'explanation':
-                additional = f"\n\nIn practical terms, {topic} can be understood through several key examples and applications. The implications of this concept extend beyond its basic definition, influencing various fields and approaches to problem-solving."
-            elif prompt_type == 'creative':
-                additional = f"\n\nThe creative exploration of {topic} can take many forms, from artistic expression to innovative problem-solving. This versatility makes it a rich subject for further investigation and experimentation."
+            async with aclosing(self.stream_text(prompt, model, seed)) as tokens:
+                parts = [token async for token in tokens]
+        except (CircuitOpenError, httpx.HTTPError) as e:
+            return await self._compose_text(cache_key, prompt, model, seed, refresh, upstream_error=str(e) or type(e).__name__)
+        text = "".join(parts)
+        if not text.strip():
+            return await self._compose_text(cache_key, prompt, model, seed, refresh, upstream_error="empty response")
+        result = self._text_result(text, model, time.perf_counter() - started)
+        await self._store("text", cache_key, result)
+        return result
+
+    @staticmethod
+    def _text_result(text: str, model: str, elapsed: float) -> Dict[str, Any]:
+        return {
+            "text": text,
+            "source": "pollinations",
+            "metadata": {
+                "model": model,
+                "timestamp": datetime.utcnow().isoformat(),
+                "word_count": len(text.split()),
+                "generation_ms": round(elapsed * 1000, 1),
+            }
+        }
+
+    async def stream_text(self, prompt: str, model: str, seed: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Relay text from text.pollinations.ai as it is generated. Connecting is
+        retried like other upstream calls, except after a timeout: a silent
+        upstream fails after TEXT_UPSTREAM_TIMEOUT so the caller can fall
+        back. Once tokens flow, the next chunk is only read when the caller
+        asks for it, so a slow consumer slows the upstream read instead of
+        buffering it here. Close the generator (aclosing) when abandoning it:
+        it holds the upstream slot until then.
+        """
+        url = f"{self.text_url}/{quote(prompt, safe='')}"
+        params = {"model": model, "stream": "true"}
+        if seed is not None:
+            params["seed"] = seed
+
+        def attempt():
+            request = self.client.build_request(
+                "GET", url, params=params,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout, read=self.text_timeout),
+            )
+            return self._open_stream(url, request)
+
+        started = time.perf_counter()
+        relay = await self._with_retries(
+            url, attempt, lambda error: self._is_transient(error) and not isinstance(error, httpx.TimeoutException)
+        )
+        try:
+            first = True
+            async for token in self._text_tokens(relay.response):
+                if first:
+                    metrics.TEXT_FIRST_TOKEN.observe(time.perf_counter() - started)
+                    first = False
+                yield token
+        except BaseException as error:
+            relay.fail(error)
+            raise
+        finally:
+            await relay.aclose()
+
+    @staticmethod
+    async def _text_tokens(response: httpx.Response) -> AsyncIterator[str]:
+        """Text chunks from an OpenAI-style event stream, or from a plain streamed body"""
+        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+            async for chunk in response.aiter_text():
+                if chunk:
+                    yield chunk
+            return
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                event = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # Some models stream bare text in the data field
+                yield data
+                continue
+            if isinstance(event, dict):
+                choices = event.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
             else:
-                additional = f"\n\nFurther exploration of {topic} reveals connections to broader themes and ideas that can enrich our understanding and provide new perspectives on related subjects."
-            
-            generated_text = base_response + additional
+                content = event if isinstance(event, str) else None
+            if content:
+                yield content
+
+    async def generate_text_stream(self, prompt: str, model: str = "openai", seed: Optional[int] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Stream a text generation as ("text", chunk) pairs followed by one
+        ("done", result without its text). A cached result replays at once;
+        otherwise tokens are relayed from upstream and the completed text is
+        cached for the next identical request. When upstream fails before
+        the first token the template fallback is sent instead.
+        """
+        model = model or self.TEXT_DEFAULTS["model"]
+        cache_key = self.cache_key("text", prompt=prompt, model=model, seed=seed)
+        fetch = lambda refresh=False: self._fetch_text(cache_key, prompt, model, seed, refresh)
+        started = time.perf_counter()
+        with span("cache", kind="text"):
+            entry = await self.cache.get(cache_key)
+        if entry is not None and "text" in entry["value"]:
+            state = CachePolicy.state(entry)
+            if state == STALE:
+                self._revalidate(cache_key, fetch)
+            result = {**entry["value"], "cache": state}
+        elif self.text_upstream:
+            parts: List[str] = []
+            try:
+                async with aclosing(self.stream_text(prompt, model, seed)) as tokens:
+                    async for token in tokens:
+                        if not parts:
+                            first_token = time.perf_counter() - started
+                        parts.append(token)
+                        yield "text", token
+            except (CircuitOpenError, httpx.HTTPError) as e:
+                if parts:
+                    # Tokens already went out; the caller reports the cut-off
+                    raise
+                error = str(e) or type(e).__name__
+            else:
+                error = None if parts else "empty response"
+            if error is None:
+                result = self._text_result("".join(parts), model, time.perf_counter() - started)
+                result["metadata"]["first_token_ms"] = round(first_token * 1000, 1)
+                await self._store("text", cache_key, result)
+                yield "done", {"source": result["source"], "metadata": result["metadata"], "cache": MISS}
+                return
+            result = {**await self._compose_text(cache_key, prompt, model, seed, upstream_error=error), "cache": MISS}
+        else:
+            result = {**await self._single_flight(cache_key, fetch), "cache": MISS}
+        yield "text", result["text"]
+        yield "done", {k: v for k, v in result.items() if k != "text"}
+
+    async def _compose_text(self, cache_key: str, prompt: str, model: str, seed: Optional[int] = None,
+                            refresh: bool = False, upstream_error: Optional[str] = None):
+        # Enhanced text generation with better templates; also the fallback
+        # (remembered briefly, as a negative entry) when upstream_error is set
+        try:
+            with span("template"):
+                prompt_type = self._classify_prompt(prompt)
+                topic = self._extract_topic(prompt)
+
+                # Select a random template based on prompt classification; a seed
+                # makes the choice reproducible
+                templates = self.RESPONSE_TEMPLATES.get(prompt_type, self.RESPONSE_TEMPLATES['default'])
+                template = (random.Random(seed) if seed is not None else random).choice(templates)
+
+                # Generate response using template
+                base_response = template.format(prompt_topic=topic)
+
+                # Add additional context based on prompt type
+                if prompt_type == 'story':
+                    additional = f"\n\nThe story continues as our protagonist faces challenges related to {topic}, learning valuable lessons along the way. Each step of their journey reveals new aspects of this fascinating world, leading to a conclusion that ties together all the elements introduced at the beginning."
+                elif prompt_type == 'explanation':
+                    additional = f"\n\nIn practical terms, {topic} can be understood through several key examples and applications. The implications of this concept extend beyond its basic definition, influencing various fields and approaches to problem-solving."
+                elif prompt_type == 'creative':
+                    additional = f"\n\nThe creative exploration of {topic} can take many forms, from artistic expression to innovative problem-solving. This versatility makes it a rich subject for further investigation and experimentation."
+                else:
+                    additional = f"\n\nFurther exploration of {topic} reveals connections to broader themes and ideas that can enrich our understanding and provide new perspectives on related subjects."
+
+                generated_text = base_response + additional
             
-            # Cache the result for 5 minutes
             result = {
                 "text": generated_text, 
                 "source": "enhanced_template",
@@ -243,7 +895,14 @@ class PollinationsClient:
                     "word_count": len(generated_text.split())
                 }
             }
-            cache.set(cache_key, result, ttl=300)
+            if upstream_error is None:
+                await self._store("text", cache_key, result)
+            else:
+                result["metadata"]["upstream_error"] = upstream_error
+                # Kept briefly so upstream is asked again soon; a background
+                # refresh leaves the stale upstream text in place instead
+                if not refresh:
+                    await self._store("text", cache_key, result, negative=True)
             return result
             
         except Exception as e:
@@ -259,17 +918,17 @@ class PollinationsClient:
                     "error": str(e)
                 }
             }
-            cache.set(cache_key, result, ttl=300)
+            if not refresh:
+                await self._store("text", cache_key, result, negative=True)
             return result
     
     async def generate_audio(self, text: str, voice: str = "alloy", **params):
-        cache_key = f"audio:{voice}:{hash(text + str(params))}"
-        
-        # Check cache
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
+        cache_key = self.cache_key("audio", text=text, voice=voice, **params)
+        return await self._cached(
+            "audio", cache_key, lambda refresh=False: self._fetch_audio(cache_key, text, voice, params, refresh)
+        )
+    
+    async def _fetch_audio(self, cache_key: str, text: str, voice: str, params: Dict[str, Any], refresh: bool = False):
         try:
             # Use Pollinations text-to-speech endpoint
             # Format: https://text.pollinations.ai/TextToSpeech?text=Hello&voice=alloy
@@ -279,30 +938,27 @@ class PollinationsClient:
                 'speed': params.get('speed', 1.0)
             }
             
-            url = f"{self.AUDIO_URL}/TextToSpeech"
+            url = f"{self.audio_url}/TextToSpeech"
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, params=audio_params, follow_redirects=True)
-                response.raise_for_status()
-                
-                # The response should be the audio file URL or direct audio
-                audio_url = str(response.url)
-                
-                result = {
-                    "url": audio_url,
-                    "metadata": {
-                        "voice": voice,
-                        "speed": params.get('speed', 1.0),
-                        "format": params.get('response_format', 'mp3'),
-                        "text_length": len(text),
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
+            # The response should be the audio file URL or direct audio
+            location = await self._locate_asset(url, audio_params)
+            
+            result = {
+                **location,
+                "metadata": {
+                    "voice": voice,
+                    "speed": params.get('speed', 1.0),
+                    "format": params.get('response_format', 'mp3'),
+                    "text_length": len(text),
+                    "timestamp": datetime.utcnow().isoformat()
                 }
+            }
+            
+            await self._store("audio", cache_key, result)
+            return result
                 
-                # Cache the result for 1 hour
-                cache.set(cache_key, result, ttl=3600)
-                return result
-                
+        except CircuitOpenError:
+            raise
         except httpx.HTTPStatusError as e:
             # If Pollinations doesn't support TTS, provide a fallback
             fallback_result = {
@@ -315,34 +971,100 @@ class PollinationsClient:
                     "note": "TTS service integration in progress"
                 }
             }
-            cache.set(cache_key, fallback_result, ttl=300)
+            if not refresh:
+                await self._store("audio", cache_key, fallback_result, negative=True)
             return fallback_result
             
         except Exception as e:
             raise Exception(f"Failed to generate audio: {str(e)}")
 
-# Initialize client
-client = PollinationsClient()
+# The PollinationsClient of the app serving a request
+def app_client(request: Request) -> PollinationsClient:
+    return request.app.state.client
+
+async def run_job(client: PollinationsClient, job_type: str, params: Dict[str, Any]):
+    """Execute a queued generation job through the app's PollinationsClient"""
+    if job_type == "image":
+        return await client.generate_image(**params)
+    if job_type == "text":
+        return await client.generate_text(prompt=params["prompt"], model=params.get("model"), seed=params.get("seed"))
+    return await client.generate_audio(
+        text=params["prompt"],
+        voice=params.get("voice"),
+        speed=params.get("speed"),
+        response_format=params.get("response_format")
+    )
 
 # Health check endpoints (both /health and /api/health for compatibility)
-@app.get("/health")
-@app.get("/api/health")
-async def health_check():
+@router.get("/health")
+@router.get("/api/health")
+async def health_check(request: Request):
     """Health check endpoint"""
+    state = request.app.state
+    client = state.client
     return {
         "status": "healthy", 
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0.0",
         "services": {
-            "image_generation": "operational",
-            "text_generation": "operational", 
-            "audio_generation": "operational"
-        }
+            "image_generation": client.service_status(client.image_url),
+            "text_generation": client.service_status(client.text_url), 
+            "audio_generation": client.service_status(client.audio_url)
+        },
+        "upstream_breakers": client.breaker_stats(),
+        "upstream_limits": client.limiter_stats(),
+        "upstream_pool": client.pool_stats(),
+        "coalesced_requests": client.coalesced,
+        "cache_revalidations": client.revalidations,
+        "rate_limits": state.limiter.stats(),
+        "jobs": state.jobs.stats(),
+        "cache": state.cache.stats(),
+        "response_cache": state.response_cache.stats(),
+        "assets": state.asset_store.stats() if state.asset_store is not None else None
     }
 
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus metrics"""
+    return Response(metrics.render(request.app.state.runtime_metrics), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@router.get("/api/admin/profiles/{profile_id}", include_in_schema=False)
+async def get_profile(request: Request, profile_id: str, x_admin_key: Optional[str] = Header(None)):
+    """Profile captured for a request sent with X-Profile: 1 and the admin key"""
+    admin_key = app_settings(request).admin_api_key
+    if not admin_key or not x_admin_key or not hmac.compare_digest(x_admin_key, admin_key):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin key required")
+    html = request.app.state.profiles.get(profile_id)
+    if html is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return HTMLResponse(html)
+
+@router.get("/api/assets/{asset_id}")
+async def get_asset(request: Request, asset_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Serve stored image/audio bytes straight from disk (sendfile where the
+    server supports it), with Range support. Asset ids are content hashes,
+    so responses are immutable and need no API key to embed.
+    """
+    asset_store = request.app.state.asset_store
+    asset = asset_store.get(asset_id) if asset_store is not None else None
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    headers = {"ETag": asset.etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and (if_none_match.strip() == "*" or asset.etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+
+def upstream_unavailable(error: CircuitOpenError) -> HTTPException:
+    """503 for calls short-circuited while an upstream host is failing"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, int(error.retry_after)))},
+    )
+
 # API Endpoints (protected by API key if configured)
-@app.post("/api/generate/image")
-@limiter.limit("10/minute")
+@router.post("/api/generate/image", response_model=ImageResult, response_model_exclude_unset=True, dependencies=[Depends(rate_limit("image"))])
 async def generate_image(
     request: Request,
     generation_request: GenerationRequest,
@@ -352,7 +1074,7 @@ async def generate_image(
     Generate an image using Pollinations AI
     """
     try:
-        result = await client.generate_image(
+        result = await app_client(request).generate_image(
             prompt=generation_request.prompt,
             model=generation_request.model,
             width=generation_request.width,
@@ -362,6 +1084,10 @@ async def generate_image(
             private=generation_request.private
         )
         return result
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except CachedUpstreamError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate image: {e}", headers={"X-Cache": NEGATIVE})
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
@@ -373,21 +1099,69 @@ async def generate_image(
             detail=f"Failed to generate image: {str(e)}"
         )
 
-@app.post("/api/generate/text")
-@limiter.limit("30/minute")
-async def generate_text(
+@router.post("/api/generate/image/stream", dependencies=[Depends(rate_limit("image"))])
+async def stream_image(
     request: Request,
     generation_request: GenerationRequest,
     _: bool = Depends(verify_api_key)
 ):
     """
-    Generate text using enhanced templates
+    Generate an image and relay its bytes as they arrive from Pollinations AI
     """
     try:
-        result = await client.generate_text(
+        relay = await app_client(request).stream_image(
             prompt=generation_request.prompt,
-            model=generation_request.model
+            model=generation_request.model,
+            width=generation_request.width,
+            height=generation_request.height,
+            seed=generation_request.seed,
+            nologo=generation_request.nologo,
+            private=generation_request.private
+        )
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Pollinations API error: {str(e)}"
         )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate image: {str(e)}"
+        )
+    
+    response = relay.response
+    headers = {"X-Image-URL": str(response.url)}
+    for header in ("content-length", "content-encoding"):
+        if header in response.headers:
+            headers[header] = response.headers[header]
+    return StreamingResponse(
+        relay.aiter_raw(),
+        media_type=response.headers.get("content-type", "image/jpeg"),
+        headers=headers,
+        background=BackgroundTask(relay.aclose)
+    )
+
+def text_params(generation_request: GenerationRequest) -> Dict[str, Any]:
+    """Text generation arguments; the request's "flux" model default is an image model, so only an explicit model is kept"""
+    return {
+        "prompt": generation_request.prompt,
+        "model": generation_request.model if "model" in generation_request.model_fields_set else None,
+        "seed": generation_request.seed,
+    }
+
+@router.post("/api/generate/text", response_model=TextResult, response_model_exclude_unset=True, dependencies=[Depends(rate_limit("text"))])
+async def generate_text(
+    request: Request,
+    generation_request: GenerationRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Generate text with Pollinations, falling back to enhanced templates
+    """
+    try:
+        result = await app_client(request).generate_text(**text_params(generation_request))
         return result
     except Exception as e:
         raise HTTPException(
@@ -395,8 +1169,50 @@ async def generate_text(
             detail=f"Failed to generate text: {str(e)}"
         )
 
-@app.post("/api/generate/audio")
-@limiter.limit("20/minute")
+@router.post("/api/generate/text/stream", dependencies=[Depends(rate_limit("text"))])
+async def generate_text_stream(
+    request: Request,
+    generation_request: GenerationRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Generate text, sending it as it is produced.
+    Sends Server-Sent Events ("text" events, then "done" with the source,
+    metadata and cache state) when the client accepts text/event-stream,
+    and the bare text as a chunked response otherwise. Each chunk is sent
+    before the next one is read from upstream, so a slow client slows the
+    upstream read rather than filling memory.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    chunks = app_client(request).generate_text_stream(**text_params(generation_request))
+
+    async def events():
+        try:
+            async for kind, value in chunks:
+                if not sse:
+                    if kind == "text":
+                        yield value.encode()
+                    continue
+                if kind == "text":
+                    yield b"event: text\ndata: " + dumps({"text": value}) + b"\n\n"
+                else:
+                    yield b"event: done\ndata: " + dumps(value) + b"\n\n"
+        except (CircuitOpenError, httpx.HTTPError) as e:
+            # Upstream broke off mid-answer; plain-text clients see a short body
+            logger.warning("Text stream cut off", extra={"fields": {"error": str(e) or type(e).__name__}})
+            if sse:
+                yield b"event: error\ndata: " + dumps({"error": "Upstream text stream interrupted"}) + b"\n\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "text/plain; charset=utf-8",
+        # Disable proxy buffering so nginx forwards each chunk immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/generate/audio", response_model=AudioResult, response_model_exclude_unset=True, dependencies=[Depends(rate_limit("audio"))])
 async def generate_audio(
     request: Request,
     audio_request: AudioRequest,
@@ -406,76 +1222,457 @@ async def generate_audio(
     Generate audio using Pollinations TTS
     """
     try:
-        result = await client.generate_audio(
+        result = await app_client(request).generate_audio(
             text=audio_request.prompt,
             voice=audio_request.voice,
             speed=audio_request.speed,
             response_format=audio_request.response_format
         )
         return result
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate audio: {str(e)}"
         )
 
-@app.post("/api/batch")
-@limiter.limit("5/minute")
+# Cacheable GET variants: the result is fully determined by the query
+# parameters, so browsers and nginx proxy_cache can keep it
+def _query_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def canonical_query(params: Dict[str, Any], defaults: Dict[str, Any]) -> str:
+    """Sorted query string leaving out parameters at their defaults"""
+    return urlencode(sorted(
+        (name, _query_value(value))
+        for name, value in params.items()
+        if value is not None and defaults.get(name) != value
+    ))
+
+def http_cache_headers(policy: CachePolicy, private: bool = False) -> Dict[str, str]:
+    # Shared caches must not hand results of an authenticated API to anyone else
+    visibility = "private" if private else "public"
+    return {"Cache-Control": f"{visibility}, max-age={int(policy.fresh_ttl)}, stale-while-revalidate={int(policy.stale_ttl)}"}
+
+async def cacheable_generation(request: Request, kind: str, params: Dict[str, Any], defaults: Dict[str, Any], key: str, generate):
+    """
+    Answer a GET generation request with HTTP caching. Non-canonical query
+    strings are redirected to the canonical URL so caches see one URL per
+    result. The strong ETag comes from the result-cache key, so a matching
+    If-None-Match gets a 304 before anything is generated. Per-response
+    fields (cache state, timestamp) are left out of the body.
+    """
+    query = canonical_query(params, defaults)
+    if request.url.query != query:
+        return RedirectResponse(f"{request.url.path}?{query}", status_code=status.HTTP_308_PERMANENT_REDIRECT)
+
+    etag = f'"{key.replace(":", "-")}"'
+    policy = app_client(request).policies[kind]
+    headers = {"ETag": etag, **http_cache_headers(policy, private=app_settings(request).auth_enabled)}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        result = await generate()
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
+    except CachedUpstreamError as e:
+        raise HTTPException(status_code=500, detail=str(e), headers={"Cache-Control": "no-store", "X-Cache": NEGATIVE})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e), headers={"Cache-Control": "no-store"})
+
+    state = result.pop("cache", MISS)
+    metadata = dict(result.get("metadata") or {})
+    if state == NEGATIVE or "error" in result or "error" in metadata:
+        # Fallback answers are not the deterministic result
+        return ORJSONResponse(result, headers={"Cache-Control": "no-store", "X-Cache": state})
+    metadata.pop("timestamp", None)
+    return ORJSONResponse({**result, "metadata": metadata}, headers={**headers, "X-Cache": state})
+
+@router.get("/api/generate/image", dependencies=[Depends(rate_limit("image"))])
+async def generate_image_cacheable(
+    request: Request,
+    prompt: str = Query(..., min_length=1, max_length=1000),
+    seed: int = Query(..., description="Required: the same seed always yields the same image"),
+    model: str = Query("flux"),
+    width: int = Query(1024, ge=256, le=2048),
+    height: int = Query(1024, ge=256, le=2048),
+    nologo: bool = Query(False),
+    private: bool = Query(False),
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Generate an image with a cacheable GET
+    """
+    params = {"prompt": prompt, "seed": seed, "model": model, "width": width, "height": height, "nologo": nologo, "private": private}
+    client = app_client(request)
+    return await cacheable_generation(
+        request, "image", params, client.IMAGE_DEFAULTS, client.cache_key("image", **params),
+        lambda: client.generate_image(**params),
+    )
+
+@router.get("/api/generate/text", dependencies=[Depends(rate_limit("text"))])
+async def generate_text_cacheable(
+    request: Request,
+    prompt: str = Query(..., min_length=1, max_length=1000),
+    seed: int = Query(..., description="Required: the same seed always yields the same text"),
+    model: str = Query("openai"),
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Generate text with a cacheable GET
+    """
+    params = {"prompt": prompt, "seed": seed, "model": model}
+    client = app_client(request)
+    return await cacheable_generation(
+        request, "text", params, client.TEXT_DEFAULTS, client.cache_key("text", **params),
+        lambda: client.generate_text(prompt=prompt, model=model, seed=seed),
+    )
+
+@router.get("/api/generate/audio", dependencies=[Depends(rate_limit("audio"))])
+async def generate_audio_cacheable(
+    request: Request,
+    prompt: str = Query(..., min_length=1, max_length=1000),
+    voice: str = Query("alloy"),
+    speed: float = Query(1.0, ge=0.25, le=4.0),
+    response_format: str = Query("mp3"),
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Generate audio with a cacheable GET (speech is already determined by
+    its text and voice, so no seed is needed)
+    """
+    params = {"prompt": prompt, "voice": voice, "speed": speed, "response_format": response_format}
+    client = app_client(request)
+    return await cacheable_generation(
+        request, "audio", params, client.AUDIO_DEFAULTS,
+        client.cache_key("audio", text=prompt, voice=voice, speed=speed, response_format=response_format),
+        lambda: client.generate_audio(text=prompt, voice=voice, speed=speed, response_format=response_format),
+    )
+
+async def run_batch_item(client: PollinationsClient, req: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """Run one batch item, isolating its errors and per-item timeout"""
+    try:
+        if req.get("type") == "image":
+            call = client.generate_image(**{k: v for k, v in req.items() if k != "type"})
+        elif req.get("type") == "text":
+            call = client.generate_text(**{k: v for k, v in req.items() if k != "type"})
+        elif req.get("type") == "audio":
+            call = client.generate_audio(**{k: v for k, v in req.items() if k != "type"})
+        else:
+            return {"status": "success", "result": {"error": "Invalid request type. Use 'image', 'text', or 'audio'"}}
+        result = await asyncio.wait_for(call, timeout=timeout)
+        return {"status": "success", "result": result}
+    except asyncio.TimeoutError:
+        return {"status": "error", "error": f"Timed out after {timeout}s"}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+async def iter_batch(client: PollinationsClient, settings: Settings, requests: List[Dict[str, Any]]):
+    """
+    Yield (index, outcome) for batch items as they complete.
+    At most settings.batch_concurrency items are in flight at once, so only
+    that many results are ever held; items unfinished at
+    settings.batch_deadline report a timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.batch_deadline
+    items = iter(enumerate(requests))
+    pending: Dict[asyncio.Task, int] = {}
+
+    def fill():
+        while len(pending) < settings.batch_concurrency:
+            item = next(items, None)
+            if item is None:
+                return
+            index, req = item
+            pending[asyncio.ensure_future(run_batch_item(client, req, settings.batch_item_timeout))] = index
+
+    try:
+        fill()
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield pending.pop(task), task.result()
+            fill()
+    finally:
+        # Deadline reached or the client went away
+        for task in pending:
+            task.cancel()
+
+    error = f"Batch deadline of {settings.batch_deadline}s exceeded"
+    for index in sorted(pending.values()):
+        yield index, {"status": "error", "error": error}
+    for index, _ in items:
+        yield index, {"status": "error", "error": error}
+
+@router.post("/api/batch", response_model=BatchResponse, responses=MSGPACK_RESPONSE, dependencies=[Depends(rate_limit("batch"))])
 async def batch_generate(
     request: Request,
     batch_request: BatchRequest,
     _: bool = Depends(verify_api_key)
 ):
     """
-    Batch process multiple generation requests
+    Batch process multiple generation requests.
+    Responds with msgpack when the client accepts application/msgpack.
     """
-    results = []
-    for req in batch_request.requests:
-        try:
-            if req.get("type") == "image":
-                result = await client.generate_image(**{k: v for k, v in req.items() if k != "type"})
-            elif req.get("type") == "text":
-                result = await client.generate_text(**{k: v for k, v in req.items() if k != "type"})
-            elif req.get("type") == "audio":
-                result = await client.generate_audio(**{k: v for k, v in req.items() if k != "type"})
-            else:
-                result = {"error": "Invalid request type. Use 'image', 'text', or 'audio'"}
-            results.append({"status": "success", "result": result})
-        except Exception as e:
-            results.append({"status": "error", "error": str(e)})
-    return {"results": results}
+    client = app_client(request)
+    with span("prefetch"):
+        await client.prefetch(batch_request.requests)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(batch_request.requests)
+    with span("batch", size=len(batch_request.requests)):
+        async for index, outcome in iter_batch(client, app_settings(request), batch_request.requests):
+            results[index] = outcome
+    payload = BatchResponse(results=results).model_dump(mode="json", exclude_unset=True)
+    return negotiate(request.headers.get("accept", ""), payload)
+
+@router.post("/api/batch/stream", responses=MSGPACK_RESPONSE, dependencies=[Depends(rate_limit("batch"))])
+async def batch_generate_stream(
+    request: Request,
+    batch_request: BatchRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Batch process multiple generation requests, streaming each result as it completes.
+    Sends Server-Sent Events when the client accepts text/event-stream, a
+    sequence of msgpack objects when it accepts application/msgpack, and
+    NDJSON otherwise.
+    """
+    accept = request.headers.get("accept", "")
+    sse = "text/event-stream" in accept
+    packed = not sse and wants_msgpack(accept)
+    client = app_client(request)
+    with span("prefetch"):
+        await client.prefetch(batch_request.requests)
+
+    async def events():
+        count = 0
+        async for index, outcome in iter_batch(client, app_settings(request), batch_request.requests):
+            if packed:
+                # msgpack objects are self-delimiting; read them with msgpack.Unpacker
+                yield pack({"index": index, **outcome})
+                continue
+            line = dumps({"index": index, **outcome})
+            yield b"event: result\ndata: " + line + b"\n\n" if sse else line + b"\n"
+            count += 1
+        if sse:
+            yield b"event: done\ndata: " + dumps({"count": count}) + b"\n\n"
+
+    if sse:
+        media_type = "text/event-stream"
+    elif packed:
+        media_type = MsgPackResponse.media_type
+    else:
+        media_type = "application/x-ndjson"
+    return StreamingResponse(
+        events(),
+        media_type=media_type,
+        # Disable proxy buffering so nginx forwards each result immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def submit_job(request: Request, job_type: str, params: Dict[str, Any]):
+    try:
+        job = await request.app.state.jobs.submit(job_type, params)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"},
+        )
+    status_url = f"/api/jobs/{job.id}"
+    return ORJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job.id, "status": job.status, "status_url": status_url},
+        headers={"Location": status_url},
+    )
+
+@router.post("/api/jobs/image", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit("image"))])
+async def submit_image_job(
+    request: Request,
+    generation_request: GenerationRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Queue an image generation and return its job id immediately
+    """
+    return await submit_job(request, "image", generation_request.model_dump())
+
+@router.post("/api/jobs/text", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit("text"))])
+async def submit_text_job(
+    request: Request,
+    generation_request: GenerationRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Queue a text generation and return its job id immediately
+    """
+    return await submit_job(request, "text", text_params(generation_request))
+
+@router.post("/api/jobs/audio", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(rate_limit("audio"))])
+async def submit_audio_job(
+    request: Request,
+    audio_request: AudioRequest,
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Queue an audio generation and return its job id immediately
+    """
+    return await submit_job(request, "audio", audio_request.model_dump())
+
+@router.get("/api/jobs/stats")
+async def job_stats(request: Request, _: bool = Depends(verify_api_key)):
+    """
+    Job queue depth, worker usage and queue wait times
+    """
+    return request.app.state.jobs.stats()
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(
+    request: Request,
+    job_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Seconds to long-poll for completion"),
+    _: bool = Depends(verify_api_key)
+):
+    """
+    Job status, with its result once finished
+    """
+    job = await request.app.state.jobs.wait(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 # Error handlers
-@app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
-@app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"},
     )
 
-# Startup event
-@app.on_event("startup")
-async def startup_event():
-    """Initialize resources on startup"""
-    auth_status = "enabled" if API_KEY else "disabled"
-    print(f"🚀 Starting PolyCraft API v1.0.0")
-    print(f"🔐 Authentication: {auth_status}")
-    print(f"🎨 Image generation: Pollinations AI (Flux)")
-    print(f"📝 Text generation: Enhanced templates")
-    print(f"🔊 Audio generation: Pollinations TTS")
-    # Initialize rate limiter
-    app.state.limiter = limiter
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup resources on shutdown"""
-    await client.client.aclose()
-    print("👋 PolyCraft API shutdown complete")
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the app's background work on startup and release it on shutdown"""
+    state = app.state
+    start_logging()
+    logger.info("Starting PolyCraft API", extra={"fields": {
+        "version": app.version,
+        "auth": "enabled" if state.settings.auth_enabled else "disabled",
+        "image": "Pollinations AI (Flux)",
+        "text": "Pollinations text" if state.client.text_upstream else "Enhanced templates",
+        "audio": "Pollinations TTS",
+    }})
+    if state.asset_store is not None:
+        # Index the assets kept from earlier runs without blocking the loop
+        await asyncio.to_thread(state.asset_store.load)
+    if state.span_exporter is not None:
+        state.span_exporter.start()
+    # Expire cache entries that are never read again
+    state.cache.start_sweeper()
+    await state.jobs.start()
+    try:
+        yield
+    finally:
+        await state.jobs.stop()
+        await state.cache.aclose()
+        # The upstream pool is rebuilt on first use if the app starts again
+        await state.client.aclose()
+        if state.span_exporter is not None:
+            state.span_exporter.close()
+        logger.info("PolyCraft API shutdown complete")
+        stop_logging()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the API. Without explicit settings they are read from the
+    environment. Each app gets its own cache, upstream client, rate limiter,
+    job queue, response cache, asset store and span exporter, built here
+    without touching the disk or network; the lifespan starts them. Tests
+    build one app per scenario instead of reloading this module.
+    """
+    app = FastAPI(
+        title="PolyCraft API",
+        description="AI-Powered Multi-Modal Generation Platform",
+        version="1.0.0",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
+    )
+    state = app.state
+    state.settings = settings if settings is not None else Settings()
+    state.profiles = Profiles()
+    settings = state.settings
+    state.cache = create_cache(settings)
+    # Generated image/audio bytes kept on disk (opt-in via ASSET_STORE_DIR)
+    state.asset_store = create_asset_store(settings)
+    # Repeated generation requests answered with stored response bytes
+    state.response_cache = ResponseCache(
+        ["/api/generate/image", "/api/generate/text", "/api/generate/audio"],
+        enabled=settings.response_cache_enabled,
+        max_entries=settings.response_cache_max_entries,
+        max_bytes=settings.response_cache_max_bytes,
+    )
+    state.client = PollinationsClient(
+        settings, cache=state.cache, asset_store=state.asset_store, response_cache=state.response_cache
+    )
+    # Token buckets, shared through Redis when configured
+    state.limiter = create_rate_limiter(settings)
+    # Background job queue for long-running generations
+    state.jobs = JobManager(
+        partial(run_job, state.client),
+        create_job_store(settings),
+        workers=settings.job_workers,
+        max_queue=settings.job_queue_size,
+        result_ttl=settings.job_result_ttl,
+    )
+    # Span records go to TRACE_EXPORT_PATH when set
+    state.span_exporter = create_span_exporter(settings)
+    # Scrape-time cache, upstream and job figures for /metrics
+    state.runtime_metrics = metrics.runtime_registry(state.cache, state.client, state.jobs)
+    app.include_router(router)
+    app.add_exception_handler(HTTPException, http_exception_handler)
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    # Repeated generation requests answered from response_cache (inside
+    # CORS so its headers are computed per request, never replayed)
+    app.add_middleware(ResponseCacheMiddleware, cache=state.response_cache)
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Per-phase spans for Server-Timing, span export and admin profiling
+    app.add_middleware(
+        TracingMiddleware,
+        exporter=state.span_exporter,
+        admin_key=state.settings.admin_api_key,
+        profiles=state.profiles,
+    )
+
+    # Correlation ids and sampled JSON access logs, around everything but metrics
+    app.add_middleware(AccessLogMiddleware)
+
+    # Request metrics (outermost, so it times the whole middleware stack)
+    app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+app = create_app(settings)
@@ -0,0 +1,150 @@
+from typing import Any, Optional
+import time
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Dedicated registry for the process-wide request series, shared by every
+# app create_app() builds; per-app figures live in runtime_registry()
+registry = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUESTS = Counter(
+    "polycraft_requests_total", "HTTP requests handled", ["route", "method", "status"], registry=registry
+)
+REQUEST_LATENCY = Histogram(
+    "polycraft_request_duration_seconds", "HTTP request latency", ["route"], buckets=LATENCY_BUCKETS, registry=registry
+)
+IN_FLIGHT = Gauge("polycraft_requests_in_flight", "HTTP requests currently being handled", registry=registry)
+UPSTREAM_LATENCY = Histogram(
+    "polycraft_upstream_duration_seconds", "Pollinations call latency", ["host"], buckets=LATENCY_BUCKETS, registry=registry
+)
+UPSTREAM_RESPONSES = Counter(
+    "polycraft_upstream_responses_total", "Pollinations responses by status code", ["host", "status"], registry=registry
+)
+UPSTREAM_RETRIES = Counter(
+    "polycraft_upstream_retries_total", "Pollinations calls retried after a transient failure", ["host"], registry=registry
+)
+TEXT_FIRST_TOKEN = Histogram(
+    "polycraft_text_first_token_seconds", "Time from requesting upstream text to its first token",
+    buckets=LATENCY_BUCKETS, registry=registry
+)
+RATE_LIMITED = Counter(
+    "polycraft_rate_limit_rejections_total", "Requests rejected by the rate limiter", ["route"], registry=registry
+)
+
+
+def route_name(scope: dict) -> str:
+    """Route label from the matched endpoint name, bounded to known routes"""
+    route = scope.get("route")
+    return getattr(route, "name", None) or "unmatched"
+
+
+def observe_upstream(host: str, status: Any, seconds: float) -> None:
+    UPSTREAM_LATENCY.labels(host).observe(seconds)
+    UPSTREAM_RESPONSES.labels(host, str(status)).inc()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route request counts, latency and
+    in-flight requests. Streaming responses are timed until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            # The router records the matched route on the shared scope
+            route = route_name(scope)
+            REQUEST_LATENCY.labels(route).observe(time.perf_counter() - started)
+            REQUESTS.labels(route, scope["method"], str(status_code)).inc()
+
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class RuntimeCollector:
+    """Cache, upstream and job queue figures read at scrape time, so they cost nothing per request"""
+
+    def __init__(self, cache, client, jobs):
+        self.cache = cache
+        self.client = client
+        self.jobs = jobs
+
+    def collect(self):
+        stats = self.cache.stats()
+        lookups = CounterMetricFamily("polycraft_cache_lookups", "Cache lookups by outcome", labels=["result"])
+        lookups.add_metric(["l1_hit"], stats["l1_hits"])
+        lookups.add_metric(["l2_hit"], stats["l2_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        yield CounterMetricFamily("polycraft_cache_evictions", "Cache entries evicted for space", value=stats["l1"]["evictions"])
+        yield CounterMetricFamily("polycraft_cache_l2_errors", "Failed shared cache operations", value=stats["l2_errors"])
+        yield GaugeMetricFamily("polycraft_cache_entries", "Entries in the local cache", value=stats["l1"]["entries"])
+        yield GaugeMetricFamily("polycraft_cache_bytes", "Approximate size of the local cache", value=stats["l1"]["bytes"])
+
+        yield CounterMetricFamily(
+            "polycraft_upstream_coalesced", "Upstream calls saved by request coalescing", value=self.client.coalesced
+        )
+        yield CounterMetricFamily(
+            "polycraft_cache_revalidations", "Stale cache entries refreshed in the background", value=self.client.revalidations
+        )
+        pool = self.client.pool_stats()
+        connections = GaugeMetricFamily("polycraft_upstream_connections", "Upstream pool connections", labels=["state"])
+        connections.add_metric(["active"], pool["active"])
+        connections.add_metric(["idle"], pool["idle"])
+        connections.add_metric(["queued"], pool["queued"])
+        yield connections
+
+        breakers = GaugeMetricFamily(
+            "polycraft_upstream_circuit_state", "Circuit breaker state per host (0 closed, 1 half-open, 2 open)", labels=["host"]
+        )
+        for host, breaker in self.client.breaker_stats().items():
+            breakers.add_metric([host], BREAKER_STATES[breaker["state"]])
+        yield breakers
+
+        limits = GaugeMetricFamily("polycraft_upstream_concurrency_limit", "Adaptive concurrency limit per host", labels=["host"])
+        waiting = GaugeMetricFamily("polycraft_upstream_limiter_queued", "Calls waiting for an upstream slot", labels=["host"])
+        for host, limiter in self.client.limiter_stats().items():
+            limits.add_metric([host], limiter["limit"])
+            waiting.add_metric([host], limiter["queued"])
+        yield limits
+        yield waiting
+
+        jobs = self.jobs.stats()
+        yield GaugeMetricFamily("polycraft_job_queue_depth", "Jobs waiting for a worker", value=jobs["queue_depth"])
+        yield GaugeMetricFamily("polycraft_jobs_running", "Jobs currently executing", value=jobs["running"])
+
+
+def runtime_registry(cache, client, jobs) -> CollectorRegistry:
+    """Scrape-time stats for one app's objects, kept apart from the process-wide series"""
+    runtime = CollectorRegistry()
+    runtime.register(RuntimeCollector(cache, client, jobs))
+    return runtime
+
+
+def render(runtime: Optional[CollectorRegistry] = None) -> bytes:
+    output = generate_latest(registry)
+    if runtime is not None:
+        output += generate_latest(runtime)
+    return output
@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import hashlib
+import hmac
+import logging
+import time
+
+from settings import Settings
+
+# Atomic token bucket: refill from elapsed server time, take one token,
+# and let idle buckets expire. One round trip and O(1) work per check.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1000)
+return {allowed, tostring(tokens), retry_after}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+
+
+class MemoryBuckets:
+    """Per-process token buckets, used without a shared store or when it is unreachable"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (tokens, last refill in ms)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float):
+        now = time.monotonic() * 1000
+        tokens, ts = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # Forgetting the least recently seen client only refills its bucket
+            self._buckets.popitem(last=False)
+        retry_after = 0 if allowed else (1 - tokens) / rate / 1000
+        return allowed, tokens, retry_after
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker through a Redis-protocol store"""
+
+    def __init__(self, redis, prefix: str = "polycraft:ratelimit:"):
+        self.redis = redis
+        self.prefix = prefix
+        self._script = redis.register_script(TOKEN_BUCKET_LUA)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBuckets":
+        import redis.asyncio as aioredis
+
+        return cls(aioredis.from_url(url))
+
+    async def take(self, key: str, capacity: int, rate: float):
+        allowed, tokens, retry_after = await self._script(keys=[self.prefix + key], args=[capacity, rate])
+        return bool(allowed), float(tokens), retry_after / 1000
+
+
+class RateLimiter:
+    """
+    Tier-aware token-bucket rate limiting.
+
+    Each scope (image, text, audio, batch) allows ``RATE_LIMIT_<SCOPE>``
+    requests per minute on the free tier, multiplied per tier by
+    ``RATE_LIMIT_TIER_MULTIPLIERS``. Clients are identified by API key when
+    they send a tier key, otherwise by client IP. Buckets live in the shared store
+    when one is configured and fall back to per-process buckets if it fails.
+    """
+
+    SCOPES = ("image", "text", "audio", "batch")
+
+    def __init__(self, shared=None, settings: Optional[Settings] = None):
+        settings = settings or Settings()
+        self.enabled = settings.rate_limit_enabled
+        self.limits = {scope: getattr(settings, f"rate_limit_{scope}") for scope in self.SCOPES}
+        self.multipliers = {"free": 1.0, "pro": 5.0, "enterprise": 20.0}
+        for item in filter(None, settings.rate_limit_tier_multipliers.split(",")):
+            tier, _, value = item.partition("=")
+            self.multipliers[tier.strip()] = float(value)
+        self.tier_keys = {
+            tier: set(filter(None, getattr(settings, f"api_keys_{tier}").split(",")))
+            for tier in ("pro", "enterprise")
+        }
+        self.trusted_proxy_hops = settings.trusted_proxy_hops
+        self.shared = shared
+        self.local = MemoryBuckets()
+        self.shared_errors = 0
+
+    def tier_key(self, api_key: Optional[str]) -> Optional[str]:
+        """
+        ``api_key`` if it is listed in API_KEYS_PRO or API_KEYS_ENTERPRISE,
+        else None. Only these keys get a bucket of their own: any other value
+        is either client-chosen (a fresh bucket per request) or the shared
+        BACKEND_API_KEY (one bucket for every caller).
+        """
+        if not api_key:
+            return None
+        encoded = api_key.encode()
+        for keys in self.tier_keys.values():
+            if any(hmac.compare_digest(encoded, key.encode()) for key in keys):
+                return api_key
+        return None
+
+    def tier_for(self, api_key: Optional[str]) -> str:
+        if api_key:
+            if api_key in self.tier_keys["enterprise"]:
+                return "enterprise"
+            if api_key in self.tier_keys["pro"]:
+                return "pro"
+        return "free"
+
+    def client_ip(self, headers, peer: Optional[str]) -> str:
+        """
+        Client address as seen by our own proxies. Only the last
+        TRUSTED_PROXY_HOPS entries of X-Forwarded-For were written by them;
+        anything further left is client-supplied and ignored. The default of
+        0 uses the peer address; only raise it when the API cannot be reached
+        except through those proxies.
+        """
+        forwarded = [part.strip() for part in headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if forwarded and self.trusted_proxy_hops > 0:
+            return forwarded[-min(self.trusted_proxy_hops, len(forwarded))]
+        return peer or "unknown"
+
+    def identity(self, headers, peer: Optional[str], api_key: Optional[str]) -> str:
+        if api_key:
+            return "key:" + hashlib.blake2b(api_key.encode(), digest_size=12).hexdigest()
+        return "ip:" + self.client_ip(headers, peer)
+
+    def limit_for(self, scope: str, tier: str) -> int:
+        return max(1, int(self.limits[scope] * self.multipliers.get(tier, 1.0)))
+
+    async def check(self, scope: str, identity: str, tier: str) -> RateLimitResult:
+        limit = self.limit_for(scope, tier)
+        rate = limit / 60_000  # tokens per millisecond
+        key = f"{scope}:{identity}"
+        buckets = self.local if self.shared is None else self.shared
+        try:
+            allowed, tokens, retry_after = await buckets.take(key, limit, rate)
+        except Exception:
+            # An unreachable shared store degrades to per-process limits
+            self.shared_errors += 1
+            allowed, tokens, retry_after = await self.local.take(key, limit, rate)
+        return RateLimitResult(allowed, limit, int(tokens), retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "store": type(self.shared).__name__ if self.shared is not None else "MemoryBuckets",
+            "limits_per_minute": self.limits,
+            "tier_multipliers": self.multipliers,
+            "shared_errors": self.shared_errors,
+        }
+
+
+def create_rate_limiter(settings: Optional[Settings] = None) -> RateLimiter:
+    """Share buckets through RATE_LIMIT_REDIS_URL (or CACHE_REDIS_URL) when set"""
+    settings = settings or Settings()
+    url = settings.rate_limit_redis_url or settings.cache_redis_url
+    shared = None
+    if url:
+        try:
+            shared = RedisBuckets.from_url(url)
+        except ImportError:
+            logging.getLogger("polycraft.ratelimit").warning(
+                "A Redis URL is set but 'redis' is not installed, using per-process rate limits"
+            )
+    return RateLimiter(shared, settings)
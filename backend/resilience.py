@@ -0,0 +1,200 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import random
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be failing"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Upstream {name} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one upstream host.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``recovery_timeout`` seconds. Then a single probe is
+    let through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        if self.state == OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Forget a call that ended without a verdict (e.g. the caller was cancelled)"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and full jitter.
+
+    ``retries`` is the number of extra attempts after the first one; each
+    wait is drawn uniformly from [0, min(max_delay, base_delay * 2**n)].
+    """
+
+    def __init__(self, retries: int = 2, base_delay: float = 0.2, max_delay: float = 2):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        is_retryable: Callable[[Exception], bool],
+        on_retry: Optional[Callable[[Exception], None]] = None,
+    ) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one upstream host.
+
+    Each healthy response raises the limit by roughly one per window of
+    ``limit`` calls (additive increase); a timeout, a throttling answer or a
+    latency spike multiplies it by ``backoff`` (multiplicative decrease), at
+    most once per typical round trip. Latency spikes are measured against an
+    EWMA of recent healthy latencies. Callers beyond the limit wait in FIFO
+    order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = 10,
+        min_limit: float = 1,
+        max_limit: float = 50,
+        backoff: float = 0.5,
+        tolerance: float = 2,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.decreases = 0
+        self._last_decrease = float("-inf")
+        self._waiters: deque = deque()
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the caller gave up
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: Optional[float] = None, dropped: bool = False) -> None:
+        """
+        Free a slot and adapt the limit. ``latency`` is the call duration
+        (None when the call gave no signal, e.g. it was cancelled) and
+        ``dropped`` marks timeouts and throttling answers.
+        """
+        self.in_flight -= 1
+        if dropped or (latency is not None and self.baseline is not None and latency > self.tolerance * self.baseline):
+            self._decrease()
+        elif latency is not None:
+            self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        # A burst of failures from one overloaded moment counts once
+        if now - self._last_decrease < (self.baseline or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.decreases += 1
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "baseline_latency": self.baseline,
+            "decreases": self.decreases,
+        }
@@ -0,0 +1,184 @@
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional
+import hashlib
+import json
+import time
+
+from cache import FRESH, InMemoryCache
+
+# Set by the middleware for each request it may cache; the result cache
+# records which entry answered the request and until when it is fresh.
+_result: ContextVar[Optional[Dict[str, Any]]] = ContextVar("response_cache_result", default=None)
+
+
+def note_result(key: str, state: str, fresh_until: Optional[float]) -> None:
+    """Tell the response cache which result-cache entry served this request"""
+    holder = _result.get()
+    if holder is not None:
+        holder.update(key=key, state=state, fresh_until=fresh_until)
+
+
+class ResponseCache:
+    """
+    Final response bytes for generation requests, keyed on route, canonical
+    JSON body, Accept header and credentials.
+
+    A response is only stored when the result cache answered with a fresh
+    entry, and it expires when that entry stops being fresh, so a hit never
+    returns anything the endpoint would not. ``invalidate`` drops every
+    response built from a result-cache key when that entry is rewritten.
+    """
+
+    def __init__(self, paths: Iterable[str], enabled: bool = True, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024):
+        self.paths = frozenset(paths)
+        self.enabled = enabled
+        self.store = InMemoryCache(max_entries=max_entries, max_bytes=max_bytes, admission="lru")
+        # result-cache key -> response keys built from it
+        self._dependents: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, scope, body: bytes) -> Optional[str]:
+        """Cache key for a request, or None when it cannot be cached"""
+        if not self.enabled or scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return None
+        try:
+            canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            return None
+        headers = dict(scope["headers"])
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (
+            scope["path"].encode(),
+            canonical.encode(),
+            headers.get(b"accept", b""),
+            # Auth scope: entries are only shared between identical credentials
+            headers.get(b"authorization", b""),
+            headers.get(b"x-api-key", b""),
+        ):
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.store.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, result: Dict[str, Any], response: Dict[str, Any]) -> None:
+        if result.get("state") != FRESH or result.get("fresh_until") is None:
+            return
+        ttl = result["fresh_until"] - time.time()
+        if ttl <= 0:
+            return
+        self.store.set(key, response, ttl=ttl)
+        self._dependents.setdefault(result["key"], set()).add(key)
+        if len(self._dependents) > self.store.max_entries * 2:
+            # Forget links to responses that have already been evicted
+            self._dependents = {
+                result_key: live
+                for result_key, keys in self._dependents.items()
+                if (live := {k for k in keys if k in self.store})
+            }
+
+    def invalidate(self, result_key: str) -> None:
+        for key in self._dependents.pop(result_key, ()):
+            self.store.delete(key)
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.store),
+            "bytes": self.store.stats()["bytes"],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+class ResponseCacheMiddleware:
+    """
+    Pure ASGI middleware answering repeated generation requests from
+    ``ResponseCache`` without running validation, dependencies, the
+    endpoint or JSON encoding. Hits are therefore not charged against the
+    rate limit; they cost no upstream work.
+    """
+
+    def __init__(self, app, cache: ResponseCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.cache.paths:
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Client went away before sending the body
+                await self.app(scope, receive, send)
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        key = self.cache.key(scope, body)
+        if key is not None:
+            entry = self.cache.get(key)
+            if entry is not None:
+                # Keeps the per-route metrics label on hits
+                scope["route"] = entry["route"]
+                await send({"type": "http.response.start", "status": entry["status"], "headers": entry["headers"]})
+                await send({"type": "http.response.body", "body": entry["body"]})
+                return
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        if key is None:
+            await self.app(scope, replay, send)
+            return
+
+        response = {"status": None, "headers": None, "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        holder: Dict[str, Any] = {}
+        token = _result.set(holder)
+        try:
+            await self.app(scope, replay, capture)
+        finally:
+            _result.reset(token)
+
+        if response["status"] == 200 and holder:
+            # Per-caller headers such as remaining rate limit are not replayed
+            headers = [(name, value) for name, value in response["headers"] if not name.startswith(b"x-ratelimit-")]
+            headers.append((b"x-response-cache", b"hit"))
+            self.cache.put(key, holder, {
+                "status": 200,
+                "headers": headers,
+                "body": b"".join(response["body"]),
+                "route": scope.get("route"),
+            })
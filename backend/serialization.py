@@ -0,0 +1,69 @@
+from typing import Any, Dict
+
+from starlette.responses import JSONResponse, Response
+import msgpack
+import orjson
+
+from tracing import span
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, the same bytes JSONResponse renders for our payloads"""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def pack(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson instead of the stdlib encoder"""
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize"):
+            return dumps(content)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize"):
+            return pack(content)
+
+
+def _quality(accept: str) -> Dict[str, float]:
+    qualities: Dict[str, float] = {}
+    for part in accept.split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[media_type.lower()] = max(q, qualities.get(media_type.lower(), 0.0))
+    return qualities
+
+
+def wants_msgpack(accept: str) -> bool:
+    """
+    True when the Accept header names msgpack and does not prefer JSON over
+    it. Wildcards keep JSON, so existing clients are unaffected.
+    """
+    qualities = _quality(accept or "")
+    msgpack_q = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return msgpack_q > 0 and msgpack_q >= qualities.get("application/json", 0.0)
+
+
+def negotiate(accept: str, content: Any, **kwargs) -> Response:
+    """Encode content as msgpack or JSON depending on the Accept header"""
+    if wants_msgpack(accept):
+        return MsgPackResponse(content, **kwargs)
+    return ORJSONResponse(content, **kwargs)
@@ -0,0 +1,120 @@
+from typing import Literal, Optional
+
+from pydantic import Field, field_validator
+from pydantic_settings import BaseSettings
+
+
+class Settings(BaseSettings):
+    """
+    Typed application settings, read from the environment (field names in
+    upper case, e.g. BACKEND_API_KEY) when not passed explicitly.
+
+    create_app() builds every per-app subsystem (upstream client, caches,
+    rate limiter, jobs, asset store, span exporter) from these. Logging is
+    process-wide and configured by logs.py at import (LOG_*).
+    """
+
+    # No key configured means open access
+    backend_api_key: Optional[str] = None
+
+    # Key for admin-only hooks such as request profiling; unset disables them
+    admin_api_key: Optional[str] = None
+
+    # Batch execution limits
+    batch_concurrency: int = Field(8, ge=1)
+    batch_item_timeout: float = Field(60, gt=0)
+    batch_deadline: float = Field(120, gt=0)
+
+    # Prefix for local asset URLs in generation results
+    asset_base_url: str = "/api/assets"
+
+    # Pollinations hosts; text-to-speech defaults to the text host
+    pollinations_image_url: str = "https://image.pollinations.ai"
+    pollinations_text_url: str = "https://text.pollinations.ai"
+    pollinations_audio_url: Optional[str] = None
+
+    # Generate text upstream (false: local templates only), and how long a
+    # silent text upstream is waited for before the templates answer
+    text_upstream: bool = True
+    text_upstream_timeout: float = Field(5, gt=0)
+
+    # Upstream connection pool and timeouts
+    upstream_max_connections: int = Field(100, ge=1)
+    upstream_max_keepalive: int = Field(20, ge=0)
+    upstream_keepalive_expiry: float = Field(30, ge=0)
+    upstream_max_per_host: int = Field(50, ge=1)
+    upstream_http2: bool = False
+    upstream_connect_timeout: float = Field(5, gt=0)
+    upstream_read_timeout: float = Field(30, gt=0)
+    upstream_resolve_mode: Literal["stream", "head"] = "stream"
+
+    # Retries, circuit breaking and adaptive (AIMD) per-host concurrency
+    upstream_retries: int = Field(2, ge=0)
+    upstream_retry_base_delay: float = Field(0.2, ge=0)
+    upstream_retry_max_delay: float = Field(2, ge=0)
+    breaker_failure_threshold: int = Field(5, ge=1)
+    breaker_recovery_timeout: float = Field(30, ge=0)
+    upstream_limit_initial: float = Field(10, ge=1)
+    upstream_limit_min: float = Field(1, ge=1)
+    upstream_latency_tolerance: float = Field(2, gt=1)
+
+    # Result cache: local bounds and admission, optional shared tier
+    cache_max_entries: int = Field(10_000, ge=1)
+    cache_max_bytes: int = Field(64 * 1024 * 1024, ge=1)
+    cache_sweep_interval: float = Field(60, gt=0)
+    cache_admission: Literal["lru", "tinylfu"] = "lru"
+    cache_redis_url: Optional[str] = None
+    cache_l1_ttl: float = Field(60, ge=0)
+
+    # Result cache lifetimes per modality, in seconds: fresh, then served
+    # stale while refreshed; failures are remembered for the negative TTL
+    cache_ttl_image: float = Field(3600, ge=0)
+    cache_stale_ttl_image: float = Field(86400, ge=0)
+    cache_negative_ttl_image: float = Field(30, ge=0)
+    cache_ttl_text: float = Field(300, ge=0)
+    cache_stale_ttl_text: float = Field(600, ge=0)
+    cache_negative_ttl_text: float = Field(30, ge=0)
+    cache_ttl_audio: float = Field(3600, ge=0)
+    cache_stale_ttl_audio: float = Field(86400, ge=0)
+    cache_negative_ttl_audio: float = Field(60, ge=0)
+
+    # Free-tier requests per minute per scope; tier keys are comma-separated
+    # and multipliers read "tier=factor,..."
+    rate_limit_enabled: bool = True
+    rate_limit_image: int = Field(10, ge=1)
+    rate_limit_text: int = Field(30, ge=1)
+    rate_limit_audio: int = Field(20, ge=1)
+    rate_limit_batch: int = Field(5, ge=1)
+    rate_limit_tier_multipliers: str = ""
+    rate_limit_redis_url: Optional[str] = None
+    api_keys_pro: str = ""
+    api_keys_enterprise: str = ""
+    trusted_proxy_hops: int = Field(0, ge=0)
+
+    # Background jobs
+    job_workers: int = Field(4, ge=1)
+    job_queue_size: int = Field(1000, ge=1)
+    job_result_ttl: float = Field(3600, ge=0)
+    job_store: Literal["memory", "sqlite"] = "memory"
+    job_sqlite_path: str = "jobs.db"
+
+    # Full-response cache for /api/generate/*
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = Field(1000, ge=1)
+    response_cache_max_bytes: int = Field(16 * 1024 * 1024, ge=1)
+
+    # On-disk asset store, off unless a directory is set
+    asset_store_dir: Optional[str] = None
+    asset_store_max_bytes: int = Field(1024 ** 3, ge=1)
+
+    # Span records are appended to this file when set
+    trace_export_path: Optional[str] = None
+
+    @field_validator("upstream_resolve_mode", "cache_admission", "job_store", mode="before")
+    @classmethod
+    def _lower_case(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+    @property
+    def auth_enabled(self) -> bool:
+        return bool(self.backend_api_key)
@@ -7,7 +7,8 @@ import sys
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from main import app
+from main import app, create_app
+from settings import Settings
 
 client = TestClient(app)
 
@@ -36,11 +37,7 @@ class TestAuthentication:
     def test_no_auth_required_when_no_key_set(self):
         """Test that no auth is required when BACKEND_API_KEY is not set."""
         with patch.dict(os.environ, {}, clear=True):
-            # Reload the app to pick up the environment change
-            from importlib import reload
-            import main
-            reload(main)
-            test_client = TestClient(main.app)
+            test_client = TestClient(create_app())
             
             response = test_client.post("/api/generate/text", json={
                 "prompt": "Test prompt"
@@ -51,10 +48,7 @@ class TestAuthentication:
     def test_auth_required_when_key_set(self):
         """Test that auth is required when BACKEND_API_KEY is set."""
         with patch.dict(os.environ, {'BACKEND_API_KEY': 'test-key'}, clear=True):
-            from importlib import reload
-            import main
-            reload(main)
-            test_client = TestClient(main.app)
+            test_client = TestClient(create_app())
             
             # Request without auth header should fail
             response = test_client.post("/api/generate/text", json={
@@ -71,26 +65,22 @@ class TestAuthentication:
     
     def test_invalid_api_key(self):
         """Test that invalid API key is rejected."""
-        with patch.dict(os.environ, {'BACKEND_API_KEY': 'correct-key'}, clear=True):
-            from importlib import reload
-            import main
-            reload(main)
-            test_client = TestClient(main.app)
-            
-            response = test_client.post("/api/generate/text",
-                json={"prompt": "Test prompt"},
-                headers={"Authorization": "Bearer wrong-key"}
-            )
-            assert response.status_code == 401
-            data = response.json()
-            assert "Invalid API key" in data["detail"]
+        test_client = TestClient(create_app(Settings(backend_api_key="correct-key")))
+        
+        response = test_client.post("/api/generate/text",
+            json={"prompt": "Test prompt"},
+            headers={"Authorization": "Bearer wrong-key"}
+        )
+        assert response.status_code == 401
+        data = response.json()
+        assert "Invalid API key" in data["detail"]
 
 class TestImageGeneration:
     """Test image generation endpoints."""
     
     def test_generate_image_success(self):
         """Test successful image generation."""
-        with patch('main.client.generate_image') as mock_generate:
+        with patch('main.app.state.client.generate_image') as mock_generate:
             mock_generate.return_value = {
                 "url": "https://image.pollinations.ai/test-image.png"
             }
@@ -155,7 +145,7 @@ class TestAudioGeneration:
     
     def test_generate_audio_success(self):
         """Test successful audio generation."""
-        with patch('main.client.generate_audio') as mock_generate:
+        with patch('main.app.state.client.generate_audio') as mock_generate:
             mock_generate.return_value = {
                 "url": "https://audio.pollinations.ai/test-audio.mp3"
             }
@@ -184,8 +174,8 @@ class TestBatchGeneration:
     
     def test_batch_generate_mixed(self):
         """Test batch generation with mixed request types."""
-        with patch('main.client.generate_image') as mock_image, \
-             patch('main.client.generate_text') as mock_text:
+        with patch('main.app.state.client.generate_image') as mock_image, \
+             patch('main.app.state.client.generate_text') as mock_text:
             
             mock_image.return_value = {"url": "https://test-image.png"}
             mock_text.return_value = {"text": "Generated text"}
@@ -241,7 +231,7 @@ class TestErrorHandling:
         
     def test_internal_server_error(self):
         """Test handling of internal server errors."""
-        with patch('main.client.generate_image') as mock_generate:
+        with patch('main.app.state.client.generate_image') as mock_generate:
             mock_generate.side_effect = Exception("Internal error")
             
             response = client.post("/api/generate/image", json={
@@ -264,7 +254,7 @@ class TestRateLimiting:
         # Rate limiting should be applied but not necessarily triggered
         assert response.status_code in [200, 429]
         
-        # Check for rate limit headers (slowapi adds these)
+        # Check for rate limit headers
         if response.status_code == 429:
             assert "X-RateLimit-Limit" in response.headers or "Retry-After" in response.headers
 
@@ -273,7 +263,7 @@ class TestCaching:
     
     def test_cache_integration(self):
         """Test that cache is used for repeated requests."""
-        with patch('main.client.generate_text') as mock_generate:
+        with patch('main.app.state.client.generate_text') as mock_generate:
             mock_generate.return_value = {"text": "Cached response", "source": "static"}
             
             # First request
@@ -0,0 +1,24 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+# Keep the suite offline: text comes from the local templates unless a test
+# enables text_upstream against a mocked transport
+os.environ.setdefault("TEXT_UPSTREAM", "false")
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def no_api_key():
+    """Open the module-level app even when the environment sets BACKEND_API_KEY"""
+    with patch.object(main.settings, "backend_api_key", None):
+        yield
+
+
+@pytest.fixture
+def open_access(no_api_key):
+    """Open the module-level app with rate limiting off as well"""
+    with patch.object(main.app.state.limiter, "enabled", False):
+        yield
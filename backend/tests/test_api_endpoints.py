@@ -1,7 +1,7 @@
 import pytest
 import httpx
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import asyncio
 import json
 
@@ -9,6 +9,8 @@ from main import app
 
 client = TestClient(app)
 
+pytestmark = pytest.mark.usefixtures("open_access")
+
 class TestHealthEndpoints:
     """Test health check endpoints"""
     
@@ -32,14 +34,16 @@ class TestHealthEndpoints:
 class TestImageGeneration:
     """Test image generation endpoints"""
     
-    @patch('httpx.AsyncClient.get')
-    def test_generate_image_success(self, mock_get):
+    @patch('httpx.AsyncClient.send')
+    def test_generate_image_success(self, mock_send):
         """Test successful image generation"""
-        # Mock response
+        # Mock streamed response (the body is never read)
         mock_response = MagicMock()
         mock_response.status_code = 200
+        mock_response.is_error = False
         mock_response.url = "https://image.pollinations.ai/prompt/test"
-        mock_get.return_value = mock_response
+        mock_response.aclose = AsyncMock()
+        mock_send.return_value = mock_response
         
         payload = {
             "prompt": "A beautiful sunset",
@@ -0,0 +1,105 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from unittest.mock import patch
+
+import main
+from main import PollinationsClient, create_app
+from settings import Settings
+
+
+class TestCreateApp:
+    """Test building apps from explicit settings"""
+
+    def test_api_key_is_per_app(self):
+        """Apps built with different settings enforce their own key"""
+        locked = TestClient(create_app(Settings(backend_api_key="secret")))
+        open_access = TestClient(create_app(Settings(backend_api_key=None)))
+        assert locked.post("/api/generate/text", json={"prompt": "explain app factories"}).status_code == 401
+        assert locked.post(
+            "/api/generate/text", json={"prompt": "explain app factories"}, headers={"Authorization": "Bearer secret"}
+        ).status_code == 200
+        assert open_access.post("/api/generate/text", json={"prompt": "explain app factories"}).status_code == 200
+
+    def test_apps_do_not_share_state(self):
+        first, second = create_app(Settings()), create_app(Settings())
+        for name in ("cache", "client", "limiter", "jobs", "response_cache"):
+            assert getattr(first.state, name) is not getattr(second.state, name)
+        assert first.state.client.cache is first.state.cache
+
+    def test_batch_limits_are_per_app(self):
+        slow = TestClient(create_app(Settings(batch_item_timeout=0.05)))
+
+        async def generate(**kwargs):
+            await asyncio.sleep(1)
+
+        with patch.object(slow.app.state.client, "generate_text", side_effect=generate):
+            response = slow.post("/api/batch", json={"requests": [{"type": "text", "prompt": "a slow tide"}]})
+        assert response.json()["results"][0]["error"] == "Timed out after 0.05s"
+
+    def test_asset_base_url_is_per_app(self, tmp_path):
+        app = create_app(Settings(asset_store_dir=str(tmp_path / "assets"), asset_base_url="https://cdn.example/assets"))
+        # Nothing touches the disk until the app starts or the store is used
+        assert not (tmp_path / "assets").exists()
+        pollinations = app.state.client
+        pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, content=b"jpeg-bytes", headers={"Content-Type": "image/jpeg"})
+        ))
+        result = asyncio.run(pollinations.generate_image("a cat on a cdn"))
+        assert result["url"] == f"https://cdn.example/assets/{result['asset_id']}"
+
+    def test_subsystems_use_app_settings(self):
+        app = create_app(Settings(
+            pollinations_image_url="http://images.local/",
+            cache_max_entries=5,
+            cache_ttl_image=7,
+            upstream_retries=0,
+            rate_limit_text=2,
+            job_workers=1,
+            response_cache_enabled=False,
+        ))
+        state = app.state
+        assert state.client.image_url == "http://images.local"
+        assert state.client.audio_url == state.client.text_url
+        assert state.cache.l1.max_entries == 5
+        assert state.client.policies["image"].fresh_ttl == 7
+        assert state.client.retry_policy.retries == 0
+        assert state.limiter.limits["text"] == 2
+        assert state.jobs.workers == 1
+        assert not state.response_cache.enabled
+
+    def test_settings_from_environment(self, monkeypatch):
+        monkeypatch.setenv("BACKEND_API_KEY", "from-env")
+        monkeypatch.setenv("BATCH_CONCURRENCY", "3")
+        monkeypatch.setenv("CACHE_ADMISSION", "TinyLFU")
+        settings = Settings()
+        assert settings.backend_api_key == "from-env"
+        assert settings.batch_concurrency == 3
+        assert settings.cache_admission == "tinylfu"
+
+    def test_invalid_settings_fail_fast(self):
+        with pytest.raises(ValidationError):
+            Settings(batch_concurrency=0)
+
+
+class TestLifespan:
+    """Test resources started and released by the lifespan"""
+
+    def test_upstream_pool_is_built_lazily(self):
+        pollinations = PollinationsClient()
+        assert pollinations._client is None
+        assert pollinations.pool_stats()["connections"] == 0
+        assert pollinations.client is pollinations.client
+
+    def test_restart_rebuilds_the_pool(self):
+        app = create_app(Settings())
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            assert app.state.jobs._tasks
+        assert app.state.client._client is None
+        assert not app.state.jobs._tasks
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            assert app.state.client.client is not None
@@ -0,0 +1,138 @@
+import asyncio
+import httpx
+import os
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from assets import AssetStore
+from main import PollinationsClient, app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AssetStore(str(tmp_path), max_bytes=1000)
+
+
+pytestmark = pytest.mark.usefixtures("open_access")
+
+
+class TestAssetStore:
+    """Test the content-addressed disk store"""
+
+    def test_put_is_content_addressed_and_sharded(self, store, tmp_path):
+        """Identical bytes are stored once, under a sharded digest path"""
+        first = asyncio.run(store.put(b"a" * 100, "image/jpeg"))
+        second = asyncio.run(store.put(b"a" * 100, "image/jpeg"))
+        assert first.id == second.id
+        assert first.id.endswith(".jpg")
+        assert first.path == os.path.join(str(tmp_path), first.id[:2], first.id[2:4], first.id)
+        with open(first.path, "rb") as f:
+            assert f.read() == b"a" * 100
+        assert store.stats()["assets"] == 1
+
+    def test_concurrent_puts_count_once(self, store):
+        """Identical bytes stored concurrently are indexed and counted once"""
+        async def run():
+            return await asyncio.gather(*(store.put(b"c" * 300, "image/jpeg") for _ in range(3)))
+
+        assets = asyncio.run(run())
+        assert len({asset.id for asset in assets}) == 1
+        assert store.stats()["assets"] == 1
+        assert store.stats()["bytes"] == 300
+        assert store.stats()["evictions"] == 0
+
+    def test_lru_eviction_by_size(self, store):
+        """The least recently used assets are deleted once the cap is exceeded"""
+        async def run():
+            old = await store.put(b"1" * 400, "image/png")
+            kept = await store.put(b"2" * 400, "image/png")
+            store.get(old.id)
+            await store.put(b"3" * 400, "image/png")
+            return old, kept
+
+        old, evicted = asyncio.run(run())
+        assert old.id in store
+        assert evicted.id not in store
+        assert not os.path.exists(evicted.path)
+        assert store.stats()["bytes"] <= 1000
+
+    def test_oversized_assets_are_not_stored(self, store):
+        assert asyncio.run(store.put(b"x" * 2000, "image/png")) is None
+
+    def test_index_survives_restart(self, store, tmp_path):
+        """Assets written by an earlier process are found again"""
+        asset = asyncio.run(store.put(b"audio", "audio/mpeg"))
+        reopened = AssetStore(str(tmp_path), max_bytes=1000)
+        found = reopened.get(asset.id)
+        assert found.size == 5
+        assert found.media_type == "audio/mpeg"
+
+
+class TestAssetEndpoint:
+    """Test serving stored bytes"""
+
+    def test_serves_with_etag_and_range(self, store):
+        asset = asyncio.run(store.put(bytes(range(100)), "image/png"))
+        with patch.object(main.app.state, "asset_store", store):
+            full = client.get(f"/api/assets/{asset.id}")
+            partial = client.get(f"/api/assets/{asset.id}", headers={"Range": "bytes=10-19"})
+            cached = client.get(f"/api/assets/{asset.id}", headers={"If-None-Match": full.headers["ETag"]})
+
+        assert full.status_code == 200
+        assert full.content == bytes(range(100))
+        assert full.headers["content-type"] == "image/png"
+        assert full.headers["ETag"] == f'"{asset.id.split(".")[0]}"'
+        assert partial.status_code == 206
+        assert partial.content == bytes(range(10, 20))
+        assert cached.status_code == 304
+
+    def test_unknown_asset(self, store):
+        with patch.object(main.app.state, "asset_store", store):
+            assert client.get("/api/assets/" + "0" * 32 + ".png").status_code == 404
+        with patch.object(main.app.state, "asset_store", None):
+            assert client.get("/api/assets/" + "0" * 32 + ".png").status_code == 404
+
+
+class TestLocalAssetUrls:
+    """Test generation results pointing at held bytes"""
+
+    def test_generate_image_returns_local_url(self, store):
+        def handler(request):
+            if request.url.path.startswith("/prompt/"):
+                return httpx.Response(302, headers={"Location": "https://cdn.example/cat.jpg"})
+            return httpx.Response(200, content=b"jpeg-bytes", headers={"Content-Type": "image/jpeg"})
+
+        pollinations = PollinationsClient(asset_store=store)
+        pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        result = asyncio.run(pollinations.generate_image("a stored cat"))
+        with patch.object(main.app.state, "asset_store", store):
+            served = client.get(result["url"])
+
+        assert result["url"] == f"/api/assets/{result['asset_id']}"
+        assert result["source_url"] == "https://cdn.example/cat.jpg"
+        assert served.content == b"jpeg-bytes"
+
+    def test_evicted_asset_is_fetched_again(self, store):
+        """A cached result whose bytes were evicted counts as a miss"""
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(200, content=b"image", headers={"Content-Type": "image/png"})
+
+        pollinations = PollinationsClient(asset_store=store)
+        pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async def run():
+            first = await pollinations.generate_image("an evicted cat")
+            store._index.clear()
+            second = await pollinations.generate_image("an evicted cat")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert len(calls) == 2
+        assert second["asset_id"] == first["asset_id"]
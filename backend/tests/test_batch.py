@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from main import app
+from settings import Settings
+
+client = TestClient(app)
+
+
+# Batch tests exercise concurrency, not auth or rate limits
+pytestmark = pytest.mark.usefixtures("open_access")
+
+
+def delayed(seconds, result=None, error=None):
+    async def generate(*args, **kwargs):
+        await asyncio.sleep(seconds)
+        if error:
+            raise error
+        return result or {"prompt": kwargs.get("prompt")}
+    return generate
+
+
+class TestConcurrentBatch:
+    """Test concurrent execution of /api/batch"""
+
+    def test_items_run_concurrently_in_input_order(self):
+        """Items overlap in time and results keep the input order"""
+        with patch('main.app.state.client.generate_image', side_effect=delayed(0.2)):
+            started = time.perf_counter()
+            response = client.post("/api/batch", json={"requests": [
+                {"type": "image", "prompt": f"cat {i}"} for i in range(5)
+            ]})
+            elapsed = time.perf_counter() - started
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["result"]["prompt"] for r in results] == [f"cat {i}" for i in range(5)]
+        assert elapsed < 0.8
+
+    def test_concurrency_is_bounded(self):
+        """No more than BATCH_CONCURRENCY items run at once"""
+        running = peak = 0
+
+        async def generate(**kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return {}
+
+        with patch.object(main.settings, "batch_concurrency", 2), patch('main.app.state.client.generate_text', side_effect=generate):
+            client.post("/api/batch", json={"requests": [{"type": "text", "prompt": str(i)} for i in range(6)]})
+        assert peak == 2
+
+    def test_errors_are_isolated(self):
+        """A failing item does not affect the others"""
+        with patch('main.app.state.client.generate_image', side_effect=delayed(0, error=Exception("upstream down"))), \
+             patch('main.app.state.client.generate_text', side_effect=delayed(0, result={"text": "ok"})):
+            response = client.post("/api/batch", json={"requests": [
+                {"type": "image", "prompt": "cat"},
+                {"type": "text", "prompt": "poem"},
+                {"type": "video", "prompt": "nope"},
+            ]})
+
+        results = response.json()["results"]
+        assert results[0] == {"status": "error", "error": "upstream down"}
+        assert results[1] == {"status": "success", "result": {"text": "ok"}}
+        assert "Invalid request type" in results[2]["result"]["error"]
+
+    def test_audio_fallback_keeps_error(self):
+        """An audio fallback result is not narrowed to an image result"""
+        fallback = {"url": "https://example.com/a.mp3", "error": "TTS unavailable", "metadata": {"voice": "alloy"}}
+        with patch('main.app.state.client.generate_audio', side_effect=delayed(0, result=fallback)):
+            response = client.post("/api/batch", json={"requests": [{"type": "audio", "prompt": "hello"}]})
+
+        assert response.json()["results"][0]["result"] == fallback
+
+    def test_item_timeout(self):
+        """Slow items report a timeout instead of blocking the batch"""
+        with patch.object(main.settings, "batch_item_timeout", 0.05), \
+             patch('main.app.state.client.generate_image', side_effect=delayed(1)), \
+             patch('main.app.state.client.generate_text', side_effect=delayed(0, result={"text": "ok"})):
+            response = client.post("/api/batch", json={"requests": [
+                {"type": "image", "prompt": "slow cat"},
+                {"type": "text", "prompt": "fast poem"},
+            ]})
+
+        results = response.json()["results"]
+        assert results[0]["status"] == "error"
+        assert "Timed out" in results[0]["error"]
+        assert results[1]["status"] == "success"
+
+    def test_batch_deadline(self):
+        """Unfinished items report a timeout once the batch deadline passes"""
+        with patch.object(main.settings, "batch_deadline", 0.1), \
+             patch('main.app.state.client.generate_image', side_effect=delayed(1)), \
+             patch('main.app.state.client.generate_text', side_effect=delayed(0, result={"text": "ok"})):
+            started = time.perf_counter()
+            response = client.post("/api/batch", json={"requests": [
+                {"type": "text", "prompt": "fast poem"},
+                {"type": "image", "prompt": "slow cat"},
+            ]})
+            elapsed = time.perf_counter() - started
+
+        results = response.json()["results"]
+        assert results[0]["status"] == "success"
+        assert "deadline" in results[1]["error"]
+        assert elapsed < 0.5
+
+
+class TestStreamingBatch:
+    """Test /api/batch/stream result streaming"""
+
+    def test_ndjson_results_in_completion_order(self):
+        """Each result is emitted as an NDJSON line tagged with its index"""
+        with patch('main.app.state.client.generate_image', side_effect=delayed(0.1, result={"url": "slow"})), \
+             patch('main.app.state.client.generate_text', side_effect=delayed(0, result={"text": "fast"})):
+            response = client.post("/api/batch/stream", json={"requests": [
+                {"type": "image", "prompt": "slow cat"},
+                {"type": "text", "prompt": "fast poem"},
+            ]})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["index"] for line in lines] == [1, 0]
+        assert lines[0] == {"index": 1, "status": "success", "result": {"text": "fast"}}
+
+    def test_sse_format(self):
+        """Clients accepting text/event-stream get SSE events and a done event"""
+        with patch('main.app.state.client.generate_text', side_effect=delayed(0, result={"text": "ok"})):
+            response = client.post(
+                "/api/batch/stream",
+                json={"requests": [{"type": "text", "prompt": "a"}, {"type": "text", "prompt": "b"}]},
+                headers={"Accept": "text/event-stream"},
+            )
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block for block in response.text.split("\n\n") if block]
+        assert [event.split("\n")[0] for event in events] == ["event: result", "event: result", "event: done"]
+        assert json.loads(events[-1].split("data: ")[1]) == {"count": 2}
+
+    def test_only_concurrency_window_in_flight(self):
+        """Items are started lazily so in-flight work never exceeds the window"""
+        started = 0
+
+        async def generate(**kwargs):
+            nonlocal started
+            started += 1
+            await asyncio.sleep(0)
+            return {"started": started}
+
+        async def run():
+            with patch('main.app.state.client.generate_text', side_effect=generate):
+                stream = main.iter_batch(
+                    main.app.state.client, Settings(batch_concurrency=3), [{"type": "text", "prompt": str(i)} for i in range(100)]
+                )
+                await stream.__anext__()
+                in_flight = started
+                await stream.aclose()
+                return in_flight
+
+        assert asyncio.run(run()) <= 3
+
+    def test_deadline_reports_unfinished_items(self):
+        """Items still running at the deadline are streamed as timeouts"""
+        with patch.object(main.settings, "batch_deadline", 0.05), patch.object(main.settings, "batch_concurrency", 1), \
+             patch('main.app.state.client.generate_image', side_effect=delayed(1)):
+            response = client.post("/api/batch/stream", json={"requests": [
+                {"type": "image", "prompt": str(i)} for i in range(3)
+            ]})
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        assert all("deadline" in line["error"] for line in lines)
@@ -0,0 +1,412 @@
+import asyncio
+import httpx
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch
+
+from cache import (
+    FRESH, MISS, NEGATIVE, STALE, CacheBackend, CachePolicy, FrequencySketch, InMemoryCache, RedisBackend, TieredCache,
+    cache_policies, create_cache, make_cache_key,
+)
+from fastapi.testclient import TestClient
+import main
+from main import PollinationsClient, app
+from settings import Settings
+
+
+class FakeRedis:
+    """In-process stand-in for the redis.asyncio commands RedisBackend uses"""
+
+    def __init__(self):
+        self.store = {}
+        self.ttls = {}
+        self.round_trips = 0
+
+    async def set(self, key, value, ex=None):
+        self.round_trips += 1
+        self.store[key] = value.encode()
+        self.ttls[key] = ex
+
+    async def delete(self, key):
+        self.round_trips += 1
+        self.store.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(lambda: self.redis.store.get(key))
+
+    def pttl(self, key):
+        def pttl():
+            if key not in self.redis.store:
+                return -2
+            ttl = self.redis.ttls.get(key)
+            return -1 if ttl is None else ttl * 1000
+        self.commands.append(pttl)
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+class BrokenBackend(RedisBackend):
+    async def get_many(self, keys):
+        raise ConnectionError("redis is down")
+
+    async def set(self, key, value, ttl=None):
+        raise ConnectionError("redis is down")
+
+
+class TestInMemoryCache:
+    """Test the bounded LRU+TTL cache"""
+
+    def test_get_set_delete(self):
+        """Basic get/set/delete API is unchanged"""
+        cache = InMemoryCache()
+        cache.set("key", {"url": "https://example.com"}, ttl=60)
+        assert cache.get("key") == {"url": "https://example.com"}
+        cache.delete("key")
+        assert cache.get("key") is None
+
+    def test_ttl_expiry(self):
+        """Expired entries are not returned"""
+        cache = InMemoryCache()
+        with patch("cache.time.time", return_value=1000.0):
+            cache.set("key", "value", ttl=10)
+        with patch("cache.time.time", return_value=1011.0):
+            assert cache.get("key") is None
+        assert len(cache) == 0
+        assert cache.stats()["expirations"] == 1
+
+    def test_lru_eviction_by_entries(self):
+        """The least recently used entry is evicted at the entry cap"""
+        cache = InMemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_eviction_by_byte_budget(self):
+        """Entries are evicted once the approximate byte budget is exceeded"""
+        cache = InMemoryCache(max_bytes=250)
+        for i in range(5):
+            cache.set(f"key{i}", "x" * 100)
+        assert cache.stats()["bytes"] <= 250
+        assert len(cache) == 2
+        assert cache.get("key4") is not None
+
+    def test_oversized_value_not_stored(self):
+        """A single value larger than the budget does not flush the cache"""
+        cache = InMemoryCache(max_bytes=100)
+        cache.set("small", "x")
+        cache.set("huge", "x" * 1000)
+        assert cache.get("huge") is None
+        assert cache.get("small") == "x"
+
+    def test_hit_miss_counters(self):
+        """Hits and misses are counted"""
+        cache = InMemoryCache()
+        cache.set("key", "value")
+        cache.get("key")
+        cache.get("missing")
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_background_sweeper(self):
+        """The sweeper removes expired entries that are never read"""
+        cache = InMemoryCache(sweep_interval=0.01)
+
+        async def run():
+            cache.set("short", "value", ttl=0)
+            cache.set("long", "value", ttl=60)
+            cache.start_sweeper()
+            await asyncio.sleep(0.05)
+            await cache.stop_sweeper()
+
+        asyncio.run(run())
+        assert len(cache) == 1
+        assert cache.get("long") == "value"
+
+
+class TestTinyLFUAdmission:
+    """Test frequency-based admission in front of the LRU"""
+
+    def test_sketch_counts_and_ages(self):
+        """Estimates track access counts and are halved after a sample period"""
+        sketch = FrequencySketch(capacity=1024)
+        for _ in range(7):
+            sketch.increment("hot")
+        sketch.increment("cold")
+        assert sketch.estimate("hot") == 7
+        assert sketch.estimate("cold") == 1
+        assert sketch.estimate("unseen") == 0
+        sketch._additions = sketch.sample_size - 1
+        sketch.increment("hot")
+        assert sketch.resets == 1
+        assert sketch.estimate("hot") == 4
+        assert sketch.estimate("cold") == 0
+
+    def test_one_off_keys_do_not_evict_hot_ones(self):
+        """A full cache rejects a key that is less popular than the LRU victim"""
+        cache = InMemoryCache(max_entries=2, admission="tinylfu")
+        for key in ("a", "b"):
+            for _ in range(3):
+                cache.get(key)
+            cache.set(key, key)
+        cache.get("one-off")
+        cache.set("one-off", "x")
+        assert cache.get("one-off") is None
+        assert cache.get("a") == "a" and cache.get("b") == "b"
+        assert cache.stats()["rejections"] == 1
+
+    def test_popular_newcomer_is_admitted(self):
+        cache = InMemoryCache(max_entries=2, admission="tinylfu")
+        cache.set("a", 1)
+        cache.set("b", 2)
+        for _ in range(5):
+            cache.get("c")
+        cache.set("c", 3)
+        assert cache.get("c") == 3
+        assert len(cache) == 2
+
+    def test_updates_always_admitted(self):
+        """Replacing an existing key never goes through admission"""
+        cache = InMemoryCache(max_entries=1, admission="tinylfu")
+        cache.set("a", 1)
+        cache.set("a", 2)
+        assert cache.get("a") == 2
+
+    def test_admission_from_settings(self):
+        assert create_cache(Settings(cache_admission="tinylfu")).l1.stats()["admission"] == "tinylfu"
+        assert InMemoryCache(admission="lru")._sketch is None
+
+
+class TestCacheKeys:
+    """Test canonical cache key construction"""
+
+    def test_key_independent_of_param_order(self):
+        """Parameter order does not change the key"""
+        assert make_cache_key("image", prompt="cat", width=512, height=768) == \
+            make_cache_key("image", height=768, prompt="cat", width=512)
+
+    def test_key_normalizes_values(self):
+        """None values are dropped and integral floats collapse to ints"""
+        assert make_cache_key("audio", text="hi", speed=1.0, seed=None) == \
+            make_cache_key("audio", text="hi", speed=1)
+
+    def test_key_distinguishes_modality_and_params(self):
+        """Different modalities or params never share a key"""
+        assert make_cache_key("text", prompt="cat") != make_cache_key("image", prompt="cat")
+        assert make_cache_key("image", prompt="cat", seed=1) != make_cache_key("image", prompt="cat", seed=2)
+
+    def test_key_stable_across_processes(self):
+        """Keys do not depend on the per-process hash seed"""
+        script = "from cache import make_cache_key; print(make_cache_key('text', prompt='cat', model='openai'))"
+        keys = {
+            subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                env={**os.environ, "PYTHONHASHSEED": seed},
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+            for seed in ("1", "2")
+        }
+        assert keys == {make_cache_key("text", prompt="cat", model="openai")}
+
+    def test_client_applies_defaults_before_hashing(self):
+        """Omitted and explicit default params hit the same entry"""
+        client = PollinationsClient()
+        with patch.object(client, "_resolve_url", return_value="https://image.pollinations.ai/x") as mock_resolve:
+            asyncio.run(client.generate_image("a defaulted cat"))
+            asyncio.run(client.generate_image("a defaulted cat", model="flux", width=1024, height=1024, seed=None))
+        assert mock_resolve.call_count == 1
+
+
+class TestTieredCache:
+    """Test the L1 in-memory cache in front of a shared L2"""
+
+    def test_l1_only_without_backend(self):
+        """Without an L2 the tiered cache behaves like the in-memory cache"""
+        cache = TieredCache(InMemoryCache())
+
+        async def run():
+            await cache.set("key", {"text": "hi"}, ttl=300)
+            return await cache.get("key"), await cache.get("missing")
+
+        assert asyncio.run(run()) == ({"text": "hi"}, None)
+        stats = cache.stats()
+        assert (stats["l1_hits"], stats["l2_hits"], stats["misses"]) == (1, 0, 1)
+
+    def test_l2_shared_between_workers(self):
+        """A value written by one worker is served to another from L2"""
+        redis = FakeRedis()
+        worker_a = TieredCache(InMemoryCache(), RedisBackend(redis))
+        worker_b = TieredCache(InMemoryCache(), RedisBackend(redis))
+
+        async def run():
+            await worker_a.set("key", {"url": "https://example.com"}, ttl=3600)
+            first = await worker_b.get("key")
+            second = await worker_b.get("key")
+            return first, second
+
+        assert asyncio.run(run()) == ({"url": "https://example.com"},) * 2
+        assert worker_b.stats()["l2_hits"] == 1
+        assert worker_b.stats()["l1_hits"] == 1
+
+    def test_l1_ttl_capped(self):
+        """L1 copies never outlive the L1 TTL or the L2 entry"""
+        redis = FakeRedis()
+        cache = TieredCache(InMemoryCache(), RedisBackend(redis), l1_ttl=5)
+        with patch("cache.time.time", return_value=1000.0):
+            asyncio.run(cache.set("key", "value", ttl=3600))
+        with patch("cache.time.time", return_value=1006.0):
+            assert cache.l1.get("key") is None
+        assert redis.ttls["polycraft:cache:key"] == 3600
+
+    def test_get_many_single_round_trip(self):
+        """Batch lookups fetch every L2 value in one pipelined round trip"""
+        redis = FakeRedis()
+        writer = TieredCache(InMemoryCache(), RedisBackend(redis))
+        reader = TieredCache(InMemoryCache(), RedisBackend(redis))
+
+        async def run():
+            for i in range(5):
+                await writer.set(f"key{i}", i, ttl=60)
+            redis.round_trips = 0
+            return await reader.get_many([f"key{i}" for i in range(7)])
+
+        assert asyncio.run(run()) == {f"key{i}": i for i in range(5)}
+        assert redis.round_trips == 1
+        assert reader.stats()["misses"] == 2
+
+    def test_l2_failure_degrades_to_l1(self):
+        """An unavailable L2 is counted and does not fail lookups"""
+        cache = TieredCache(InMemoryCache(), BrokenBackend(FakeRedis()))
+
+        async def run():
+            await cache.set("key", "value", ttl=60)
+            return await cache.get("key"), await cache.get("missing")
+
+        assert asyncio.run(run()) == ("value", None)
+        assert cache.stats()["l2_errors"] == 2
+
+    def test_incomplete_backend_fails_on_creation(self):
+        class GetOnly(CacheBackend):
+            async def get_many(self, keys):
+                return {}
+
+        with pytest.raises(TypeError):
+            GetOnly()
+
+    def test_batch_prefetch_uses_multi_get(self):
+        """Batch requests warm L1 with a single multi-get"""
+        shared = TieredCache(InMemoryCache())
+        client = PollinationsClient(cache=shared)
+        with patch.object(shared, "get_many") as mock_get_many:
+            asyncio.run(client.prefetch([
+                {"type": "image", "prompt": "a cat"},
+                {"type": "text", "prompt": "a poem"},
+                {"type": "video", "prompt": "unsupported"},
+            ]))
+        keys = mock_get_many.call_args.args[0]
+        assert keys == [client.cache_key("image", prompt="a cat"), client.cache_key("text", prompt="a poem")]
+
+
+def counting_upstream(calls, status_code=200):
+    """PollinationsClient whose upstream answers every call with status_code"""
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(status_code, text="upstream says no")
+
+    pollinations = PollinationsClient()
+    pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pollinations
+
+
+class TestCachePolicy:
+    """Test per-modality fresh, stale and negative cache policies"""
+
+    def test_policy_from_settings(self):
+        """CACHE_TTL_*, CACHE_STALE_TTL_* and CACHE_NEGATIVE_TTL_* configure a modality"""
+        settings = Settings(cache_ttl_image=10, cache_stale_ttl_image=20, cache_negative_ttl_image=5)
+        policy = cache_policies(settings)["image"]
+        entry, ttl = policy.entry({"url": "x"})
+        assert ttl == 30
+        assert CachePolicy.state(entry) == FRESH
+        with patch("cache.time.time", return_value=entry["fresh_until"] + 1):
+            assert CachePolicy.state(entry) == STALE
+        negative, ttl = policy.entry({"failure": "boom"}, negative=True)
+        assert ttl == 5
+        assert CachePolicy.state(negative) == NEGATIVE
+
+    def test_stale_entry_served_and_refreshed(self):
+        """A stale hit answers at once and refreshes the entry in the background"""
+        calls = []
+        pollinations = counting_upstream(calls)
+
+        async def run():
+            first = await pollinations.generate_image("a stale cat")
+            second = await pollinations.generate_image("a stale cat")
+            await asyncio.sleep(0.05)
+            return first, second
+
+        with patch.dict(pollinations.policies, {"image": CachePolicy(fresh_ttl=0, stale_ttl=60)}):
+            first, second = asyncio.run(run())
+
+        assert first["cache"] == MISS
+        assert second["cache"] == STALE
+        assert len(calls) == 2
+        assert pollinations.revalidations == 1
+
+    def test_failures_are_negatively_cached(self):
+        """A failed image is replayed from the negative cache without calling upstream"""
+        calls = []
+        pollinations = counting_upstream(calls, status_code=400)
+
+        async def run():
+            with pytest.raises(Exception, match="400"):
+                await pollinations.generate_image("a rejected cat")
+            with pytest.raises(main.CachedUpstreamError, match="400"):
+                await pollinations.generate_image("a rejected cat")
+
+        asyncio.run(run())
+        assert len(calls) == 1
+
+    def test_negative_hit_is_marked_on_the_response(self, open_access):
+        """Endpoints report negative cache hits in the X-Cache header"""
+        pollinations = counting_upstream([], status_code=400)
+        with patch("main.app.state.client", pollinations):
+            test_client = TestClient(app)
+            first = test_client.post("/api/generate/image", json={"prompt": "a rejected dog"})
+            second = test_client.post("/api/generate/image", json={"prompt": "a rejected dog"})
+        assert first.status_code == second.status_code == 500
+        assert "X-Cache" not in first.headers
+        assert second.headers["X-Cache"] == NEGATIVE
+
+    def test_text_results_report_cache_state(self):
+        client = PollinationsClient()
+
+        async def run():
+            return await client.generate_text("explain caching"), await client.generate_text("explain caching")
+
+        first, second = asyncio.run(run())
+        assert (first["cache"], second["cache"]) == (MISS, FRESH)
+        assert second["text"] == first["text"]
@@ -0,0 +1,78 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from cache import InMemoryCache, TieredCache
+
+
+@pytest.fixture
+def api(open_access):
+    """Client with open access and an empty result cache"""
+    with patch.object(main.app.state.client, "cache", TieredCache(InMemoryCache())):
+        yield TestClient(main.app, follow_redirects=False)
+
+
+class TestCacheableGet:
+    """Test the GET generation endpoints meant for HTTP caches"""
+
+    def test_etag_is_stable_and_revalidates(self, api):
+        url = "/api/generate/text?prompt=explain+etags&seed=3"
+        first = api.get(url)
+        second = api.get(url)
+        assert first.status_code == 200
+        assert first.headers["etag"] == second.headers["etag"]
+        assert first.headers["etag"].startswith('"text-')
+        assert first.json() == second.json()
+        assert "cache" not in first.json()
+
+        with patch.object(main.app.state.client, "generate_text", side_effect=AssertionError("generated")):
+            not_modified = api.get(url, headers={"If-None-Match": f'"other", {first.headers["etag"]}'})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == first.headers["etag"]
+
+    def test_seed_is_required(self, api):
+        assert api.get("/api/generate/image?prompt=a+cat").status_code == 422
+        assert api.get("/api/generate/text?prompt=a+cat").status_code == 422
+
+    def test_seed_changes_the_result(self, api):
+        one = api.get("/api/generate/text?prompt=explain+seeds&seed=1")
+        other = api.get("/api/generate/text?prompt=explain+seeds&seed=2")
+        assert one.headers["etag"] != other.headers["etag"]
+
+    def test_non_canonical_query_redirects(self, api):
+        response = api.get("/api/generate/image?seed=7&width=1024&prompt=a+cat&nologo=True")
+        assert response.status_code == 308
+        assert response.headers["location"] == "/api/generate/image?nologo=true&prompt=a+cat&seed=7"
+
+    def test_cache_control_follows_policy(self, api):
+        def upstream(request):
+            return httpx.Response(200, content=b"\x89PNG", headers={"content-type": "image/png"})
+
+        with patch.object(main.app.state.client, "client", httpx.AsyncClient(transport=httpx.MockTransport(upstream))):
+            response = api.get("/api/generate/image?prompt=a+cat&seed=7")
+        policy = main.app.state.client.policies["image"]
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == (
+            f"public, max-age={int(policy.fresh_ttl)}, stale-while-revalidate={int(policy.stale_ttl)}"
+        )
+
+    def test_private_when_api_key_required(self, api):
+        with patch.object(main.settings, "backend_api_key", "secret"):
+            response = api.get("/api/generate/text?prompt=explain+privacy&seed=1", headers={"Authorization": "Bearer secret"})
+        assert response.status_code == 200
+        assert response.headers["cache-control"].startswith("private,")
+
+    def test_failures_are_not_cacheable(self, api):
+        def upstream(request):
+            return httpx.Response(400, content=b"bad prompt")
+
+        with patch.object(main.app.state.client, "client", httpx.AsyncClient(transport=httpx.MockTransport(upstream))):
+            first = api.get("/api/generate/image?prompt=a+cat&seed=7")
+            second = api.get("/api/generate/image?prompt=a+cat&seed=7")
+        assert first.status_code == second.status_code == 500
+        assert first.headers["cache-control"] == second.headers["cache-control"] == "no-store"
+        assert "etag" not in first.headers
+        assert second.headers["x-cache"] == "negative"
@@ -0,0 +1,175 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from main import app
+from jobs import FAILED, QUEUED, SUCCEEDED, JobManager, QueueFullError, SQLiteJobStore
+
+
+async def echo(job_type, params):
+    await asyncio.sleep(params.get("delay", 0))
+    if params.get("fail"):
+        raise Exception("generation failed")
+    return {"type": job_type, "prompt": params["prompt"]}
+
+
+class TestJobManager:
+    """Test the job queue and worker pool"""
+
+    def test_job_runs_to_completion(self):
+        """Submitted jobs are queued, executed and their result stored"""
+        async def run():
+            manager = JobManager(echo, workers=1)
+            await manager.start()
+            job = await manager.submit("image", {"prompt": "cat"})
+            queued_status = job.status
+            finished = await manager.wait(job.id, timeout=1)
+            await manager.stop()
+            return queued_status, finished
+
+        queued_status, job = asyncio.run(run())
+        assert queued_status == QUEUED
+        assert job.status == SUCCEEDED
+        assert job.result == {"type": "image", "prompt": "cat"}
+
+    def test_failed_job_records_error(self):
+        """Runner exceptions mark the job failed"""
+        async def run():
+            manager = JobManager(echo, workers=1)
+            await manager.start()
+            job = await manager.submit("text", {"prompt": "x", "fail": True})
+            job = await manager.wait(job.id, timeout=1)
+            await manager.stop()
+            return job, manager.stats()
+
+        job, stats = asyncio.run(run())
+        assert job.status == FAILED
+        assert job.error == "generation failed"
+        assert stats["failed"] == 1
+
+    def test_bounded_workers_and_queue_stats(self):
+        """Only the configured workers run at once; the rest wait in the queue"""
+        async def run():
+            manager = JobManager(echo, workers=2)
+            await manager.start()
+            submitted = [await manager.submit("image", {"prompt": str(i), "delay": 0.05}) for i in range(5)]
+            await asyncio.sleep(0.01)
+            during = manager.stats()
+            for job in submitted:
+                await manager.wait(job.id, timeout=1)
+            after = manager.stats()
+            await manager.stop()
+            return during, after
+
+        during, after = asyncio.run(run())
+        assert during["running"] == 2
+        assert during["queue_depth"] == 3
+        assert after["completed"] == 5
+        assert after["wait_seconds"]["max"] >= 0.05
+
+    def test_queue_full(self):
+        """Submissions beyond the queue capacity are rejected"""
+        async def run():
+            manager = JobManager(echo, workers=1, max_queue=1)
+            await manager.start()
+            await manager.submit("image", {"prompt": "a", "delay": 0.1})
+            await asyncio.sleep(0)
+            await manager.submit("image", {"prompt": "b"})
+            try:
+                with pytest.raises(QueueFullError):
+                    await manager.submit("image", {"prompt": "c"})
+            finally:
+                await manager.stop()
+
+        asyncio.run(run())
+
+    def test_sqlite_persistence(self, tmp_path):
+        """Finished results and unfinished jobs survive a restart"""
+        path = str(tmp_path / "jobs.db")
+
+        async def first_run():
+            manager = JobManager(echo, store=SQLiteJobStore(path), workers=1)
+            await manager.start()
+            done = await manager.submit("image", {"prompt": "done"})
+            await manager.wait(done.id, timeout=1)
+            await manager.stop()
+            # Queued when the process went away
+            pending = await manager.submit("image", {"prompt": "pending"})
+            return done.id, pending.id
+
+        async def second_run(done_id, pending_id):
+            manager = JobManager(echo, store=SQLiteJobStore(path), workers=1)
+            await manager.start()
+            pending = await manager.wait(pending_id, timeout=1)
+            done = manager.get(done_id)
+            await manager.stop()
+            return done, pending
+
+        done, pending = asyncio.run(second_run(*asyncio.run(first_run())))
+        assert done.status == SUCCEEDED
+        assert done.result == {"type": "image", "prompt": "done"}
+        assert pending.status == SUCCEEDED
+
+    def test_recovered_backlog_beyond_queue_size(self, tmp_path):
+        """A persisted backlog larger than the queue still starts and drains"""
+        path = str(tmp_path / "jobs.db")
+
+        async def first_run():
+            manager = JobManager(echo, store=SQLiteJobStore(path), workers=1, max_queue=5)
+            await manager.start()
+            await manager.stop()
+            return [(await manager.submit("image", {"prompt": str(i)})).id for i in range(3)]
+
+        async def second_run(job_ids):
+            manager = JobManager(echo, store=SQLiteJobStore(path), workers=1, max_queue=1)
+            await manager.start()
+            try:
+                with pytest.raises(QueueFullError):
+                    await manager.submit("image", {"prompt": "new"})
+                return [await manager.wait(job_id, timeout=1) for job_id in job_ids]
+            finally:
+                await manager.stop()
+
+        jobs = asyncio.run(second_run(asyncio.run(first_run())))
+        assert [job.status for job in jobs] == [SUCCEEDED] * 3
+
+
+@pytest.mark.usefixtures("open_access")
+class TestJobEndpoints:
+    """Test the /api/jobs endpoints"""
+
+    def test_submit_and_long_poll(self):
+        """Submit returns a job id at once; long-polling returns the result"""
+        async def generate(**kwargs):
+            await asyncio.sleep(0.05)
+            return {"url": "https://image.pollinations.ai/job.jpg"}
+
+        with TestClient(app) as client, patch('main.app.state.client.generate_image', side_effect=generate):
+            response = client.post("/api/jobs/image", json={"prompt": "a queued cat"})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert response.headers["location"] == f"/api/jobs/{job_id}"
+
+            response = client.get(f"/api/jobs/{job_id}", params={"wait": 5})
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == SUCCEEDED
+            assert data["result"] == {"url": "https://image.pollinations.ai/job.jpg"}
+
+            stats = client.get("/api/jobs/stats").json()
+            assert stats["completed"] >= 1
+            assert "queue_depth" in stats
+
+    def test_submit_validates_body(self):
+        """Job bodies are validated like the synchronous endpoints"""
+        with TestClient(app) as client:
+            response = client.post("/api/jobs/audio", json={"prompt": "hi", "speed": 10})
+        assert response.status_code == 422
+
+    def test_unknown_job(self):
+        """Unknown job ids return 404"""
+        with TestClient(app) as client:
+            response = client.get("/api/jobs/does-not-exist")
+        assert response.status_code == 404
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import queue
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import logs
+import main
+from logs import AccessLogMiddleware, JsonFormatter, NonBlockingQueueHandler, parse_sample_rates
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    """Access and error records as they are handed to the queue"""
+    capture = Capture()
+    logs.logger.addHandler(capture)
+    try:
+        yield capture.records
+    finally:
+        logs.logger.removeHandler(capture)
+
+
+def asgi_app(status_code):
+    async def app(scope, receive, send):
+        if status_code is None:
+            raise RuntimeError("boom")
+        await send({"type": "http.response.start", "status": status_code, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+
+def call(middleware, path="/health", headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "headers": list(headers), "client": ("10.0.0.1", 1)}
+    asyncio.run(middleware(scope, None, send))
+    return sent
+
+
+class TestFormatting:
+    """Test the JSON record layout"""
+
+    def test_fields_and_request_id(self):
+        record = logging.LogRecord("polycraft.access", logging.INFO, "", 0, "request", (), None)
+        record.fields = {"status": 200, "route": "/health"}
+        record.request_id = "abc"
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["message"] == "request"
+        assert entry["level"] == "info"
+        assert entry["request_id"] == "abc"
+        assert entry["status"] == 200
+        assert entry["ts"].endswith("Z")
+
+    def test_exception_traceback(self):
+        try:
+            raise ValueError("bad")
+        except ValueError:
+            record = logging.LogRecord("polycraft", logging.ERROR, "", 0, "failed", (), sys.exc_info())
+        assert "ValueError: bad" in json.loads(JsonFormatter().format(record))["exc_info"]
+
+
+class TestQueueHandler:
+    """Test the non-blocking hand-off"""
+
+    def test_full_queue_drops(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        for _ in range(3):
+            handler.handle(logging.LogRecord("polycraft", logging.INFO, "", 0, "x", (), None))
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 2
+
+    def test_correlation_id_captured_on_the_caller(self):
+        token = logs.correlation_id.set("req-1")
+        try:
+            record = logs.queue_handler.prepare(logging.LogRecord("polycraft", logging.INFO, "", 0, "x", (), None))
+        finally:
+            logs.correlation_id.reset(token)
+        assert record.request_id == "req-1"
+
+
+    def test_writer_thread_writes_json_lines(self, tmp_path, monkeypatch):
+        path = tmp_path / "app.log"
+        monkeypatch.setenv("LOG_FILE", str(path))
+        logs.stop_logging()
+        logs.start_logging()
+        logs.logger.warning("disk almost full", extra={"fields": {"free_mb": 12}})
+        logs.stop_logging()
+        entry = json.loads(path.read_text().splitlines()[-1])
+        assert entry["message"] == "disk almost full"
+        assert entry["free_mb"] == 12
+
+
+class TestAccessLog:
+    """Test correlation ids and sampling"""
+
+    def test_request_id_echoed(self, captured):
+        sent = call(AccessLogMiddleware(asgi_app(200), 1.0, {}), headers=[(b"x-request-id", b"client-id.1")])
+        assert (b"x-request-id", b"client-id.1") in sent[0]["headers"]
+        record, = captured
+        assert record.fields["status"] == 200
+        assert record.fields["route"] == "/health"
+
+    def test_untrusted_request_id_replaced(self):
+        sent = call(AccessLogMiddleware(asgi_app(200), 0.0, {}), headers=[(b"x-request-id", b"a b\r\nc")])
+        request_id = dict(sent[0]["headers"])[b"x-request-id"]
+        assert request_id != b"a b\r\nc"
+        assert len(request_id) == 16
+
+    def test_sampling_per_route(self, captured):
+        middleware = AccessLogMiddleware(asgi_app(200), 1.0, parse_sample_rates("/health=0, /api/x=1"))
+        call(middleware, "/health")
+        call(middleware, "/api/x")
+        assert [record.fields["path"] for record in captured] == ["/api/x"]
+
+    def test_server_errors_always_logged(self, captured):
+        call(AccessLogMiddleware(asgi_app(503), 0.0, {}))
+        with pytest.raises(RuntimeError):
+            call(AccessLogMiddleware(asgi_app(None), 0.0, {}))
+        assert [(record.levelname, getattr(record, "fields", {}).get("status")) for record in captured] == [
+            ("INFO", 503), ("ERROR", None), ("INFO", 500)
+        ]
+        assert captured[1].exc_info[0] is RuntimeError
+
+    def test_app_records_carry_the_request_id(self, captured, open_access):
+        response = TestClient(main.app).post(
+            "/api/generate/text", json={"prompt": "explain access logs"}, headers={"X-Request-ID": "trace-me"}
+        )
+        assert response.headers["x-request-id"] == "trace-me"
+        record = captured[-1]
+        assert record.fields["route"] == "/api/generate/text"
+        assert record.request_id == "trace-me"
+
+    def test_parse_sample_rates(self):
+        assert parse_sample_rates("/health=0,/api/generate/image=0.1,bad,/x=7") == {
+            "/health": 0.0, "/api/generate/image": 0.1, "/x": 1.0
+        }
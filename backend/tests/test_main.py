@@ -6,6 +6,7 @@ from main import app
 
 client = TestClient(app)
 
+@pytest.mark.usefixtures("open_access")
 class TestHealthEndpoint:
     def test_health_check(self):
         """Test the health check endpoint."""
@@ -15,10 +16,11 @@ class TestHealthEndpoint:
         assert data["status"] == "healthy"
         assert "timestamp" in data
 
+@pytest.mark.usefixtures("open_access")
 class TestImageGeneration:
     def test_generate_image_success(self):
         """Test successful image generation."""
-        with patch('main.client.generate_image') as mock_generate:
+        with patch('main.app.state.client.generate_image') as mock_generate:
             mock_generate.return_value = {
                 "url": "https://image.pollinations.ai/test-image.png"
             }
@@ -54,10 +56,11 @@ class TestImageGeneration:
         
         assert response.status_code == 422  # Validation error
 
+@pytest.mark.usefixtures("open_access")
 class TestTextGeneration:
     def test_generate_text_success(self):
         """Test successful text generation."""
-        with patch('main.client.generate_text') as mock_generate:
+        with patch('main.app.state.client.generate_text') as mock_generate:
             mock_generate.return_value = {
                 "text": "This is generated text",
                 "source": "static"
@@ -81,10 +84,11 @@ class TestTextGeneration:
         
         assert response.status_code == 422
 
+@pytest.mark.usefixtures("open_access")
 class TestAudioGeneration:
     def test_generate_audio_success(self):
         """Test successful audio generation."""
-        with patch('main.client.generate_audio') as mock_generate:
+        with patch('main.app.state.client.generate_audio') as mock_generate:
             mock_generate.return_value = {
                 "url": "https://audio.pollinations.ai/test-audio.mp3"
             }
@@ -108,11 +112,12 @@ class TestAudioGeneration:
         
         assert response.status_code == 422
 
+@pytest.mark.usefixtures("open_access")
 class TestBatchGeneration:
     def test_batch_generate_mixed(self):
         """Test batch generation with mixed request types."""
-        with patch('main.client.generate_image') as mock_image, \
-             patch('main.client.generate_text') as mock_text:
+        with patch('main.app.state.client.generate_image') as mock_image, \
+             patch('main.app.state.client.generate_text') as mock_text:
             
             mock_image.return_value = {"url": "https://test-image.png"}
             mock_text.return_value = {"text": "Generated text"}
@@ -135,6 +140,7 @@ class TestBatchGeneration:
             assert "results" in data
             assert len(data["results"]) == 2
 
+@pytest.mark.usefixtures("no_api_key")
 class TestRateLimiting:
     def test_rate_limiting(self):
         """Test that rate limiting is applied."""
@@ -147,6 +153,7 @@ class TestRateLimiting:
         # The last request should be rate limited
         assert response.status_code == 429
 
+@pytest.mark.usefixtures("open_access")
 class TestErrorHandling:
     def test_invalid_json(self):
         """Test handling of invalid JSON."""
@@ -162,7 +169,7 @@ class TestErrorHandling:
         
     def test_internal_server_error(self):
         """Test handling of internal server errors."""
-        with patch('main.client.generate_image') as mock_generate:
+        with patch('main.app.state.client.generate_image') as mock_generate:
             mock_generate.side_effect = Exception("Internal error")
             
             response = client.post("/api/generate/image", json={
@@ -0,0 +1,90 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+import metrics
+from main import app, PollinationsClient
+from resilience import RetryPolicy
+
+client = TestClient(app)
+
+
+def sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0.0
+
+
+pytestmark = pytest.mark.usefixtures("no_api_key")
+
+
+class TestMetricsEndpoint:
+    """Test the Prometheus /metrics endpoint"""
+
+    def test_exposition_format(self):
+        """/metrics serves the Prometheus text format"""
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "polycraft_requests_total" in response.text
+        assert "polycraft_cache_lookups_total" in response.text
+        assert "polycraft_job_queue_depth" in response.text
+
+    def test_request_count_and_latency_per_route(self):
+        """Requests are counted and timed under their endpoint name"""
+        before = sample("polycraft_requests_total", route="generate_text", method="POST", status="200")
+        with patch('main.app.state.client.generate_text', return_value={"text": "hi"}):
+            client.post("/api/generate/text", json={"prompt": "metrics"})
+
+        assert sample("polycraft_requests_total", route="generate_text", method="POST", status="200") == before + 1
+        assert sample("polycraft_request_duration_seconds_count", route="generate_text") >= 1
+        assert sample("polycraft_requests_in_flight") == 0
+
+    def test_unknown_routes_share_one_label(self):
+        """Unmatched paths do not create a label per URL"""
+        before = sample("polycraft_requests_total", route="unmatched", method="GET", status="404")
+        client.get("/api/nope-1")
+        client.get("/api/nope-2")
+        assert sample("polycraft_requests_total", route="unmatched", method="GET", status="404") == before + 2
+
+    def test_rate_limit_rejections_counted(self):
+        """Requests rejected by the limiter are counted per route"""
+        before = sample("polycraft_rate_limit_rejections_total", route="batch_generate_stream")
+        with patch('main.app.state.client.generate_text', return_value={"text": "hi"}):
+            statuses = [
+                client.post("/api/batch/stream", json={"requests": []}).status_code
+                for _ in range(7)
+            ]
+        assert 429 in statuses
+        assert sample("polycraft_rate_limit_rejections_total", route="batch_generate_stream") == before + statuses.count(429)
+
+
+class TestUpstreamMetrics:
+    """Test upstream Pollinations call instrumentation"""
+
+    def test_upstream_latency_and_status(self):
+        """Upstream calls record latency and status code per host"""
+        pollinations = PollinationsClient()
+        pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        before = sample("polycraft_upstream_responses_total", host="image.pollinations.ai", status="200")
+
+        asyncio.run(pollinations.generate_image("an instrumented cat"))
+
+        assert sample("polycraft_upstream_responses_total", host="image.pollinations.ai", status="200") == before + 1
+        assert sample("polycraft_upstream_duration_seconds_count", host="image.pollinations.ai") >= 1
+
+    def test_upstream_connection_errors(self):
+        """Transport failures are recorded with an error status"""
+        def fail(request):
+            raise httpx.ConnectError("refused")
+
+        pollinations = PollinationsClient()
+        pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(fail))
+        pollinations.retry_policy = RetryPolicy(retries=0)
+        before = sample("polycraft_upstream_responses_total", host="image.pollinations.ai", status="error")
+
+        with pytest.raises(Exception):
+            asyncio.run(pollinations.generate_image("an unreachable cat"))
+
+        assert sample("polycraft_upstream_responses_total", host="image.pollinations.ai", status="error") == before + 1
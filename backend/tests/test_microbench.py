@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MICRO = os.path.join(BACKEND_DIR, "benchmarks", "micro.py")
+
+
+def micro(*args):
+    # A subprocess keeps coverage tracing out of the timings
+    return subprocess.run(
+        [sys.executable, MICRO, "--filter", "text.", "--repeat", "2", "--min-time", "0.02", *args],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120,
+    )
+
+
+class TestMicrobenchGate:
+    """Test the regression gate of benchmarks/micro.py"""
+
+    def test_regression_fails_the_check(self, tmp_path):
+        baseline = tmp_path / "baseline.json"
+        assert micro("--update", "--baseline", str(baseline)).returncode == 0
+        recorded = json.loads(baseline.read_text())
+        assert set(recorded["results"]) == {"text.classify_prompt", "text.extract_topic"}
+
+        # Pretend the baseline was ten times faster
+        for result in recorded["results"].values():
+            result["relative"] /= 10
+        baseline.write_text(json.dumps(recorded))
+        check = micro("--check", "--retries", "0", "--baseline", str(baseline))
+        assert check.returncode == 1
+        assert "regressed beyond tolerance" in check.stderr
+
+    def test_missing_baseline_fails_the_check(self, tmp_path):
+        check = micro("--check", "--baseline", str(tmp_path / "none.json"))
+        assert check.returncode == 1
+        assert "no baseline" in check.stderr
+
+    @pytest.mark.benchmark
+    @pytest.mark.skipif(not os.getenv("MICROBENCH"), reason="set MICROBENCH=1 (and MICROBENCH_REF) to gate on a git ref")
+    def test_no_regression_against_ref(self, tmp_path):
+        check = subprocess.run(
+            [sys.executable, MICRO, "--check", "--against", os.getenv("MICROBENCH_REF", "HEAD"),
+             "--baseline", str(tmp_path / "baseline.json")],
+            cwd=BACKEND_DIR, capture_output=True, text=True,
+        )
+        assert check.returncode == 0, check.stdout + check.stderr
@@ -0,0 +1,445 @@
+import asyncio
+import httpx
+import json
+import pytest
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import main
+import metrics
+from main import PollinationsClient, app
+from resilience import RetryPolicy
+from settings import Settings
+from fastapi.testclient import TestClient
+
+
+def mock_upstream(handler, settings=None):
+    """PollinationsClient whose pool is backed by an in-process transport"""
+    pollinations = PollinationsClient(settings)
+    pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pollinations
+
+
+class ImageStream(httpx.AsyncByteStream):
+    """Large upstream body that records whether anyone read it"""
+    consumed = False
+
+    async def __aiter__(self):
+        ImageStream.consumed = True
+        for _ in range(10):
+            yield b"\xff" * 100_000
+
+
+def redirecting_handler(seen):
+    """Redirect /prompt/* to a CDN URL that serves a large image body"""
+    ImageStream.consumed = False
+
+    def handler(request):
+        seen.append((request.method, request.url.path))
+        if request.url.path.startswith("/prompt/"):
+            return httpx.Response(302, headers={"Location": "https://cdn.example/final.jpg"})
+        return httpx.Response(200, stream=ImageStream(), headers={"Content-Type": "image/jpeg"})
+    return handler
+
+
+class TestConnectionPool:
+    """Test the shared upstream connection pool"""
+
+    def test_pool_configured_from_settings(self):
+        """Pool limits and timeouts come from UPSTREAM_* settings"""
+        pollinations = PollinationsClient(Settings(
+            upstream_max_connections=7,
+            upstream_max_keepalive=3,
+            upstream_connect_timeout=2,
+            upstream_read_timeout=12,
+        ))
+
+        assert pollinations.client.timeout.connect == 2.0
+        assert pollinations.client.timeout.read == 12.0
+        limits = pollinations.pool_stats()["limits"]
+        assert limits["max_connections"] == 7
+        assert limits["max_keepalive"] == 3
+
+    def test_pool_stats_empty_pool(self):
+        """A fresh client reports an empty pool"""
+        stats = PollinationsClient().pool_stats()
+        assert stats["connections"] == 0
+        assert stats["active"] == 0
+        assert stats["queued"] == 0
+        assert stats["in_flight_by_host"] == {}
+
+    def test_generations_reuse_shared_client(self):
+        """Image and audio calls go through the client's own pool"""
+        seen = []
+        pollinations = mock_upstream(lambda request: seen.append(request) or httpx.Response(200))
+
+        with patch('httpx.AsyncClient.__init__') as mock_init:
+            asyncio.run(pollinations.generate_image("a pooled cat"))
+            asyncio.run(pollinations.generate_audio("a pooled hello"))
+            mock_init.assert_not_called()
+        assert len(seen) == 2
+
+    def test_per_host_limit(self):
+        """Concurrent requests to one host are capped by UPSTREAM_MAX_PER_HOST"""
+        pollinations = PollinationsClient(Settings(upstream_max_per_host=2))
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with pollinations._host_slot("https://image.pollinations.ai/prompt/x"):
+                peak = max(peak, pollinations.pool_stats()["in_flight_by_host"]["image.pollinations.ai"])
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        assert peak == 2
+        assert pollinations.pool_stats()["in_flight_by_host"] == {}
+
+
+class TestUrlResolution:
+    """Test resolving final asset URLs without downloading bodies"""
+
+    def test_stream_mode_skips_body(self):
+        """Redirects are followed and the image body is left unread"""
+        seen = []
+        pollinations = mock_upstream(redirecting_handler(seen))
+
+        result = asyncio.run(pollinations.generate_image("a streamed cat"))
+        assert not ImageStream.consumed
+        assert result["url"] == "https://cdn.example/final.jpg"
+        assert [method for method, _ in seen] == ["GET", "GET"]
+
+    def test_head_mode(self):
+        """HEAD mode resolves the URL without a GET"""
+        seen = []
+        pollinations = mock_upstream(redirecting_handler(seen), Settings(upstream_resolve_mode="head"))
+
+        result = asyncio.run(pollinations.generate_image("a head cat"))
+        assert result["url"] == "https://cdn.example/final.jpg"
+        assert {method for method, _ in seen} == {"HEAD"}
+
+    def test_head_mode_falls_back_when_unsupported(self):
+        """Upstreams that reject HEAD are resolved with a streamed GET"""
+        seen = []
+
+        def handler(request):
+            seen.append(request.method)
+            if request.method == "HEAD":
+                return httpx.Response(405)
+            return httpx.Response(200, content=b"audio")
+
+        pollinations = mock_upstream(handler, Settings(upstream_resolve_mode="head"))
+
+        result = asyncio.run(pollinations.generate_audio("a head hello"))
+        assert result["url"].startswith(pollinations.audio_url)
+        assert seen == ["HEAD", "GET"]
+
+    def test_upstream_error_is_reported(self):
+        """Upstream error statuses still surface with their body"""
+        pollinations = mock_upstream(lambda request: httpx.Response(503, text="overloaded"))
+
+        with pytest.raises(Exception, match="503 overloaded"):
+            asyncio.run(pollinations.generate_image("an unlucky cat"))
+
+
+@pytest.mark.usefixtures("open_access")
+class TestImageStreaming:
+    """Test relaying image bytes through /api/generate/image/stream"""
+
+    def test_stream_endpoint_relays_bytes(self):
+        """Image bytes and content type are passed straight through"""
+        seen = []
+        with patch('main.app.state.client', mock_upstream(redirecting_handler(seen))):
+            response = TestClient(app).post("/api/generate/image/stream", json={"prompt": "a relayed cat"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.headers["x-image-url"] == "https://cdn.example/final.jpg"
+        assert len(response.content) == 1_000_000
+
+    def test_relay_holds_the_upstream_slot_until_closed(self):
+        """The host slot and concurrency limit count relays whose body is still flowing"""
+        pollinations = mock_upstream(
+            lambda request: httpx.Response(200, stream=ImageStream(), headers={"Content-Type": "image/jpeg"})
+        )
+        host = urlsplit(pollinations.image_url).netloc
+
+        async def run():
+            relay = await pollinations.stream_image("a slow cat")
+            chunks = relay.aiter_raw()
+            await chunks.__anext__()
+            during = pollinations.limiter(host).in_flight, pollinations.pool_stats()["in_flight_by_host"].get(host)
+            await chunks.aclose()
+            await relay.aclose()
+            return during
+
+        assert asyncio.run(run()) == (1, 1)
+        assert pollinations.limiter(host).in_flight == 0
+        assert host not in pollinations.pool_stats()["in_flight_by_host"]
+
+    def test_stream_endpoint_upstream_error(self):
+        """Upstream failures map to the upstream status code"""
+        with patch('main.app.state.client', mock_upstream(lambda request: httpx.Response(502, text="bad gateway"))):
+            response = TestClient(app).post("/api/generate/image/stream", json={"prompt": "a broken cat"})
+
+        assert response.status_code == 502
+
+
+class TestRequestCoalescing:
+    """Test single-flight coalescing of identical in-flight generations"""
+
+    def test_identical_requests_share_one_upstream_call(self):
+        """Concurrent identical requests trigger one upstream call"""
+        pollinations = PollinationsClient()
+        calls = 0
+
+        async def resolve(url, params):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "https://image.pollinations.ai/coalesced.jpg"
+
+        async def run():
+            with patch.object(pollinations, "_resolve_url", side_effect=resolve):
+                return await asyncio.gather(*(pollinations.generate_image("a viral coalesced cat") for _ in range(10)))
+
+        results = asyncio.run(run())
+        assert calls == 1
+        assert pollinations.coalesced == 9
+        assert all(result["url"] == "https://image.pollinations.ai/coalesced.jpg" for result in results)
+        assert pollinations._in_flight == {}
+
+    def test_failure_propagates_to_followers(self):
+        """Every coalesced caller sees the leader's failure"""
+        pollinations = PollinationsClient()
+
+        async def resolve(url, params):
+            await asyncio.sleep(0.02)
+            raise httpx.ConnectError("upstream down")
+
+        async def run():
+            with patch.object(pollinations, "_resolve_url", side_effect=resolve):
+                return await asyncio.gather(
+                    *(pollinations.generate_image("a failing coalesced cat") for _ in range(3)),
+                    return_exceptions=True,
+                )
+
+        results = asyncio.run(run())
+        assert all("upstream down" in str(result) for result in results)
+        assert pollinations._in_flight == {}
+
+    def test_cancelled_caller_does_not_cancel_followers(self):
+        """Cancelling the first caller leaves the shared call running"""
+        pollinations = PollinationsClient()
+
+        async def resolve(url, params):
+            await asyncio.sleep(0.05)
+            return "https://image.pollinations.ai/survivor.jpg"
+
+        async def run():
+            with patch.object(pollinations, "_resolve_url", side_effect=resolve):
+                leader = asyncio.ensure_future(pollinations.generate_image("a cancelled coalesced cat"))
+                await asyncio.sleep(0.01)
+                follower = asyncio.ensure_future(pollinations.generate_image("a cancelled coalesced cat"))
+                await asyncio.sleep(0.01)
+                leader.cancel()
+                return await follower, leader.cancelled()
+
+        result, leader_cancelled = asyncio.run(run())
+        assert leader_cancelled
+        assert result["url"] == "https://image.pollinations.ai/survivor.jpg"
+
+
+def text_events(*words, done=True):
+    """OpenAI-style event stream body, as text.pollinations.ai sends with stream=true"""
+    body = "".join(f'data: {{"choices": [{{"delta": {{"content": "{word}"}}}}]}}\n\n' for word in words)
+    return body + ("data: [DONE]\n\n" if done else "")
+
+
+def text_upstream(handler):
+    pollinations = mock_upstream(handler)
+    pollinations.text_upstream = True
+    pollinations.retry_policy = RetryPolicy(retries=0)
+    return pollinations
+
+
+class CountingTextStream(httpx.AsyncByteStream):
+    """Endless event stream that counts the chunks read from it"""
+
+    def __init__(self, fail_after=None):
+        self.produced = 0
+        self.fail_after = fail_after
+
+    async def __aiter__(self):
+        while True:
+            if self.produced == self.fail_after:
+                raise httpx.ReadError("connection reset")
+            self.produced += 1
+            yield text_events(f"w{self.produced} ", done=False).encode()
+
+
+class TestTextGeneration:
+    """Test text generation through text.pollinations.ai"""
+
+    def test_upstream_text_is_cached(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.url)
+            return httpx.Response(200, text=text_events("Tides ", "turn."), headers={"Content-Type": "text/event-stream"})
+
+        pollinations = text_upstream(handler)
+
+        async def run():
+            return await pollinations.generate_text("why do tides turn?"), await pollinations.generate_text("why do tides turn?")
+
+        first, second = asyncio.run(run())
+        assert first["text"] == "Tides turn."
+        assert first["source"] == "pollinations"
+        assert (first["cache"], second["cache"]) == ("miss", "fresh")
+        assert len(seen) == 1
+        assert seen[0].raw_path.startswith(b"/why%20do%20tides%20turn%3F?")
+        assert seen[0].params["stream"] == "true" and seen[0].params["model"] == "openai"
+
+    def test_plain_body(self):
+        pollinations = text_upstream(lambda request: httpx.Response(200, text="Plain tides."))
+        result = asyncio.run(pollinations.generate_text("plain tides"))
+        assert result["text"] == "Plain tides."
+
+    def test_template_fallback_is_short_lived(self):
+        pollinations = text_upstream(lambda request: httpx.Response(503, text="overloaded"))
+
+        async def run():
+            return await pollinations.generate_text("explain fallback tides"), await pollinations.generate_text("explain fallback tides")
+
+        first, second = asyncio.run(run())
+        assert first["source"] == "enhanced_template"
+        assert "503" in first["metadata"]["upstream_error"]
+        assert second["cache"] == "negative"
+
+    def test_stream_reads_upstream_on_demand(self):
+        upstream = CountingTextStream()
+        pollinations = text_upstream(
+            lambda request: httpx.Response(200, stream=upstream, headers={"Content-Type": "text/event-stream"})
+        )
+
+        async def run():
+            tokens = pollinations.stream_text("an endless tide", "openai")
+            first = await tokens.__anext__()
+            await tokens.aclose()
+            return first
+
+        assert asyncio.run(run()) == "w1 "
+        assert upstream.produced <= 2
+
+    def test_stream_holds_the_upstream_slot_until_closed(self):
+        upstream = CountingTextStream(fail_after=3)
+        pollinations = text_upstream(
+            lambda request: httpx.Response(200, stream=upstream, headers={"Content-Type": "text/event-stream"})
+        )
+        host = urlsplit(pollinations.text_url).netloc
+
+        async def run():
+            tokens = pollinations.stream_text("a slotted tide", "openai")
+            await tokens.__anext__()
+            during = pollinations.limiter(host).in_flight, pollinations.pool_stats()["in_flight_by_host"].get(host)
+            with pytest.raises(httpx.ReadError):
+                async for _ in tokens:
+                    pass
+            return during
+
+        assert asyncio.run(run()) == (1, 1)
+        assert pollinations.limiter(host).in_flight == 0
+        assert host not in pollinations.pool_stats()["in_flight_by_host"]
+        # A stream cut off mid-way counts against the host
+        assert pollinations.breaker(host).failures == 1
+
+    def test_silent_upstream_falls_back_without_retrying(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.extensions["timeout"])
+            raise httpx.ReadTimeout("no first byte")
+
+        pollinations = text_upstream(handler)
+        pollinations.retry_policy = RetryPolicy(retries=2, base_delay=0, max_delay=0)
+        pollinations.text_timeout = 1.5
+        result = asyncio.run(pollinations.generate_text("explain silent tides"))
+        assert result["source"] == "enhanced_template"
+        assert len(calls) == 1
+        assert calls[0]["read"] == 1.5
+
+    def test_abandoned_stream_releases_the_slot(self):
+        upstream = CountingTextStream()
+        pollinations = text_upstream(
+            lambda request: httpx.Response(200, stream=upstream, headers={"Content-Type": "text/event-stream"})
+        )
+        host = urlsplit(pollinations.text_url).netloc
+
+        async def run():
+            chunks = pollinations.generate_text_stream("an abandoned tide")
+            first = await chunks.__anext__()
+            await chunks.aclose()
+            return first, pollinations.limiter(host).in_flight
+
+        assert asyncio.run(run()) == (("text", "w1 "), 0)
+
+
+@pytest.mark.usefixtures("open_access")
+class TestTextStreaming:
+    """Test /api/generate/text/stream"""
+
+    @staticmethod
+    def sse(response):
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            name, data = block.split("\n")
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_tokens_then_replay_from_cache(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, text=text_events("Moon", "lit ", "tides."), headers={"Content-Type": "text/event-stream"})
+
+        first_tokens = metrics.TEXT_FIRST_TOKEN._sum.get()
+        with patch('main.app.state.client', text_upstream(handler)):
+            api = TestClient(app)
+            first = api.post("/api/generate/text/stream", json={"prompt": "moonlit tides"}, headers={"Accept": "text/event-stream"})
+            replay = api.post("/api/generate/text/stream", json={"prompt": "moonlit tides"}, headers={"Accept": "text/event-stream"})
+            plain = api.post("/api/generate/text/stream", json={"prompt": "moonlit tides"})
+
+        assert first.headers["content-type"].startswith("text/event-stream")
+        events = self.sse(first)
+        assert [data["text"] for name, data in events if name == "text"] == ["Moon", "lit ", "tides."]
+        done = events[-1][1]
+        assert done["cache"] == "miss" and done["source"] == "pollinations"
+        assert "first_token_ms" in done["metadata"]
+        assert metrics.TEXT_FIRST_TOKEN._sum.get() > first_tokens
+
+        assert self.sse(replay) == [("text", {"text": "Moonlit tides."}), ("done", {**done, "cache": "fresh"})]
+        assert plain.text == "Moonlit tides."
+        assert len(calls) == 1
+
+    def test_fallback_when_upstream_unavailable(self):
+        with patch('main.app.state.client', text_upstream(lambda request: httpx.Response(502, text="bad gateway"))):
+            response = TestClient(app).post("/api/generate/text/stream", json={"prompt": "explain stormy tides"})
+        assert response.status_code == 200
+        assert "stormy tides" in response.text
+
+    def test_cut_off_stream_is_not_cached(self):
+        upstream = CountingTextStream(fail_after=2)
+        handler = lambda request: httpx.Response(200, stream=upstream, headers={"Content-Type": "text/event-stream"})
+        with patch('main.app.state.client', text_upstream(handler)):
+            response = TestClient(app).post(
+                "/api/generate/text/stream", json={"prompt": "interrupted tides"}, headers={"Accept": "text/event-stream"}
+            )
+            pollinations = main.app.state.client
+            cached = asyncio.run(pollinations.cache.get(pollinations.cache_key("text", prompt="interrupted tides", model="openai", seed=None)))
+        events = self.sse(response)
+        assert [name for name, _ in events] == ["text", "text", "error"]
+        assert cached is None
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from main import app, create_app
+from ratelimit import MemoryBuckets, RateLimiter, RedisBuckets
+from settings import Settings
+
+client = TestClient(app)
+
+
+pytestmark = pytest.mark.usefixtures("no_api_key")
+
+
+def drain(limiter, scope, identity, tier="free", attempts=50):
+    async def run():
+        return [await limiter.check(scope, identity, tier) for _ in range(attempts)]
+
+    return asyncio.run(run())
+
+
+class TestTokenBucket:
+    """Test token bucket accounting in both stores"""
+
+    def test_memory_bucket_allows_capacity_then_rejects(self):
+        """A fresh bucket admits its capacity in a burst, then asks the caller to wait"""
+        limiter = RateLimiter()
+        results = drain(limiter, "image", "ip:1.2.3.4", attempts=12)
+        assert [r.allowed for r in results] == [True] * 10 + [False] * 2
+        assert results[9].remaining == 0
+        assert 0 < results[-1].retry_after <= 6
+
+    def test_memory_bucket_refills_over_time(self):
+        """Tokens come back at limit/60 per second"""
+        buckets = MemoryBuckets()
+
+        async def run():
+            with patch("ratelimit.time.monotonic", return_value=100.0):
+                for _ in range(10):
+                    await buckets.take("k", 10, 10 / 60_000)
+                assert (await buckets.take("k", 10, 10 / 60_000))[0] is False
+            with patch("ratelimit.time.monotonic", return_value=106.5):
+                return await buckets.take("k", 10, 10 / 60_000)
+
+        allowed, _, _ = asyncio.run(run())
+        assert allowed is True
+
+    def test_redis_bucket_is_atomic_and_expires(self):
+        """The Lua script enforces the limit and lets idle buckets expire"""
+        redis = fakeredis.FakeAsyncRedis()
+        buckets = RedisBuckets(redis)
+
+        async def run():
+            results = [await buckets.take("text:ip:1", 3, 3 / 60_000) for _ in range(4)]
+            ttl = await redis.pttl("polycraft:ratelimit:text:ip:1")
+            return results, ttl
+
+        results, ttl = asyncio.run(run())
+        assert [allowed for allowed, _, _ in results] == [True, True, True, False]
+        assert results[-1][2] > 0
+        assert 0 < ttl <= 61_000
+
+    def test_workers_share_one_store(self):
+        """Two workers pointing at the same store split a single budget"""
+        redis = fakeredis.FakeAsyncRedis()
+        workers = [RateLimiter(RedisBuckets(redis)), RateLimiter(RedisBuckets(redis))]
+
+        async def run():
+            return [
+                (await workers[i % 2].check("batch", "ip:9.9.9.9", "free")).allowed
+                for i in range(8)
+            ]
+
+        assert asyncio.run(run()).count(True) == 5
+
+    def test_store_failure_falls_back_to_local_buckets(self):
+        """An unreachable store degrades to per-process limits instead of failing requests"""
+
+        class BrokenBuckets:
+            async def take(self, key, capacity, rate):
+                raise ConnectionError("redis down")
+
+        limiter = RateLimiter(BrokenBuckets())
+        results = drain(limiter, "batch", "ip:1", attempts=6)
+        assert [r.allowed for r in results] == [True] * 5 + [False]
+        assert limiter.shared_errors == 6
+
+
+class TestTiersAndIdentity:
+    """Test tier lookup and client identification"""
+
+    def test_tier_multipliers(self):
+        """Pro and enterprise keys get scaled limits"""
+        settings = Settings(api_keys_pro="p1,p2", api_keys_enterprise="e1", rate_limit_tier_multipliers="pro=3")
+        limiter = RateLimiter(settings=settings)
+        assert limiter.tier_for("p2") == "pro"
+        assert limiter.tier_for("e1") == "enterprise"
+        assert limiter.tier_for("unknown") == "free"
+        assert limiter.tier_for(None) == "free"
+        assert limiter.limit_for("image", "free") == 10
+        assert limiter.limit_for("image", "pro") == 30
+        assert limiter.limit_for("image", "enterprise") == 200
+
+    def test_configured_limits(self):
+        """RATE_LIMIT_* sets the base per-minute limits"""
+        limiter = RateLimiter(settings=Settings(rate_limit_text=2))
+        assert [r.allowed for r in drain(limiter, "text", "ip:1", attempts=3)] == [True, True, False]
+
+    def test_forwarded_for_uses_trusted_hop(self):
+        """Only the address appended by our proxy is trusted"""
+        limiter = RateLimiter(settings=Settings(trusted_proxy_hops=1))
+        headers = {"x-forwarded-for": "6.6.6.6, 203.0.113.7"}
+        assert limiter.client_ip(headers, "172.18.0.2") == "203.0.113.7"
+        assert limiter.client_ip({}, "172.18.0.2") == "172.18.0.2"
+
+    def test_forwarded_for_ignored_by_default(self):
+        """Without configured proxies the header is client-supplied"""
+        with patch.dict("os.environ"):
+            os.environ.pop("TRUSTED_PROXY_HOPS", None)
+            limiter = RateLimiter()
+        assert limiter.client_ip({"x-forwarded-for": "203.0.113.7"}, "172.18.0.2") == "172.18.0.2"
+
+    def test_only_tier_keys_get_a_bucket(self):
+        """Unknown keys do not get a bucket of their own"""
+        limiter = RateLimiter(settings=Settings(api_keys_pro="p1", api_keys_enterprise="e1"))
+        assert limiter.tier_key("p1") == "p1"
+        assert limiter.tier_key("e1") == "e1"
+        assert limiter.tier_key("made-up") is None
+        assert limiter.tier_key(None) is None
+
+    def test_api_key_identity_is_hashed(self):
+        """Keyed clients share a bucket across IPs without storing the raw key"""
+        limiter = RateLimiter()
+        first = limiter.identity({}, "1.1.1.1", "secret")
+        assert first == limiter.identity({}, "2.2.2.2", "secret")
+        assert "secret" not in first
+        assert limiter.identity({}, "1.1.1.1", None) == "ip:1.1.1.1"
+
+
+class TestRateLimitedEndpoints:
+    """Test the rate limit dependency on the API routes"""
+
+    def test_rejection_headers(self):
+        """Exhausting a bucket returns 429 with Retry-After and limit headers"""
+        with patch.object(main.app.state, "limiter", RateLimiter()), \
+             patch('main.app.state.client.generate_text', return_value={"text": "hi"}):
+            responses = [
+                client.post("/api/generate/text", json={"prompt": "hi"}, headers={"X-Forwarded-For": "198.51.100.1"})
+                for _ in range(31)
+            ]
+        assert responses[0].status_code == 200
+        assert responses[0].headers["X-RateLimit-Limit"] == "30"
+        assert responses[0].headers["X-RateLimit-Remaining"] == "29"
+        assert responses[-1].status_code == 429
+        assert int(responses[-1].headers["Retry-After"]) >= 1
+        assert responses[-1].headers["X-RateLimit-Remaining"] == "0"
+
+    def test_clients_are_limited_separately(self):
+        """Different forwarded client addresses get their own buckets"""
+        limiter = RateLimiter(settings=Settings(trusted_proxy_hops=1))
+        with patch.object(main.app.state, "limiter", limiter), \
+             patch('main.app.state.client.generate_text', return_value={"text": "hi"}):
+            for _ in range(5):
+                client.post("/api/batch", json={"requests": []}, headers={"X-Forwarded-For": "198.51.100.2"})
+            blocked = client.post("/api/batch", json={"requests": []}, headers={"X-Forwarded-For": "198.51.100.2"})
+            other = client.post("/api/batch", json={"requests": []}, headers={"X-Forwarded-For": "198.51.100.3"})
+        assert blocked.status_code == 429
+        assert other.status_code == 200
+
+    def test_unknown_keys_share_the_ip_bucket(self):
+        """Rotating made-up API keys does not escape the limit; a tier key does"""
+        limiter = RateLimiter(settings=Settings(api_keys_pro="pro-key", rate_limit_text=2))
+        with patch.object(main.app.state, "limiter", limiter), \
+             patch('main.app.state.client.generate_text', return_value={"text": "hi"}):
+            statuses = [
+                client.post("/api/generate/text", json={"prompt": "hi"}, headers={"X-API-Key": f"made-up-{i}"}).status_code
+                for i in range(3)
+            ]
+            pro = client.post("/api/generate/text", json={"prompt": "hi"}, headers={"X-API-Key": "pro-key"})
+        assert statuses == [200, 200, 429]
+        assert pro.status_code == 200
+        assert pro.headers["X-RateLimit-Limit"] == "10"
+
+    def test_tier_keys_authenticate(self):
+        """Tier keys and X-API-Key are accepted when BACKEND_API_KEY is set"""
+        app = create_app(Settings(backend_api_key="backend", api_keys_pro="pro-key"))
+        test_client = TestClient(app)
+        with patch.object(app.state.client, "generate_text", return_value={"text": "hi"}):
+            pro = test_client.post("/api/generate/text", json={"prompt": "hi"}, headers={"Authorization": "Bearer pro-key"})
+            header = test_client.post("/api/generate/text", json={"prompt": "hi"}, headers={"X-API-Key": "backend"})
+            made_up = test_client.post("/api/generate/text", json={"prompt": "hi"}, headers={"X-API-Key": "made-up"})
+        assert pro.status_code == 200
+        assert pro.headers["X-RateLimit-Limit"] == "150"
+        assert header.status_code == 200
+        assert made_up.status_code == 401
+
+    def test_backend_key_is_limited_per_ip(self):
+        """BACKEND_API_KEY is shared by every frontend user, so it gets no bucket of its own"""
+        app = create_app(Settings(backend_api_key="backend", rate_limit_text=1, trusted_proxy_hops=1))
+        test_client = TestClient(app)
+
+        def post(ip):
+            return test_client.post(
+                "/api/generate/text", json={"prompt": "hi"},
+                headers={"Authorization": "Bearer backend", "X-Forwarded-For": ip},
+            ).status_code
+
+        with patch.object(app.state.client, "generate_text", return_value={"text": "hi"}):
+            assert [post("198.51.100.4"), post("198.51.100.4"), post("198.51.100.5")] == [200, 429, 200]
@@ -0,0 +1,300 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from main import PollinationsClient, app
+from resilience import CLOSED, HALF_OPEN, OPEN, AdaptiveLimiter, CircuitBreaker, CircuitOpenError, RetryPolicy
+from settings import Settings
+
+
+class TestCircuitBreaker:
+    """Test circuit breaker state transitions"""
+
+    def test_opens_after_consecutive_failures(self):
+        """The circuit opens once the failure threshold is reached"""
+        breaker = CircuitBreaker("host", failure_threshold=3, recovery_timeout=30)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_success_resets_failures(self):
+        """A success in between failures keeps the circuit closed"""
+        breaker = CircuitBreaker("host", failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+
+    def test_half_open_probe(self):
+        """After the recovery timeout one probe is allowed through"""
+        breaker = CircuitBreaker("host", failure_threshold=1, recovery_timeout=10)
+        with patch("resilience.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with patch("resilience.time.monotonic", return_value=111.0):
+            breaker.before_call()
+            assert breaker.state == HALF_OPEN
+            with pytest.raises(CircuitOpenError):
+                breaker.before_call()
+            breaker.record_success()
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self):
+        """A failing probe reopens the circuit"""
+        breaker = CircuitBreaker("host", failure_threshold=1, recovery_timeout=10)
+        with patch("resilience.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with patch("resilience.time.monotonic", return_value=111.0):
+            breaker.before_call()
+            breaker.record_failure()
+            assert breaker.state == OPEN
+            with pytest.raises(CircuitOpenError):
+                breaker.before_call()
+
+
+class TestRetryPolicy:
+    """Test bounded retries with jittered backoff"""
+
+    def test_backoff_is_bounded_and_jittered(self):
+        """Backoff grows exponentially up to the cap, drawn with full jitter"""
+        policy = RetryPolicy(retries=5, base_delay=0.1, max_delay=0.5)
+        delays = [policy.backoff(attempt) for attempt in range(6) for _ in range(50)]
+        assert all(0 <= delay <= 0.5 for delay in delays)
+        assert len(set(delays)) > 1
+
+    def test_retries_transient_errors(self):
+        """Retryable errors are retried until success"""
+        policy = RetryPolicy(retries=2, base_delay=0, max_delay=0)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("flaky")
+            return "ok"
+
+        assert asyncio.run(policy.run(flaky, lambda e: True)) == "ok"
+        assert len(attempts) == 3
+
+    def test_gives_up_after_retries(self):
+        """The last error is raised once retries are exhausted"""
+        policy = RetryPolicy(retries=1, base_delay=0, max_delay=0)
+        attempts = []
+
+        async def down():
+            attempts.append(1)
+            raise ConnectionError("down")
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(policy.run(down, lambda e: True))
+        assert len(attempts) == 2
+
+    def test_permanent_errors_not_retried(self):
+        """Non-retryable errors fail on the first attempt"""
+        policy = RetryPolicy(retries=3, base_delay=0, max_delay=0)
+        attempts = []
+
+        async def bad_request():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            asyncio.run(policy.run(bad_request, lambda e: False))
+        assert len(attempts) == 1
+
+
+def upstream(handler, **settings):
+    pollinations = PollinationsClient(Settings(upstream_retry_base_delay=0, upstream_retry_max_delay=0, **settings))
+    pollinations.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pollinations
+
+
+class TestClientResilience:
+    """Test retries and circuit breaking in PollinationsClient"""
+
+    def test_transient_upstream_errors_retried(self):
+        """A 503 followed by success is retried transparently"""
+        statuses = iter([503, 200])
+        pollinations = upstream(lambda request: httpx.Response(next(statuses)))
+
+        result = asyncio.run(pollinations.generate_image("a retried cat"))
+        assert result["url"].startswith(pollinations.image_url)
+
+    def test_client_errors_not_retried(self):
+        """4xx answers are returned without retrying"""
+        calls = []
+        pollinations = upstream(lambda request: calls.append(request) or httpx.Response(400, text="bad prompt"))
+
+        with pytest.raises(Exception, match="400"):
+            asyncio.run(pollinations.generate_image("a rejected cat"))
+        assert len(calls) == 1
+        assert pollinations.breaker("image.pollinations.ai").state == CLOSED
+
+    def test_open_circuit_fails_fast(self):
+        """Once the host is known-bad, calls fail without reaching it"""
+        calls = []
+
+        def down(request):
+            calls.append(request)
+            raise httpx.ConnectTimeout("timed out")
+
+        pollinations = upstream(down, breaker_failure_threshold=3, upstream_retries=0)
+        for i in range(3):
+            with pytest.raises(Exception):
+                asyncio.run(pollinations.generate_image(f"a doomed cat {i}"))
+        assert len(calls) == 3
+
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(pollinations.generate_image("a short-circuited cat"))
+        assert len(calls) == 3
+        assert pollinations.breaker_stats()["image.pollinations.ai"]["state"] == OPEN
+        assert pollinations.service_status(pollinations.image_url) == "degraded"
+
+    def test_open_circuit_returns_503(self, open_access):
+        """Endpoints answer 503 with Retry-After while the circuit is open"""
+        pollinations = upstream(lambda request: httpx.Response(200))
+        breaker = pollinations.breaker("image.pollinations.ai")
+        breaker.failures = breaker.failure_threshold - 1
+        breaker.record_failure()
+
+        with patch('main.app.state.client', pollinations):
+            test_client = TestClient(app)
+            response = test_client.post("/api/generate/image", json={"prompt": "a blocked cat"})
+            health = test_client.get("/health").json()
+
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        assert health["services"]["image_generation"] == "degraded"
+        assert health["upstream_breakers"]["image.pollinations.ai"]["state"] == OPEN
+
+
+class TestAdaptiveLimiter:
+    """Test the AIMD upstream concurrency limiter"""
+
+    def test_additive_increase_on_healthy_latency(self):
+        """Healthy calls grow the limit by about one per window"""
+        limiter = AdaptiveLimiter("host", initial=4, max_limit=10)
+
+        async def run():
+            for _ in range(4):
+                await limiter.acquire()
+                limiter.release(0.1)
+
+        asyncio.run(run())
+        assert 4.8 < limiter.limit < 5.1
+
+    def test_multiplicative_decrease_on_drop(self):
+        """Timeouts and throttling halve the limit, once per round trip"""
+        limiter = AdaptiveLimiter("host", initial=8)
+
+        async def run():
+            for _ in range(3):
+                await limiter.acquire()
+            for _ in range(3):
+                limiter.release(0.1, dropped=True)
+
+        asyncio.run(run())
+        assert limiter.limit == 4
+        assert limiter.decreases == 1
+
+    def test_latency_spike_decreases(self):
+        """Latency far above the recent baseline counts as congestion"""
+        limiter = AdaptiveLimiter("host", initial=8, tolerance=2)
+
+        async def run():
+            for latency in (0.1, 0.1, 0.1, 1.0):
+                await limiter.acquire()
+                limiter.release(latency)
+
+        asyncio.run(run())
+        assert limiter.decreases == 1
+        assert limiter.limit < 8
+
+    def test_limit_bounds(self):
+        """The limit never leaves [min_limit, max_limit]"""
+        limiter = AdaptiveLimiter("host", initial=2, min_limit=1, max_limit=3)
+        limiter.in_flight = 100
+        for _ in range(100):
+            limiter.release(0.1)
+        assert limiter.limit == 3
+        with patch("resilience.time.monotonic", side_effect=range(0, 1000, 10)):
+            for _ in range(10):
+                limiter.in_flight += 1
+                limiter.release(0.1, dropped=True)
+        assert limiter.limit == 1
+
+    def test_waiters_served_in_fifo_order(self):
+        """Callers beyond the limit are admitted in arrival order"""
+        limiter = AdaptiveLimiter("host", initial=1, max_limit=1)
+        order = []
+
+        async def call(name):
+            await limiter.acquire()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            limiter.release()
+
+        async def run():
+            tasks = []
+            for name in "abcde":
+                tasks.append(asyncio.ensure_future(call(name)))
+                await asyncio.sleep(0)
+            assert limiter.stats()["queued"] == 4
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        assert order == list("abcde")
+
+    def test_cancelled_waiter_leaves_queue(self):
+        """A waiter cancelled in the queue does not hold a slot"""
+        limiter = AdaptiveLimiter("host", initial=1, max_limit=1)
+
+        async def run():
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            limiter.release()
+            return limiter.stats()
+
+        stats = asyncio.run(run())
+        assert stats["in_flight"] == 0
+        assert stats["queued"] == 0
+
+    def test_failures_give_no_latency_signal(self):
+        """Connect errors and 5xx answers neither grow the limit nor set the baseline"""
+        statuses = iter([500, 502, 504])
+
+        def handler(request):
+            status = next(statuses, None)
+            if status is None:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(status)
+
+        pollinations = upstream(handler, upstream_retries=0, breaker_failure_threshold=100)
+        for i in range(40):
+            with pytest.raises(Exception):
+                asyncio.run(pollinations.generate_image(f"an unreachable cat {i}"))
+        stats = pollinations.limiter_stats()["image.pollinations.ai"]
+        assert stats["limit"] == 10
+        assert stats["baseline_latency"] is None
+        assert stats["in_flight"] == 0
+
+    def test_client_throttling_shrinks_limit(self):
+        """429 answers from Pollinations reduce the host's limit"""
+        pollinations = upstream(lambda request: httpx.Response(429), upstream_retries=0, upstream_limit_initial=8)
+
+        with pytest.raises(Exception):
+            asyncio.run(pollinations.generate_image("a throttled cat"))
+        stats = pollinations.limiter_stats()["image.pollinations.ai"]
+        assert stats["limit"] == 4
+        assert stats["in_flight"] == 0
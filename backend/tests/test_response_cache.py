@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+import time
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+import main
+from cache import FRESH, InMemoryCache, TieredCache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def api(open_access):
+    """Client with open access and an empty response cache"""
+    main.app.state.response_cache.store.clear()
+    with patch.object(main.app.state.client, "cache", TieredCache(InMemoryCache())):
+        yield TestClient(main.app)
+
+
+class TestResponseCache:
+    """Test the full-response cache in front of the generation endpoints"""
+
+    def test_fresh_result_is_replayed_without_the_endpoint(self, api):
+        """Once the result cache answers fresh, the stored bytes are served directly"""
+        first = api.post("/api/generate/text", json={"prompt": "explain response caching"})
+        second = api.post("/api/generate/text", json={"prompt": "explain response caching"})
+        with patch.object(main.app.state.client, "generate_text", side_effect=AssertionError("endpoint ran")):
+            third = api.post("/api/generate/text", json={"prompt": "explain response caching"})
+
+        assert first.json()["cache"] == "miss"
+        assert second.json()["cache"] == FRESH
+        assert "x-response-cache" not in second.headers
+        assert third.status_code == 200
+        assert third.headers["x-response-cache"] == "hit"
+        assert third.content == second.content
+
+    def test_body_is_canonicalized(self, api):
+        """Key order and whitespace in the JSON body do not matter"""
+        api.post("/api/generate/text", json={"prompt": "explain canonical keys", "model": "openai"})
+        api.post("/api/generate/text", json={"model": "openai", "prompt": "explain canonical keys"})
+        hit = api.post(
+            "/api/generate/text",
+            content=b'{ "model": "openai",   "prompt": "explain canonical keys" }',
+            headers={"Content-Type": "application/json"},
+        )
+        assert hit.headers.get("x-response-cache") == "hit"
+
+    def test_credentials_scope_entries(self, api):
+        """A response stored for one API key is not replayed for another"""
+        for _ in range(2):
+            api.post("/api/generate/text", json={"prompt": "explain scoping"}, headers={"X-API-Key": "a"})
+        other = api.post("/api/generate/text", json={"prompt": "explain scoping"}, headers={"X-API-Key": "b"})
+        same = api.post("/api/generate/text", json={"prompt": "explain scoping"}, headers={"X-API-Key": "a"})
+        assert "x-response-cache" not in other.headers
+        assert same.headers.get("x-response-cache") == "hit"
+
+    def test_untracked_responses_are_not_stored(self, api):
+        """Responses not produced through the result cache are never stored"""
+        with patch.object(main.app.state.client, "generate_text", return_value={"text": "mocked"}):
+            responses = [api.post("/api/generate/text", json={"prompt": "mocked"}) for _ in range(3)]
+        assert all("x-response-cache" not in response.headers for response in responses)
+        assert len(main.app.state.response_cache.store) == 0
+
+    def test_rewriting_a_result_invalidates_responses(self, api):
+        """Storing a new result for a key drops the responses built from it"""
+        for _ in range(2):
+            api.post("/api/generate/text", json={"prompt": "explain invalidation"})
+        assert len(main.app.state.response_cache.store) == 1
+        before = main.app.state.response_cache.stats()["invalidations"]
+
+        # Text requests without a model use the text default, not the request's "flux"
+        key = main.app.state.client.cache_key("text", prompt="explain invalidation", model="openai")
+        asyncio.run(main.app.state.client._store("text", key, {"text": "new"}))
+
+        assert len(main.app.state.response_cache.store) == 0
+        assert main.app.state.response_cache.stats()["invalidations"] == before + 1
+
+
+class TestResponseCacheExpiry:
+    """Test that stored responses never outlive the result they came from"""
+
+    def test_expires_with_result_freshness(self):
+        responses = ResponseCache(["/x"])
+        responses.put("k", {"key": "r", "state": FRESH, "fresh_until": time.time() + 60}, {"body": b"{}"})
+        assert responses.get("k") is not None
+        with patch("cache.time.time", return_value=time.time() + 61):
+            assert responses.get("k") is None
+
+    def test_only_fresh_results_are_stored(self):
+        responses = ResponseCache(["/x"])
+        responses.put("stale", {"key": "r", "state": "stale", "fresh_until": time.time() - 1}, {"body": b"{}"})
+        responses.put("miss", {"key": "r", "state": "miss", "fresh_until": None}, {"body": b"{}"})
+        assert len(responses.store) == 0
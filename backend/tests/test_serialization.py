@@ -0,0 +1,81 @@
+import json
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+from unittest.mock import patch
+
+import main
+from serialization import ORJSONResponse, wants_msgpack
+
+IMAGE = {"url": "https://image.pollinations.ai/prompt/cat", "metadata": {"model": "flux", "seed": None}, "cache": "miss"}
+TEXT = {"text": "Über cats", "source": "enhanced_template", "metadata": {"word_count": 2}}
+
+
+@pytest.fixture
+def api(open_access):
+    """Client with open access"""
+    return TestClient(main.app)
+
+
+class TestEncoding:
+    """Test the response encoders"""
+
+    def test_orjson_matches_stdlib_bytes(self):
+        payload = {"results": [{"status": "success", "result": TEXT}, {"status": "error", "error": "boom"}]}
+        assert ORJSONResponse(payload).body == JSONResponse(payload).body
+
+    @pytest.mark.parametrize("accept,expected", [
+        ("application/msgpack", True),
+        ("application/x-msgpack", True),
+        ("application/msgpack, application/json;q=0.5", True),
+        ("application/json, application/msgpack;q=0.5", False),
+        ("application/msgpack;q=0", False),
+        ("*/*", False),
+        ("", False),
+    ])
+    def test_accept_negotiation(self, accept, expected):
+        assert wants_msgpack(accept) is expected
+
+
+class TestTypedResponses:
+    """Test response models and msgpack negotiation on the endpoints"""
+
+    def test_unset_fields_are_left_out(self, api):
+        with patch.object(main.app.state.client, "generate_image", return_value=IMAGE):
+            response = api.post("/api/generate/image", json={"prompt": "a cat"})
+        assert response.status_code == 200
+        assert response.json() == IMAGE
+
+    def test_batch_json_by_default(self, api):
+        with patch.object(main.app.state.client, "generate_text", return_value=TEXT):
+            response = api.post("/api/batch", json={"requests": [{"type": "text", "prompt": "cats"}]})
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {"results": [{"status": "success", "result": TEXT}]}
+
+    def test_batch_msgpack(self, api):
+        requests = [{"type": "text", "prompt": "cats"}, {"type": "video", "prompt": "cats"}]
+        with patch.object(main.app.state.client, "generate_text", return_value=TEXT):
+            as_json = api.post("/api/batch", json={"requests": requests})
+            packed = api.post("/api/batch", json={"requests": requests}, headers={"Accept": "application/msgpack"})
+        assert packed.status_code == 200
+        assert packed.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(packed.content) == as_json.json()
+        assert len(packed.content) < len(as_json.content)
+
+    def test_batch_stream_msgpack(self, api):
+        requests = [{"type": "text", "prompt": f"cats {i}"} for i in range(3)]
+        with patch.object(main.app.state.client, "generate_text", return_value=TEXT):
+            response = api.post("/api/batch/stream", json={"requests": requests}, headers={"Accept": "application/msgpack"})
+        assert response.headers["content-type"] == "application/msgpack"
+        unpacker = msgpack.Unpacker()
+        unpacker.feed(response.content)
+        items = list(unpacker)
+        assert sorted(item["index"] for item in items) == [0, 1, 2]
+        assert all(item["result"] == TEXT for item in items)
+
+    def test_batch_stream_ndjson_unchanged(self, api):
+        with patch.object(main.app.state.client, "generate_text", return_value=TEXT):
+            response = api.post("/api/batch/stream", json={"requests": [{"type": "text", "prompt": "cats"}]})
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [json.loads(line) for line in response.text.splitlines()] == [{"index": 0, "status": "success", "result": TEXT}]
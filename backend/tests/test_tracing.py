@@ -0,0 +1,139 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import tracing
+from main import create_app
+from settings import Settings
+from tracing import Trace, span
+
+
+def timings(header):
+    """Server-Timing header as {name: duration in ms}"""
+    parsed = {}
+    for part in header.split(", "):
+        name, duration = part.split(";dur=")
+        parsed[name] = float(duration)
+    return parsed
+
+
+@pytest.fixture
+def api(open_access):
+    """Client with open access"""
+    return TestClient(main.app)
+
+
+class TestSpans:
+    """Test span recording"""
+
+    def test_no_op_outside_a_request(self):
+        with span("cache") as recorded:
+            pass
+        assert recorded._trace is None
+
+    def test_nesting_and_child_tasks(self):
+        async def scenario():
+            trace = Trace()
+            token = tracing._trace.set(trace)
+            try:
+                with span("batch"):
+                    async def item(i):
+                        with span("cache", index=i):
+                            await asyncio.sleep(0)
+                    await asyncio.gather(item(0), item(1))
+            finally:
+                tracing._trace.reset(token)
+            return trace
+
+        trace = asyncio.run(scenario())
+        by_name = {}
+        for span_id, parent, name, _, _, attributes in trace.spans:
+            by_name.setdefault(name, []).append((span_id, parent, attributes))
+        (batch_id, batch_parent, _), = by_name["batch"]
+        assert batch_parent is None
+        assert [parent for _, parent, _ in by_name["cache"]] == [batch_id, batch_id]
+        assert timings(trace.server_timing(0.01)).keys() == {"batch", "cache", "total"}
+
+
+class TestServerTiming:
+    """Test the Server-Timing header on generation endpoints"""
+
+    def test_text_phases(self, api):
+        response = api.post("/api/generate/text", json={"prompt": "explain server timing"})
+        assert response.status_code == 200
+        phases = timings(response.headers["server-timing"])
+        assert {"cache", "template", "serialize", "total"} <= phases.keys()
+        assert phases["total"] >= phases["template"]
+
+    def test_auth_phase(self):
+        app = create_app(Settings(backend_api_key="secret"))
+        client = TestClient(app)
+        with patch.object(app.state.limiter, "enabled", False):
+            response = client.post(
+                "/api/generate/text", json={"prompt": "explain auth spans"}, headers={"Authorization": "Bearer secret"}
+            )
+        assert response.status_code == 200
+        assert "auth" in timings(response.headers["server-timing"])
+
+    def test_batch_phases(self, api):
+        requests = [{"type": "text", "prompt": f"explain batch spans {i}"} for i in range(2)]
+        response = api.post("/api/batch", json={"requests": requests})
+        assert response.status_code == 200
+        assert {"prefetch", "batch", "cache", "template"} <= timings(response.headers["server-timing"]).keys()
+
+
+class TestExport:
+    """Test writing span records"""
+
+    def test_jsonl_records(self, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        app = create_app(Settings(trace_export_path=str(path)))
+        exporter = app.state.span_exporter
+        # Shutdown flushes the exporter
+        with TestClient(app) as client:
+            client.post("/api/generate/text", json={"prompt": "explain span export"})
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        root, = [record for record in records if record["parent_span_id"] is None]
+        assert root["name"] == "/api/generate/text"
+        assert {record["trace_id"] for record in records} == {root["trace_id"]}
+        assert {"cache", "template"} <= {record["name"] for record in records}
+        assert all(record["end_time_unix_nano"] >= record["start_time_unix_nano"] for record in records)
+        assert exporter.exported == 1
+
+
+class TestProfiling:
+    """Test the admin-gated profiling hook"""
+
+    def test_ignored_without_admin_key(self, api):
+        response = api.get("/health", headers={"X-Profile": "1", "X-Admin-Key": "guess"})
+        assert "x-profile-id" not in response.headers
+        assert "x-profile-error" not in response.headers
+
+    def test_profile_stored_for_admin(self):
+        class FakeProfiler:
+            def start(self):
+                pass
+
+            def stop(self):
+                pass
+
+            def output_html(self):
+                return "<html>profile</html>"
+
+        client = TestClient(create_app(Settings(admin_api_key="root")))
+        with patch.object(tracing, "_profiler", FakeProfiler):
+            wrong = client.get("/health", headers={"X-Profile": "1", "X-Admin-Key": "guess"})
+            response = client.get("/health", headers={"X-Profile": "1", "X-Admin-Key": "root"})
+        assert "x-profile-id" not in wrong.headers
+        profile_id = response.headers["x-profile-id"]
+
+        assert client.get(f"/api/admin/profiles/{profile_id}").status_code == 403
+        stored = client.get(f"/api/admin/profiles/{profile_id}", headers={"X-Admin-Key": "root"})
+        assert stored.status_code == 200
+        assert stored.text == "<html>profile</html>"
+        assert client.get("/api/admin/profiles/missing", headers={"X-Admin-Key": "root"}).status_code == 404
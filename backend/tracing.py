@@ -0,0 +1,240 @@
+from contextvars import ContextVar
+from random import getrandbits
+from typing import Any, Dict, List, Optional
+import hmac
+import json
+import queue
+import secrets
+import threading
+import time
+
+from settings import Settings
+
+# The trace of the request being handled; None outside a traced request,
+# which makes every span a no-op
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[Optional[str]] = ContextVar("trace_parent", default=None)
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+
+    __slots__ = ("trace_id", "started", "wall_started", "spans")
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        # (span_id, parent_id, name, start offset, duration, attributes)
+        self.spans: List[tuple] = []
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value: summed duration per span name, plus total"""
+        durations: Dict[str, float] = {}
+        for _, _, name, _, duration, _ in self.spans:
+            durations[name] = durations.get(name, 0.0) + duration
+        parts = [f"{name};dur={duration * 1000:.2f}" for name, duration in durations.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class span:
+    """
+    Time a phase of the current request: ``with span("cache"): ...``.
+    Spans nest, and concurrent child tasks record into the same trace.
+    """
+
+    __slots__ = ("name", "attributes", "_trace", "_started", "_span_id", "_token")
+
+    def __init__(self, name: str, **attributes: Any):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._trace = _trace.get()
+        if self._trace is not None:
+            # Span ids only need to be unique within a trace; urandom is too slow here
+            self._span_id = f"{getrandbits(64):016x}"
+            self._token = _parent.set(self._span_id)
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        trace = self._trace
+        if trace is not None:
+            ended = time.perf_counter()
+            try:
+                _parent.reset(self._token)
+            except ValueError:
+                # Closed from another context, e.g. a stream the client
+                # abandoned being finalized by the event loop
+                pass
+            trace.spans.append((
+                self._span_id, _parent.get(), self.name,
+                self._started - trace.started, ended - self._started, self.attributes,
+            ))
+        return False
+
+
+class JsonlSpanExporter:
+    """
+    Writes finished traces as OpenTelemetry-style span records, one JSON
+    object per line, from a background thread so request handling never
+    waits on the file. The thread starts with the first trace (or
+    ``start()``) and ``close()`` flushes and stops it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exported = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=10_000)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def export(self, trace: Trace, route: Optional[str], total: float) -> None:
+        if self._thread is None:
+            self.start()
+        base = int(trace.wall_started * 1e9)
+        root_id = secrets.token_hex(8)
+        records = [{
+            "trace_id": trace.trace_id,
+            "span_id": root_id,
+            "parent_span_id": None,
+            "name": route or "request",
+            "start_time_unix_nano": base,
+            "end_time_unix_nano": base + int(total * 1e9),
+            "attributes": {},
+        }]
+        for span_id, parent_id, name, offset, duration, attributes in trace.spans:
+            start = base + int(offset * 1e9)
+            records.append({
+                "trace_id": trace.trace_id,
+                "span_id": span_id,
+                "parent_span_id": parent_id or root_id,
+                "name": name,
+                "start_time_unix_nano": start,
+                "end_time_unix_nano": start + int(duration * 1e9),
+                "attributes": attributes,
+            })
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as output:
+            while True:
+                records = self._queue.get()
+                if records is None:
+                    return
+                output.write("".join(json.dumps(record) + "\n" for record in records))
+                output.flush()
+                self.exported += 1
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def create_span_exporter(settings: Optional[Settings] = None) -> Optional[JsonlSpanExporter]:
+    """Span exporter from TRACE_EXPORT_PATH, or None (the default) to only send Server-Timing"""
+    path = (settings or Settings()).trace_export_path
+    return JsonlSpanExporter(path) if path else None
+
+
+class Profiles:
+    """Rendered request profiles for the admin, keeping the most recent"""
+
+    def __init__(self, max_profiles: int = 20):
+        self.max_profiles = max_profiles
+        self._profiles: Dict[str, str] = {}
+
+    def add(self, profile_id: str, html: str) -> None:
+        self._profiles[profile_id] = html
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.pop(next(iter(self._profiles)))
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._profiles.get(profile_id)
+
+
+def _profiler():
+    """A pyinstrument profiler, or None when the optional package is missing"""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler(interval=0.001, async_mode="enabled")
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware tracing each HTTP request: spans recorded with
+    ``span()`` are reported in a Server-Timing header and, when an exporter
+    is configured, written out as span records.
+
+    A request carrying ``X-Profile: 1`` and the admin key (``X-Admin-Key``)
+    is also run under pyinstrument; the response names the stored profile
+    in ``X-Profile-Id``. Profiling is off unless an admin key is configured.
+    """
+
+    def __init__(self, app, exporter: Optional[JsonlSpanExporter] = None,
+                 admin_key: Optional[str] = None, profiles: Optional[Profiles] = None):
+        self.app = app
+        self.exporter = exporter
+        self.admin_key = admin_key
+        self.profiles = profiles if profiles is not None else Profiles()
+
+    def _wants_profile(self, scope) -> bool:
+        if not self.admin_key:
+            return False
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") != b"1":
+            return False
+        return hmac.compare_digest(headers.get(b"x-admin-key", b""), self.admin_key.encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _trace.set(trace)
+        profiler = profile_id = None
+        extra_headers = []
+        if self._wants_profile(scope):
+            profiler = _profiler()
+            if profiler is None:
+                extra_headers.append((b"x-profile-error", b"pyinstrument is not installed"))
+            else:
+                profile_id = secrets.token_hex(8)
+                extra_headers.append((b"x-profile-id", profile_id.encode()))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing(time.perf_counter() - trace.started).encode()))
+                headers.extend(extra_headers)
+                message = {**message, "headers": headers}
+            await send(message)
+
+        if profiler is not None:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if profiler is not None:
+                profiler.stop()
+                self.profiles.add(profile_id, profiler.output_html())
+            if self.exporter is not None:
+                route = getattr(scope.get("route"), "path", None)
+                self.exporter.export(trace, route, total)